@@ -0,0 +1,115 @@
+from collections import OrderedDict
+import threading
+import logging
+import time
+import os
+import re
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Off by default: similar embeddings do not guarantee the same question
+ANSWER_CACHE = os.getenv("ANSWER_CACHE", "false").lower() == "true"
+# Cosine similarity between query embeddings above which a stored answer is reused
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+ANSWER_CACHE_SIZE = int(os.getenv("ANSWER_CACHE_SIZE", "256"))
+ANSWER_CACHE_TTL_SECONDS = int(os.getenv("ANSWER_CACHE_TTL_SECONDS", "3600"))
+# Years, quarters, halves, fiscal years, percentages and other figures must match exactly
+PERIOD_TOKEN_PATTERN = re.compile(
+    r"\bfy\s*'?\d{2,4}\b|\b[qh][1-4]\b|\b(?:first|second|third|fourth)\s+(?:quarter|half)\b|\b\d+(?:[.,]\d+)*\s*%?",
+    re.IGNORECASE)
+
+def period_tokens(question):
+    """The numeric and period terms of a question, "net profit 2022" and "net profit 2023" never share an answer."""
+    return frozenset(re.sub(r"[\s']", "", token.lower()) for token in PERIOD_TOKEN_PATTERN.findall(question))
+
+class SemanticAnswerCache:
+    """Per-collection answers looked up by query embedding similarity.
+
+    Each collection keeps at most `max_entries` answers in LRU order. A
+    lookup compares the query vector with every live entry of the
+    collection naming the same figures and periods, the best match at or
+    above `threshold` is a hit.
+    """
+
+    def __init__(self, threshold=ANSWER_CACHE_THRESHOLD, max_entries=ANSWER_CACHE_SIZE, ttl_seconds=ANSWER_CACHE_TTL_SECONDS, enabled=ANSWER_CACHE):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = enabled
+        self._collections = {}
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_llm_calls = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def get(self, collection_name, query_vector, question):
+        """Return the closest cached entry with its `similarity`, or None."""
+        if not self.enabled:
+            return None
+        with self._lock:
+            entries = self._collections.get(collection_name)
+            if entries:
+                now = time.monotonic()
+                for key in [key for key, entry in entries.items() if now - entry["created_at"] > self.ttl_seconds]:
+                    del entries[key]
+            periods = period_tokens(question)
+            keys = [key for key, entry in (entries or {}).items() if entry["periods"] == periods]
+            if not keys:
+                self.misses += 1
+                return None
+            similarities = np.stack([entries[key]["vector"] for key in keys]) @ self._normalize(query_vector)
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            entry = entries[keys[best]]
+            entries.move_to_end(keys[best])
+            self.hits += 1
+            self.saved_llm_calls += entry["llm_calls"]
+            return {**entry, "similarity": float(similarities[best])}
+
+    def put(self, collection_name, query_vector, question, answer, llm_calls):
+        if not self.enabled:
+            return
+        with self._lock:
+            entries = self._collections.setdefault(collection_name, OrderedDict())
+            entries[self._next_key] = {
+                "vector": self._normalize(query_vector),
+                "question": question,
+                "periods": period_tokens(question),
+                "answer": answer,
+                "llm_calls": llm_calls,
+                "created_at": time.monotonic(),
+            }
+            self._next_key += 1
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+
+    def invalidate(self, collection_name):
+        """Drop every answer of a collection, called when it is re-ingested or deleted."""
+        with self._lock:
+            self._collections.pop(collection_name, None)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": sum(len(entries) for entries in self._collections.values()),
+                "collections": len(self._collections),
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "saved_llm_calls": self.saved_llm_calls,
+            }
+
+answer_cache = SemanticAnswerCache()
@@ -0,0 +1,137 @@
+import threading
+import math
+import re
+import os
+
+CONTEXT_PACKING = os.getenv("CONTEXT_PACKING", "true").lower() == "true"
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1200"))
+# Rough chars-per-token ratio of English prose, no tokenizer of the chat model is available offline
+CHARS_PER_TOKEN = 4
+CHUNK_SEPARATOR = " \n\n "
+GAP_MARKER = " ... "
+# Shorter suffix/prefix matches between consecutive chunks are treated as chance repeats, not the splitter's overlap
+MIN_OVERLAP_TOKENS = int(os.getenv("CONTEXT_MIN_OVERLAP_TOKENS", "5"))
+
+HEADER_PATTERN = re.compile(r'^DOCUMENT-CONTEXT:\[.*?\]\. DOCUMENT-CONTENT: ?', re.DOTALL)
+CHUNK_ID_PATTERN = re.compile(r'^p(\d+)-c(\d+)$')
+
+def estimate_tokens(text):
+    return math.ceil(len(text) / CHARS_PER_TOKEN) if text else 0
+
+def strip_header(content):
+    """Drop the DOCUMENT-CONTEXT header, its words are the first tokens of the content itself."""
+    return HEADER_PATTERN.sub("", content, count=1)
+
+def chunk_position(doc):
+    """Return (page number, chunk index) of a retrieved chunk, either may be None."""
+    match = CHUNK_ID_PATTERN.match(getattr(doc, "id", None) or "")
+    page = (doc.metadata or {}).get("page_number")
+    if match:
+        return page if page is not None else int(match.group(1)), int(match.group(2))
+    return page, None
+
+def overlap_length(left, right):
+    """Longest suffix of `left` that is also a prefix of `right`, in tokens."""
+    for size in range(min(len(left), len(right)), 0, -1):
+        if left[-size:] == right[:size]:
+            return size
+    return 0
+
+def render_group(chunks, min_overlap=MIN_OVERLAP_TOKENS):
+    """Join the chunks of one page in document order, merging the splitter's overlap between neighbours.
+
+    Only consecutive chunk indices are joined, and their shared tokens are
+    dropped once the overlap is at least `min_overlap` tokens long. Other
+    chunks of the page are kept apart by the gap marker.
+    """
+    chunks = sorted(chunks, key=lambda chunk: chunk["order"])
+    tokens = list(chunks[0]["tokens"])
+    parts = []
+    merged = 0
+    for previous, chunk in zip(chunks, chunks[1:]):
+        adjacent = chunk["index"] is not None and previous["index"] is not None and chunk["index"] == previous["index"] + 1
+        if adjacent:
+            overlap = overlap_length(previous["tokens"], chunk["tokens"])
+            merged += 1
+            tokens.extend(chunk["tokens"][overlap if overlap >= min_overlap else 0:])
+        else:
+            parts.append(" ".join(tokens))
+            tokens = list(chunk["tokens"])
+    parts.append(" ".join(tokens))
+    return GAP_MARKER.join(parts), merged
+
+class ContextPacker:
+    """Fill a token budget with reranked chunks, most relevant first.
+
+    Chunks of the same page are grouped so consecutive ones are joined with
+    their shared overlap sent once, DOCUMENT-CONTEXT headers are dropped, and a chunk that would
+    push the context over `token_budget` is skipped in favour of later,
+    smaller ones. The best chunk is always kept.
+    """
+
+    def __init__(self, token_budget=CONTEXT_TOKEN_BUDGET, enabled=CONTEXT_PACKING):
+        self.token_budget = token_budget
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.tokens_before = 0
+        self.tokens_after = 0
+        self.chunks_merged = 0
+        self.chunks_dropped = 0
+
+    @staticmethod
+    def _render(groups):
+        rendered = [render_group(group["chunks"]) for group in groups]
+        return CHUNK_SEPARATOR.join(text for text, _ in rendered), sum(merged for _, merged in rendered)
+
+    def pack(self, docs):
+        """Return (context, stats) for documents in rank order."""
+        unpacked = CHUNK_SEPARATOR.join(doc.page_content for doc in docs)
+        if not self.enabled or not docs:
+            return unpacked, {"context_tokens_before": estimate_tokens(unpacked), "context_tokens_after": estimate_tokens(unpacked)}
+
+        groups = []
+        context, merged, dropped = "", 0, 0
+        for rank, doc in enumerate(docs):
+            page, index = chunk_position(doc)
+            chunk = {"index": index, "order": index if index is not None else rank, "tokens": strip_header(doc.page_content).split()}
+            group = next((group for group in groups if page is not None and group["page"] == page), None)
+            candidate = [dict(g, chunks=list(g["chunks"])) for g in groups]
+            if group is None:
+                candidate.append({"page": page, "chunks": [chunk]})
+            else:
+                candidate[groups.index(group)]["chunks"].append(chunk)
+            candidate_context, candidate_merged = self._render(candidate)
+            if groups and estimate_tokens(candidate_context) > self.token_budget:
+                dropped += 1
+                continue
+            groups, context, merged = candidate, candidate_context, candidate_merged
+
+        stats = {
+            "context_tokens_before": estimate_tokens(unpacked),
+            "context_tokens_after": estimate_tokens(context),
+            "context_chunks_merged": merged,
+            "context_chunks_dropped": dropped,
+        }
+        with self._lock:
+            self.requests += 1
+            self.tokens_before += stats["context_tokens_before"]
+            self.tokens_after += stats["context_tokens_after"]
+            self.chunks_merged += merged
+            self.chunks_dropped += dropped
+        return context, stats
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "token_budget": self.token_budget,
+                "requests": self.requests,
+                "tokens_before": self.tokens_before,
+                "tokens_after": self.tokens_after,
+                "tokens_saved_ratio": round(1 - self.tokens_after / self.tokens_before, 4) if self.tokens_before else None,
+                "chunks_merged": self.chunks_merged,
+                "chunks_dropped": self.chunks_dropped,
+            }
+
+context_packer = ContextPacker()
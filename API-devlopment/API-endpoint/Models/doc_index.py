@@ -0,0 +1,119 @@
+import threading
+import hashlib
+import logging
+import json
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+CHROMA_DB_PATH = os.path.join(os.path.dirname(__file__), "../chroma-db")
+INDEX_PATH = os.path.join(CHROMA_DB_PATH, "ingest_index.json")
+
+_lock = threading.Lock()
+dedup_stats = {"hits": 0, "misses": 0}
+
+# In-memory copy of the index file, read once and replaced on every save.
+# Chat requests resolve documents on every turn, so they never touch the file.
+_index = None
+_documents = []
+_by_document_id = {}
+
+def file_sha256(file_path, block_size=1024 * 1024):
+    """Fingerprint file contents without loading the whole file into memory."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _read_index_file():
+    if not os.path.exists(INDEX_PATH):
+        return {}
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        logger.error(f"Error reading ingest index, starting empty: {str(e)}")
+        return {}
+
+def _set_index(index):
+    global _index, _documents, _by_document_id
+    _index = index
+    _documents = sorted(index.items(), key=lambda entry: entry[1].get("ingested_at", 0), reverse=True)
+    _by_document_id = {document_id_for(record["collection_name"]): (file_hash, record) for file_hash, record in index.items()}
+
+def _load_index():
+    """The current index, callers hold `_lock` and copy it before changing it."""
+    if _index is None:
+        _set_index(_read_index_file())
+    return _index
+
+def _save_index(index):
+    os.makedirs(CHROMA_DB_PATH, exist_ok=True)
+    tmp_path = INDEX_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp_path, INDEX_PATH)
+    _set_index(index)
+
+def report_collection_name(file_name):
+    """Collection an uploaded report is ingested into."""
+    return f"report_{file_name}"
+
+def document_id_for(collection_name):
+    """Stable public id of a collection, unchanged when its contents are updated."""
+    return hashlib.sha256(collection_name.encode("utf-8")).hexdigest()[:16]
+
+def list_documents():
+    """Return (file_hash, record) for every ingested document, most recently ingested first."""
+    with _lock:
+        _load_index()
+        return list(_documents)
+
+def lookup_document_id(document_id):
+    """Return (file_hash, record) for a document id, if it is still ingested."""
+    with _lock:
+        _load_index()
+        return _by_document_id.get(document_id)
+
+def lookup_document(file_hash):
+    """Return the stored ingestion record for these file contents, if any."""
+    with _lock:
+        return _load_index().get(file_hash)
+
+def lookup_collection(collection_name):
+    """Return (file_hash, record) for the contents currently stored in a collection, if any."""
+    with _lock:
+        for file_hash, record in _load_index().items():
+            if record["collection_name"] == collection_name:
+                return file_hash, record
+    return None
+
+def record_document(file_hash, collection_name, file_name, chunk_count, pages=None, backend="chroma"):
+    """Store an ingestion record; `pages` maps page number to its fingerprint and chunk ids."""
+    with _lock:
+        index = dict(_load_index())
+        # The collection was rebuilt, so older contents stored under it are gone
+        for stale_hash in [key for key, record in index.items() if record["collection_name"] == collection_name]:
+            del index[stale_hash]
+        index[file_hash] = {
+            "collection_name": collection_name,
+            "file_name": file_name,
+            "chunk_count": chunk_count,
+            "pages": pages,
+            "backend": backend,
+            "ingested_at": time.time(),
+        }
+        _save_index(index)
+
+def forget_document(file_hash):
+    with _lock:
+        index = dict(_load_index())
+        if index.pop(file_hash, None) is not None:
+            _save_index(index)
+
+def record_dedup_result(hit):
+    with _lock:
+        dedup_stats["hits" if hit else "misses"] += 1
+        return dict(dedup_stats)
@@ -0,0 +1,129 @@
+from collections import OrderedDict
+import threading
+import logging
+import os
+
+from Models.doc_index import document_id_for, list_documents, lookup_document_id, forget_document
+from Models.lexical_index import delete_index
+from Models.summary_context import delete_summary
+from Models.vector_backend import open_vector_store
+
+logger = logging.getLogger(__name__)
+
+DOCUMENT_HANDLE_CACHE_SIZE = int(os.getenv("DOCUMENT_HANDLE_CACHE_SIZE", "16"))
+
+def describe_document(record):
+    return {
+        "document_id": document_id_for(record["collection_name"]),
+        "file_name": record["file_name"],
+        "collection_name": record["collection_name"],
+        "chunk_count": record["chunk_count"],
+        "backend": record.get("backend", "chroma"),
+        "ingested_at": record.get("ingested_at"),
+    }
+
+class DocumentRegistry:
+    """Every ingested report addressable by id, with a bounded LRU of open vector stores.
+
+    The ingest index is the source of truth, so documents ingested before a
+    restart stay queryable. Handles are opened lazily from the persisted
+    collection and the least recently used one is dropped once
+    `max_open` are held. `on_evict(vector_store)` is called for every
+    dropped handle so caches built on it can let go of it too.
+    """
+
+    def __init__(self, embedding_model, max_open=DOCUMENT_HANDLE_CACHE_SIZE, on_evict=None):
+        self.embedding_model = embedding_model
+        self.max_open = max_open
+        self.on_evict = on_evict
+        self.default_document_id = None
+        self._handles = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.opens = 0
+        self.evictions = 0
+
+    def list(self):
+        return [describe_document(record) for _, record in list_documents()]
+
+    def resolve(self, document_id=None):
+        """Return the document's description, defaulting to the last ingested one, or None."""
+        document_id = document_id or self.default_document_id
+        if document_id is None:
+            documents = list_documents()
+            return describe_document(documents[0][1]) if documents else None
+        found = lookup_document_id(document_id)
+        return describe_document(found[1]) if found else None
+
+    def _remember(self, document_id, vector_store):
+        """Store a handle and return the handles evicted to make room, called with the lock held."""
+        self._handles[document_id] = vector_store
+        self._handles.move_to_end(document_id)
+        evicted = []
+        while len(self._handles) > self.max_open:
+            evicted_id, evicted_store = self._handles.popitem(last=False)
+            evicted.append(evicted_store)
+            self.evictions += 1
+            logger.info(f"Closed vector store handle for document {evicted_id}")
+        return evicted
+
+    def _release(self, evicted):
+        if self.on_evict:
+            for vector_store in evicted:
+                self.on_evict(vector_store)
+
+    def open(self, document):
+        """Return an open vector store for a description returned by `resolve`."""
+        document_id = document["document_id"]
+        with self._lock:
+            vector_store = self._handles.get(document_id)
+            if vector_store is not None:
+                self._handles.move_to_end(document_id)
+                self.hits += 1
+                return vector_store
+        # Opening a persisted collection can touch disk, keep it outside the lock
+        vector_store = open_vector_store(document["collection_name"], self.embedding_model, backend=document["backend"])
+        with self._lock:
+            self.opens += 1
+            evicted = self._remember(document_id, vector_store)
+        self._release(evicted)
+        return vector_store
+
+    def register(self, collection_name, vector_store):
+        """Keep the handle of a freshly ingested collection and make it the default document."""
+        document_id = document_id_for(collection_name)
+        with self._lock:
+            evicted = self._remember(document_id, vector_store)
+            self.default_document_id = document_id
+        self._release(evicted)
+        return document_id
+
+    def remove(self, document_id):
+        """Delete a document's collection, lexical and summary indexes and ingest record, returning its description."""
+        found = lookup_document_id(document_id)
+        if found is None:
+            return None
+        file_hash, record = found
+        document = describe_document(record)
+        with self._lock:
+            vector_store = self._handles.pop(document_id, None)
+            if self.default_document_id == document_id:
+                self.default_document_id = None
+        if vector_store is None:
+            vector_store = open_vector_store(record["collection_name"], self.embedding_model, backend=document["backend"])
+        vector_store.delete_collection()
+        delete_index(record["collection_name"])
+        delete_summary(record["collection_name"])
+        forget_document(file_hash)
+        logger.info(f"Removed document {document_id} ({record['file_name']})")
+        return document
+
+    def stats(self):
+        with self._lock:
+            return {
+                "open_handles": len(self._handles),
+                "max_open": self.max_open,
+                "hits": self.hits,
+                "opens": self.opens,
+                "evictions": self.evictions,
+            }
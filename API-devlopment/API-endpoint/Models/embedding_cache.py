@@ -0,0 +1,228 @@
+from collections import OrderedDict
+import threading
+import hashlib
+import logging
+import json
+import time
+import os
+import re
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(os.path.dirname(__file__), "../embedding-cache"))
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", "100000"))
+INDEX_SAVE_INTERVAL_SECONDS = 5
+KEY_BYTES = hashlib.sha256().digest_size
+
+def normalize_text(text):
+    return " ".join(text.split())
+
+class CachedEmbeddings(Embeddings):
+    """Embedding model wrapper that keeps vectors in an on-disk LRU cache.
+
+    Vectors live in a memory-mapped float32 matrix with one row per cached
+    text, and a JSON index maps `sha256(model name + normalized text)` to its
+    row. When the matrix is full the least recently used row is reused. The
+    key digest of every row is stored alongside it and checked on read, so an
+    index saved before a row was reused never returns another text's vector.
+    The index is written to disk by a background thread.
+    """
+
+    def __init__(self, embedding_model, model_name, cache_dir=EMBEDDING_CACHE_DIR, max_entries=EMBEDDING_CACHE_SIZE):
+        self.embedding_model = embedding_model
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.cache_dir = os.path.join(cache_dir, re.sub(r'[^A-Za-z0-9._-]', '_', model_name))
+        self.vectors_path = os.path.join(self.cache_dir, "vectors.f32")
+        self.index_path = os.path.join(self.cache_dir, "index.json")
+        self.keys_path = os.path.join(self.cache_dir, "keys.bin")
+
+        self._lock = threading.Lock()
+        self._index = OrderedDict()
+        self._free_slots = []
+        self._next_slot = 0
+        self._vectors = None
+        self._row_keys = None
+        self._dim = None
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._saving = False
+        self._save_lock = threading.Lock()
+        self._snapshot_seq = 0
+        self._written_seq = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.stale_rows = 0
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._load()
+
+    def _key(self, kind, text):
+        return hashlib.sha256(f"{self.model_name}\n{kind}\n{normalize_text(text)}".encode("utf-8")).hexdigest()
+
+    def _open_vectors(self, dim, mode):
+        self._dim = dim
+        self._vectors = np.memmap(self.vectors_path, dtype=np.float32, mode=mode, shape=(self.max_entries, dim))
+        self._row_keys = np.memmap(self.keys_path, dtype=np.uint8, mode=mode, shape=(self.max_entries, KEY_BYTES))
+
+    def _load(self):
+        if not all(os.path.exists(path) for path in (self.index_path, self.vectors_path, self.keys_path)):
+            if os.path.exists(self.index_path):
+                logger.warning("Embedding cache has no row keys, starting with an empty cache")
+            return
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved["max_entries"] != self.max_entries:
+                logger.warning("Embedding cache size changed, starting with an empty cache")
+                return
+
+            self._open_vectors(saved["dim"], mode="r+")
+            self._index = OrderedDict((key, slot) for key, slot in saved["entries"])
+            used = set(self._index.values())
+            self._next_slot = max(used) + 1 if used else 0
+            self._free_slots = [slot for slot in range(self._next_slot) if slot not in used]
+            logger.info(f"Loaded embedding cache with {len(self._index)} vectors from {self.cache_dir}")
+        except Exception as e:
+            logger.error(f"Error loading embedding cache, starting empty: {str(e)}")
+            self._index = OrderedDict()
+            self._vectors = None
+            self._row_keys = None
+            self._dim = None
+
+    def _allocate_slot(self):
+        if self._free_slots:
+            return self._free_slots.pop()
+        if self._next_slot < self.max_entries:
+            self._next_slot += 1
+            return self._next_slot - 1
+        _, slot = self._index.popitem(last=False)
+        self.evictions += 1
+        return slot
+
+    def _store(self, key, vector):
+        if self._vectors is None:
+            self._open_vectors(len(vector), mode="w+")
+        slot = self._index.get(key)
+        if slot is None:
+            slot = self._allocate_slot()
+            self._index[key] = slot
+        self._index.move_to_end(key)
+        # Clear the row key first so a half-written row never matches either text
+        self._row_keys[slot] = 0
+        self._vectors[slot] = vector
+        self._row_keys[slot] = np.frombuffer(bytes.fromhex(key), dtype=np.uint8)
+        self._dirty = True
+
+    def _read(self, key):
+        """Return the cached vector of `key`, or None when it is missing or its row now belongs to another text."""
+        slot = self._index.get(key)
+        if slot is None:
+            return None
+        if self._row_keys[slot].tobytes() != bytes.fromhex(key):
+            del self._index[key]
+            self._free_slots.append(slot)
+            self.stale_rows += 1
+            return None
+        self._index.move_to_end(key)
+        return self._vectors[slot].tolist()
+
+    def _embed(self, kind, texts, compute):
+        keys = [self._key(kind, text) for text in texts]
+        results = [None] * len(texts)
+        missing = {}
+
+        with self._lock:
+            for position, key in enumerate(keys):
+                vector = self._read(key)
+                if vector is not None:
+                    results[position] = vector
+                    self.hits += 1
+                else:
+                    # Identical texts within one call are embedded once
+                    missing.setdefault(key, []).append(position)
+                    self.misses += 1
+
+        if missing:
+            computed = compute([texts[positions[0]] for positions in missing.values()])
+            with self._lock:
+                for (key, positions), vector in zip(missing.items(), computed):
+                    self._store(key, np.asarray(vector, dtype=np.float32))
+                    for position in positions:
+                        results[position] = list(vector)
+                self._maybe_save()
+
+        return results
+
+    def embed_documents(self, texts):
+        return self._embed("document", texts, self.embedding_model.embed_documents)
+
+    def embed_query(self, text):
+        return self._embed("query", [text], lambda texts: [self.embedding_model.embed_query(texts[0])])[0]
+
+    def _maybe_save(self):
+        if self._saving or time.monotonic() - self._last_save < INDEX_SAVE_INTERVAL_SECONDS:
+            return
+        snapshot = self._snapshot()
+        if snapshot is not None:
+            self._saving = True
+            threading.Thread(target=self._save_in_background, args=(snapshot,), daemon=True, name="embedding-cache-save").start()
+
+    def _snapshot(self):
+        """Copy the index for saving, called with the lock held. Returns None when nothing changed."""
+        if not self._dirty or self._vectors is None:
+            return None
+        self._dirty = False
+        self._last_save = time.monotonic()
+        self._snapshot_seq += 1
+        return self._snapshot_seq, {"dim": self._dim, "max_entries": self.max_entries, "entries": list(self._index.items())}
+
+    def _write(self, snapshot):
+        seq, saved = snapshot
+        with self._save_lock:
+            # A newer snapshot already written by flush() wins over an older background one
+            if seq < self._written_seq:
+                return
+            self._vectors.flush()
+            self._row_keys.flush()
+            tmp_path = self.index_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(saved, f)
+            os.replace(tmp_path, self.index_path)
+            self._written_seq = seq
+
+    def _save_in_background(self, snapshot):
+        try:
+            self._write(snapshot)
+        except Exception as e:
+            logger.error(f"Error saving embedding cache index: {str(e)}")
+            with self._lock:
+                self._dirty = True
+        finally:
+            with self._lock:
+                self._saving = False
+
+    def flush(self):
+        with self._lock:
+            snapshot = self._snapshot()
+        if snapshot is not None:
+            self._write(snapshot)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "model": self.model_name,
+                "entries": len(self._index),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "stale_rows": self.stale_rows,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+            }
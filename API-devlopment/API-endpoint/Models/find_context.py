@@ -1,64 +1,301 @@
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-import os
+from Models.text_normalize import clean_text, filter_tokens
+from Models.lexical_index import load_index
+from Models.vector_backend import collection_name_of
+from Models.tracing import annotate, timed
+from Models.context_packer import context_packer
+from langchain_core.documents import Document
+from collections import OrderedDict
+from itertools import zip_longest
+import threading
+import hashlib
 import logging
+import time
+import os
 
 
 logger = logging.getLogger(__name__)
 
-global stop_words
-stop_words = set(stopwords.words('english'))
+# Retrieval defaults, each can be overridden per request
+CANDIDATE_K = int(os.getenv("RETRIEVAL_CANDIDATE_K", "10"))
+RERANK_DEPTH = int(os.getenv("RERANK_DEPTH", "10"))
+FINAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", "6"))
+# "adaptive" skips the cross-encoder when vector distances already separate the top-k,
+# "always" reranks every candidate up to the rerank depth
+RERANK_MODE = os.getenv("RERANK_MODE", "adaptive")
+RERANK_MARGIN = float(os.getenv("RERANK_MARGIN", "0.1"))
+RERANK_SCORE_CACHE_SIZE = int(os.getenv("RERANK_SCORE_CACHE_SIZE", "8192"))
+
+# Hybrid retrieval fuses BM25 hits from the collection's lexical index with the vector search
+HYBRID_RETRIEVAL = os.getenv("HYBRID_RETRIEVAL", "true").lower() == "true"
+HYBRID_LEXICAL_K = int(os.getenv("HYBRID_LEXICAL_K", "6"))
+
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "512"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "900"))
+
+class QueryCache:
+    """LRU + TTL cache of query vectors and reranked context per collection."""
+
+    def __init__(self, max_entries=QUERY_CACHE_SIZE, ttl_seconds=QUERY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.saved_seconds = 0.0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry["created_at"] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += entry["compute_seconds"]
+            return entry
+
+    def put(self, key, vector, context, compute_seconds, confidence=None):
+        with self._lock:
+            self._entries[key] = {
+                "vector": vector,
+                "context": context,
+                "confidence": confidence,
+                "compute_seconds": compute_seconds,
+                "created_at": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, collection_name):
+        """Drop every cached query of a collection, called when it is re-ingested."""
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == collection_name]:
+                del self._entries[key]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "saved_seconds": round(self.saved_seconds, 3),
+            }
+
+query_cache = QueryCache()
+
+class AdaptiveReranker:
+    """Cross-encoder reranking limited to the candidates whose order is actually uncertain.
+
+    Candidates come as (doc, distance) sorted by ascending vector distance.
+    Documents clearly inside the top-k (closer than the cut-off distance minus
+    the margin) are kept without scoring, documents clearly outside are dropped
+    and only the band around the cut-off is scored. Scores are cached per
+    (collection, query, chunk id, chunk text) so repeated pairs never hit the
+    model twice. Chunk ids repeat across collections, hence the collection
+    and text in the key.
+    """
+
+    def __init__(self, score_cache_size=RERANK_SCORE_CACHE_SIZE):
+        self.score_cache_size = score_cache_size
+        self._scores = OrderedDict()
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.skipped = 0
+        self.pairs_scored = 0
+        self.pairs_cached = 0
+
+    @staticmethod
+    def chunk_key(doc):
+        return getattr(doc, "id", None) or hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def score_key(collection_name, query_context, doc):
+        return (collection_name, query_context, AdaptiveReranker.chunk_key(doc), hashlib.sha1(doc.page_content.encode("utf-8")).hexdigest())
+
+    def score(self, cross_encoder, query_context, docs, collection_name=None):
+        keys = [self.score_key(collection_name, query_context, doc) for doc in docs]
+        scores = [None] * len(docs)
+        with self._lock:
+            for position, key in enumerate(keys):
+                if key in self._scores:
+                    self._scores.move_to_end(key)
+                    scores[position] = self._scores[key]
+        missing = [position for position, score in enumerate(scores) if score is None]
+
+        if missing:
+            predicted = cross_encoder.predict([(query_context, docs[position].page_content) for position in missing])
+            with self._lock:
+                for position, score in zip(missing, predicted):
+                    scores[position] = float(score)
+                    self._scores[keys[position]] = float(score)
+                while len(self._scores) > self.score_cache_size:
+                    self._scores.popitem(last=False)
+
+        with self._lock:
+            self.pairs_scored += len(missing)
+            self.pairs_cached += len(docs) - len(missing)
+        return scores
+
+    def rerank(self, cross_encoder, query_context, candidates, top_k, rerank_depth, mode=RERANK_MODE, margin=RERANK_MARGIN,
+               collection_name=None, extra_docs=()):
+        """Return up to `top_k` (score, doc) pairs, score is None for documents kept without reranking.
+
+        `extra_docs` are candidates without a vector distance (BM25-only hits),
+        they are interleaved with the uncertain band by rank. The first
+        `rerank_depth` of those are scored, the rest follow unscored in
+        that order so the result still fills `top_k`.
+        """
+        with self._lock:
+            self.requests += 1
+        extra_docs = list(extra_docs)
+
+        def scored(band):
+            fused = [doc for pair in zip_longest(band, extra_docs) for doc in pair if doc is not None]
+            depth = fused[:rerank_depth]
+            ranked = sorted(zip(self.score(cross_encoder, query_context, depth, collection_name=collection_name), depth), key=lambda x: x[0], reverse=True)
+            return ranked + [(None, doc) for doc in fused[rerank_depth:]]
+
+        if mode == "always" or not candidates:
+            return scored([doc for doc, _ in candidates])[:top_k]
+
+        separated = len(candidates) <= top_k or candidates[top_k][1] - candidates[top_k - 1][1] >= margin
+        if separated and not extra_docs:
+            # Vector distances already separate the top-k from the rest
+            with self._lock:
+                self.skipped += 1
+            return [(None, doc) for doc, _ in candidates[:top_k]]
+
+        cutoff = candidates[min(top_k, len(candidates)) - 1][1]
+        next_distance = candidates[top_k][1] if len(candidates) > top_k else cutoff
+        head = [doc for doc, distance in candidates if distance < cutoff - margin][:top_k]
+        band = [doc for doc, distance in candidates[len(head):] if distance <= next_distance + margin]
+        return [(None, doc) for doc in head] + scored(band)[:top_k - len(head)]
+
+    def invalidate(self, collection_name):
+        """Drop the cached scores of a collection, called when it is re-ingested or deleted."""
+        with self._lock:
+            for key in [key for key in self._scores if key[0] == collection_name]:
+                del self._scores[key]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "rerank_skipped": self.skipped,
+                "pairs_scored": self.pairs_scored,
+                "pairs_from_cache": self.pairs_cached,
+            }
+
+reranker = AdaptiveReranker()
+
+retrieval_stats = {"hybrid_requests": 0, "lexical_only_candidates": 0}
+
+def lexical_candidates(vector_store, lexical_index, query_context, k):
+    """Fetch the BM25 top-k chunks of a collection as Documents."""
+    hits = lexical_index.search(query_context.split(), k)
+    if not hits:
+        return []
+    stored = vector_store.get(ids=[chunk_id for chunk_id, _ in hits])
+    docs_by_id = {
+        chunk_id: Document(id=chunk_id, page_content=content, metadata=metadata or {})
+        for chunk_id, content, metadata in zip(stored["ids"], stored["documents"], stored["metadatas"])
+    }
+    return [docs_by_id[chunk_id] for chunk_id, _ in hits if chunk_id in docs_by_id]
 
 def get_query_context(query: str):
-    clean_query = query.lower().replace("\n", " ")
-    tokens = word_tokenize(clean_query)
-    clean_tokens = [token for token in tokens if token not in stop_words]
-    context = " ".join(clean_tokens)
-    # context_query = f"context:[{context}] content :{query}"
-    
-    return context
-
-def get_context(vector_store, query, cross_encoder, embedding_model):
+    return " ".join(filter_tokens(clean_text(query)))
+
+def get_context(vector_store, query, cross_encoder, embedding_model, candidate_k=None, rerank_depth=None, top_k=None, with_details=False):
+    """Return the reranked context for a query.
+
+    `candidate_k` documents are fetched from the vector store, at most
+    `rerank_depth` of them are scored by the cross-encoder and the best
+    `top_k` are packed into the context within the token budget. With `with_details=True` the
+    result is a (context, query embedding, confidence) tuple, confidence
+    being the cross-encoder score of the best context document.
+    """
+    candidate_k = candidate_k or CANDIDATE_K
+    rerank_depth = rerank_depth or RERANK_DEPTH
+    top_k = top_k or FINAL_TOP_K
+
     try:
         query_context = get_query_context(query)
         logger.info(f"Query context generated: {query_context[:100]}...")
 
-        embedded_query_context = embedding_model.embed_query(query_context)
+        collection_name = collection_name_of(vector_store)
+        annotate(query=query, query_context=query_context, collection=collection_name)
+        cache_key = (collection_name, query_context, candidate_k, rerank_depth, top_k)
+        cached = query_cache.get(cache_key)
+        annotate(query_cache_hit=bool(cached))
+        if cached:
+            logger.info("Query cache hit, reusing reranked context")
+            annotate(context_chars=len(cached["context"]))
+            return (cached["context"], cached["vector"], cached["confidence"]) if with_details else cached["context"]
+        start = time.perf_counter()
+
+        with timed("embed_ms"):
+            embedded_query_context = embedding_model.embed_query(query_context)
         logger.info("Query embedding generated successfully")
 
-        context = vector_store.similarity_search_by_vector_with_relevance_scores(embedded_query_context, k=10)
+        lexical_index = load_index(collection_name) if HYBRID_RETRIEVAL else None
+
+        # Results come back as (document, distance), closest first
+        with timed("vector_search_ms"):
+            context = vector_store.similarity_search_by_vector_with_relevance_scores(embedded_query_context, k=candidate_k)
         logger.info(f"Found {len(context)} similar documents")
+        annotate(vector_candidates=[[AdaptiveReranker.chunk_key(doc), distance] for doc, distance in context])
 
-        if not context:
-            logger.warning("No similar documents found")
-            return None
+        lexical_only = []
+        if lexical_index is not None:
+            with timed("lexical_search_ms"):
+                lexical_docs = lexical_candidates(vector_store, lexical_index, query_context, HYBRID_LEXICAL_K)
+            vector_ids = {AdaptiveReranker.chunk_key(doc) for doc, _ in context}
+            lexical_only = [doc for doc in lexical_docs if AdaptiveReranker.chunk_key(doc) not in vector_ids]
+            retrieval_stats["hybrid_requests"] += 1
+            retrieval_stats["lexical_only_candidates"] += len(lexical_only)
+            # BM25-only hits have no vector distance, they join the uncertain band for the cross-encoder
+            logger.info(f"Hybrid retrieval added {len(lexical_only)} lexical-only candidates")
+            annotate(lexical_only_candidates=[AdaptiveReranker.chunk_key(doc) for doc in lexical_only])
 
-        # Create pairs for cross-encoder
-        pairs = [(query_context, doc[0].page_content) for doc in context]
-        scores = cross_encoder.predict(pairs)
+        if not context and not lexical_only:
+            logger.warning("No similar documents found")
+            return (None, embedded_query_context, None) if with_details else None
 
-        # Create list of (score, document) tuples and sort by score
-        scored_results = list(zip(scores, [doc[0] for doc in context]))
-        sorted_results = sorted(scored_results, key=lambda x: x[0], reverse=True)
-        logger.info(f"Sorted context documents found in vector store: {sorted_results}")
+        with timed("rerank_ms"):
+            sorted_results = reranker.rerank(cross_encoder, query_context, context, top_k=top_k, rerank_depth=rerank_depth, mode=RERANK_MODE,
+                                             collection_name=collection_name, extra_docs=lexical_only)
+        logger.info(f"Reranked {len(sorted_results)} context documents")
+        annotate(rerank_mode=RERANK_MODE, reranked=[[AdaptiveReranker.chunk_key(doc), score] for score, doc in sorted_results])
         
         # Extract just the documents from sorted results
         reranked_docs = [doc for _, doc in sorted_results]
+
+        # Adaptive reranking may keep the best document unscored, its cross-encoder score is the context confidence
+        confidence = sorted_results[0][0] if sorted_results else None
+        if confidence is None and reranked_docs:
+            confidence = reranker.score(cross_encoder, query_context, reranked_docs[:1], collection_name=collection_name)[0]
+        annotate(context_confidence=confidence)
         
-        # Join the page contents of top 6 documents
-        final_context = " \n\n ".join(doc.page_content for doc in reranked_docs[:6])
+        # Pack the top documents, overlapping chunks of a page are sent once
+        final_context, packing_stats = context_packer.pack(reranked_docs[:top_k])
+        annotate(**packing_stats)
         
         if final_context:
-            logger.info(f"Final context generated (length: {len(final_context)}): {final_context}")
-            with open("E:\\Nikhil\\BE_PR_Development\\TESTING_ENV\\testing-model\\ans&context2.txt", "a") as f:
-                f.write(f"+++query+++: '{query}'\n\n")
-                f.write(f"+++Context With Score+++: '{sorted_results}'\n\n")
-                f.write(f"+++Final Context+++: '{final_context}'\n\n")
-            return final_context
+            logger.info(f"Final context generated (length: {len(final_context)})")
+            query_cache.put(cache_key, vector=embedded_query_context, context=final_context, compute_seconds=time.perf_counter() - start, confidence=confidence)
+            annotate(context_chars=len(final_context), context=final_context)
+            return (final_context, embedded_query_context, confidence) if with_details else final_context
         else:
             logger.warning("No final context generated")
-            return None
+            return (None, embedded_query_context, None) if with_details else None
 
     except Exception as e:
         logger.error(f"Error in get_context: {str(e)}")
-        raise Exception(f"Error getting context: {str(e)}")
\ No newline at end of file
+        raise Exception(f"Error getting context: {str(e)}")
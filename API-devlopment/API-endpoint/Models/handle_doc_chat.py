@@ -1,16 +1,24 @@
 from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_community.document_loaders import PyMuPDFLoader
 from langchain.prompts import PromptTemplate
 from langchain.tools import Tool
 from langchain.agents.agent_toolkits import (VectorStoreInfo, VectorStoreToolkit)
 from langchain.agents import (AgentExecutor, create_react_agent)
 
-from sklearn.cluster import KMeans
 from dotenv import load_dotenv
-import numpy as np
+from collections import OrderedDict
+from contextvars import ContextVar
+import threading
+import asyncio
+import re
+import time
 import os
 import logging
 
+from Models.tracing import annotate
+from Models.doc_index import report_collection_name
+from Models.vector_backend import collection_name_of
+from Models.summary_context import compute_summary_context, load_summary, save_summary, save_generated_summary
+
 logger = logging.getLogger(__name__)
 
 load_dotenv()
@@ -25,37 +33,54 @@ llm = ChatGoogleGenerativeAI(
     api_key=KEY
 )
 
-def get_summary_doc_context(embedding_model, file_name):
-    base_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "upload_files")
-    closest_indices = []
+AGENT_CACHE_SIZE = int(os.getenv("AGENT_CACHE_SIZE", "32"))
 
-    try:
-        if os.path.exists(os.path.join(base_path, file_name)):
-            loader = PyMuPDFLoader(os.path.join(base_path, file_name))
-            pages = loader.load_and_split()
-            logger.info(f"loaded document: {len(pages)}")
+# Direct questions with confident context are answered by one prompt instead of the ReAct agent
+ANSWER_ROUTING = os.getenv("ANSWER_ROUTING", "true").lower() == "true"
+DIRECT_ANSWER_CONFIDENCE = float(os.getenv("DIRECT_ANSWER_CONFIDENCE", "0.7"))
+MULTI_HOP_PATTERN = re.compile(r'\b(?:compare|comparison|versus|vs|difference between|relative to|trend|across)\b', re.IGNORECASE)
 
-            vectors = embedding_model.embed_documents([page.page_content for page in pages])
+ANSWER_GUIDELINES = """    When answering queries:
+    1. Provide accurate and relevant information from the uploaded document.
+    2. Use financial terminology appropriately.
+    3. If asked for calculations or comparisons, double-check your math.
+    4. If the information is not in the uploaded document, clearly state that.
+    5. Offer concise but comprehensive answers, and ask if the user needs more details.
+    6. If applicable, mention any important caveats or contexts for the financial data.
+    7. While explaining terms, explain them in short way to minimize number of tokens.
+"""
 
-            if len(pages) > 20:
-                num_clusters = 11
-            else:
-                num_clusters = int(len(vectors)/2)
+DIRECT_ANSWER_PROMPT = PromptTemplate(
+    template="""You are a helpful financial analyst AI assistant. Your task is to answer the question based on the given context, which is derived from an uploaded document. If asked to explain, elaborate the terms in your answer.
+    Always use the information provided in the context to answer the query. This context represents the content of the uploaded document.
 
-            kmeans = KMeans(n_clusters=num_clusters, random_state=100).fit(vectors)
+""" + ANSWER_GUIDELINES + """
+    context:{context}
+    chat_history: {memory}
+    Question: {input}
+    Answer:""",
+    input_variables=["input", "context", "memory"])
 
-            for i in range(num_clusters):
-                distances = np.linalg.norm(vectors - kmeans.cluster_centers_[i], axis=1)
-                closest_index = np.argmin(distances)
-                closest_indices.append(closest_index)
+# Context of the question being answered, read by the cached summarization tool at call time
+_turn = ContextVar("agent_turn", default=None)
 
-            selected_indices = sorted(closest_indices)
-            selected_docs = [pages[index] for index in selected_indices]
-            final_selected_docs = [doc for doc in selected_docs if len(doc.page_content) > 250]
-            logger.info(f"final selected docs: {len(final_selected_docs)}")
+def get_summary_doc_context(embedding_model, file_name):
+    """Return the summary context stored at ingestion, computing and storing it for older documents."""
+    collection_name = report_collection_name(file_name)
+    start = time.perf_counter()
+    stored = load_summary(collection_name)
+    if stored is not None:
+        annotate(summary_context_source="stored", summary_context_ms=(time.perf_counter() - start) * 1000)
+        return stored["context"]
+
+    base_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "upload_files")
 
-            summary_context = "\n\n".join(doc.page_content for doc in final_selected_docs)
-            logger.info(f"Summary context generated: {summary_context}")
+    try:
+        if os.path.exists(os.path.join(base_path, file_name)):
+            summary_context, pages = compute_summary_context(embedding_model, os.path.join(base_path, file_name))
+            save_summary(collection_name, summary_context, pages)
+            logger.info(f"Summary context generated (length: {len(summary_context)})")
+            annotate(summary_context_source="computed", summary_context_ms=(time.perf_counter() - start) * 1000)
 
             return summary_context
         
@@ -68,7 +93,12 @@ def get_summary_doc_context(embedding_model, file_name):
 
 
 
-def summarization_tool_fun(summary_context):
+def summarization_tool_fun(summary_context=None, llm=llm, collection_name=None):
+    """Summarization tool over `summary_context`, or over the current turn's context when it is None.
+
+    With a `collection_name` the tool serves the document's stored summary
+    when it was generated from the same context, and stores new ones.
+    """
     summary_prompt = """You will be given a financial document containing key financial data, insights, and analysis. The document context will be enclosed in triple backticks (```).  
                 Your goal is to generate a structured and concise summary in bullet points highlighting the important financial metrics, trends, and insights from the document. Ensure that the summary includes key figures, performance indicators, and any notable observations.  
                 NOTE : *Please return the output got in first attempt*. Do not refine it further.
@@ -78,13 +108,38 @@ def summarization_tool_fun(summary_context):
 
     summary_chain = summary_prompt_template | llm
 
+    def current():
+        if summary_context is not None:
+            return summary_context, collection_name
+        turn = _turn.get() or {}
+        return turn.get("context", ""), turn.get("summary_collection")
+
+    def stored_summary(context, collection):
+        stored = load_summary(collection) if collection else None
+        if stored and stored.get("summary") and stored["context"] == context:
+            annotate(summary_source="stored")
+            return stored["summary"]
+        return None
+
+    def keep_summary(collection, result):
+        if collection:
+            save_generated_summary(collection, result.content)
+        annotate(summary_source="generated")
+        return result.content
+
     def summarize_chain(text):
-        return summary_chain.invoke({"text":summary_context})
+        context, collection = current()
+        return stored_summary(context, collection) or keep_summary(collection, summary_chain.invoke({"text":context}))
+
+    async def asummarize_chain(text):
+        context, collection = current()
+        return stored_summary(context, collection) or keep_summary(collection, await summary_chain.ainvoke({"text":context}))
 
     summarizing_tool = Tool.from_function(
         name="summarization_tool",
         description="Use this tool when asked to summarize the document or provide an overview.",
         func=summarize_chain,
+        coroutine=asummarize_chain,
     )
 
     return summarizing_tool
@@ -98,24 +153,20 @@ def classify_query(query):
     else:
         return "direct_question"
 
-def get_llm_response(user_query, vector_store, query_context, memory, embedding_model, file_name):
+def create_agent_executor(vector_store, llm=llm):
+    """Build the ReAct agent and tools for one document.
 
-    if classify_query(query=user_query) == "summary_request":
-        query = user_query + "In proper bullet points with long context."
-        context = get_summary_doc_context(embedding_model=embedding_model,
-                                          file_name=file_name)
-    else:
-        query = user_query
-        context = query_context
-    
-    SUMMARIZATION_TOOL = summarization_tool_fun(summary_context=context)
+    The question's context and chat history are prompt inputs rather than
+    partials, so the executor can be reused across requests.
+    """
+    SUMMARIZATION_TOOL = summarization_tool_fun(llm=llm)
     vectorStoreInfo = VectorStoreInfo(name="financial_analysis",
                                       description="Comprehensive financial report analysis tool for banking and corporate finance",
                                       vectorstore=vector_store)
     vectorStoreTool = VectorStoreToolkit(vectorstore_info=vectorStoreInfo, llm=llm)
 
     tools = vectorStoreTool.get_tools() + [SUMMARIZATION_TOOL]
-    logger.info(f"tools built up: {tools}")
+    logger.info(f"tools built up: {[tool.name for tool in tools]}")
 
     baseprompt = """You are a helpful financial analyst AI assistant. Your task is to answer questions based on the given context, which is derived from an uploaded document. If asked to explain, elaborate the terms in your final answer.
     Always use the information provided in the context to answer the query. This context represents the content of the uploaded document.
@@ -123,15 +174,7 @@ def get_llm_response(user_query, vector_store, query_context, memory, embedding_
     Answer the following questions as best you can. You have access to the following tools:
     {tools}
 
-    When answering queries:
-    1. Provide accurate and relevant information from the uploaded document.
-    2. Use financial terminology appropriately.
-    3. If asked for calculations or comparisons, double-check your math.
-    4. If the information is not in the uploaded document, clearly state that.
-    5. Offer concise but comprehensive answers, and ask if the user needs more details.
-    6. If applicable, mention any important caveats or contexts for the financial data.
-    7. While explaining terms, explain them in short way to minimize number of tokens.
-
+""" + ANSWER_GUIDELINES + """
     Use the following format:
 
     Question: the input question you must answer
@@ -147,7 +190,7 @@ def get_llm_response(user_query, vector_store, query_context, memory, embedding_
     Thought:{agent_scratchpad}"""
 
 
-    baseprompttemplate = PromptTemplate(template=baseprompt, partial_variables={"context":context, "memory":memory.buffer})
+    baseprompttemplate = PromptTemplate(template=baseprompt, input_variables=["input", "context", "memory", "tools", "tool_names", "agent_scratchpad"])
 
     try:
         agent = create_react_agent(
@@ -161,26 +204,217 @@ def get_llm_response(user_query, vector_store, query_context, memory, embedding_
         raise Exception(f"error creating agent: {str(e)}")
 
     try:
+        # Memory is loaded into the prompt and saved by the caller, the executor holds no per-user state
         agent_executor = AgentExecutor(
             agent=agent,
             tools=tools,
             verbose=True,
             handle_parsing_errors=True,
-            return_intermediate_steps=True,
-            memory=memory
+            return_intermediate_steps=True
         )
         # logger.info(f"agent executor created: {agent_executor}")
     except Exception as e:
         logger.error(f"error creating agent executor: {str(e)}")
         raise Exception(f"error creating agent executor: {str(e)}")
 
+    return agent_executor
+
+def llm_config(llm):
+    return (type(llm).__name__, getattr(llm, "model", None), getattr(llm, "temperature", None), id(llm))
+
+class AgentPool:
+    """Bounded LRU of agent executors per (collection, LLM configuration).
+
+    Each executor's tools hold the vector store it was built on, so the
+    document registry calls `discard` when it closes a handle, otherwise the
+    pool would keep evicted collections in memory.
+    """
+
+    def __init__(self, max_agents=AGENT_CACHE_SIZE):
+        self.max_agents = max_agents
+        self._agents = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.build_seconds = 0.0
+
+    def get(self, vector_store, llm=llm):
+        key = (collection_name_of(vector_store), llm_config(llm))
+        with self._lock:
+            entry = self._agents.get(key)
+            # A reopened handle means the collection changed underneath the cached tools
+            if entry is not None and entry[0] is vector_store:
+                self._agents.move_to_end(key)
+                self.hits += 1
+                annotate(agent_cache_hit=True)
+                return entry[1]
+
+        start = time.perf_counter()
+        agent_executor = create_agent_executor(vector_store, llm=llm)
+        elapsed = time.perf_counter() - start
+        annotate(agent_cache_hit=False, agent_build_ms=elapsed * 1000)
+        with self._lock:
+            self.misses += 1
+            self.build_seconds += elapsed
+            self._agents[key] = (vector_store, agent_executor)
+            self._agents.move_to_end(key)
+            while len(self._agents) > self.max_agents:
+                self._agents.popitem(last=False)
+        return agent_executor
+
+    def invalidate(self, collection_name):
+        """Drop the agents of a collection, called when it is re-ingested or deleted."""
+        with self._lock:
+            for key in [key for key in self._agents if key[0] == collection_name]:
+                del self._agents[key]
+
+    def discard(self, vector_store):
+        """Drop the agents built on a vector store handle, called when the registry closes it."""
+        with self._lock:
+            for key in [key for key, (agent_store, _) in self._agents.items() if agent_store is vector_store]:
+                del self._agents[key]
+
+    def stats(self):
+        with self._lock:
+            average_build = self.build_seconds / self.misses if self.misses else 0.0
+            return {
+                "entries": len(self._agents),
+                "max_entries": self.max_agents,
+                "hits": self.hits,
+                "misses": self.misses,
+                "average_build_ms": round(average_build * 1000, 2),
+                "saved_build_seconds": round(average_build * self.hits, 3),
+            }
+
+agent_pool = AgentPool()
+
+def build_agent_executor(user_query, vector_store, query_context, memory, embedding_model, file_name, llm=llm):
+    """Return the document's cached agent, its inputs for this question and the turn context for its tools."""
+
+    if classify_query(query=user_query) == "summary_request":
+        query = user_query + "In proper bullet points with long context."
+        context = get_summary_doc_context(embedding_model=embedding_model,
+                                          file_name=file_name)
+        summary_collection = report_collection_name(file_name)
+    else:
+        query = user_query
+        context = query_context
+        summary_collection = None
+
+    agent_executor = agent_pool.get(vector_store, llm=llm)
+    inputs = {"input": query, "context": context, "memory": memory.buffer}
+    return agent_executor, inputs, {"context": context, "summary_collection": summary_collection}
+
+def record_agent_output(user_query, start, output):
+    annotate(query_type=classify_query(query=user_query),
+             agent_ms=(time.perf_counter() - start) * 1000,
+             agent_steps=len(output.get("intermediate_steps", [])),
+             answer_chars=len(output["output"]),
+             answer=output["output"])
+
+def route_question(user_query, confidence, routing=ANSWER_ROUTING):
+    """Return "direct" when one prompt over the retrieved context can answer, otherwise "agent".
+
+    With `routing` off every question goes to the agent.
+    """
+    if not routing or classify_query(query=user_query) == "summary_request" or MULTI_HOP_PATTERN.search(user_query):
+        route = "agent"
+    else:
+        route = "direct" if confidence is not None and confidence >= DIRECT_ANSWER_CONFIDENCE else "agent"
+    annotate(route=route)
+    return route
+
+def record_direct_answer(start, answer):
+    annotate(query_type="direct_question", direct_answer_ms=(time.perf_counter() - start) * 1000, answer_chars=len(answer), answer=answer)
+
+async def aget_llm_response(user_query, vector_store, query_context, memory, embedding_model, file_name, llm=llm, confidence=None, callbacks=None,
+                            routing=ANSWER_ROUTING):
+    """Answer a question, with one direct prompt when `route_question` allows it and the ReAct agent otherwise.
+
+    LLM calls are awaited instead of blocking the event loop.
+    """
+    if route_question(user_query, confidence, routing=routing) == "direct":
+        start = time.perf_counter()
+        try:
+            result = await (DIRECT_ANSWER_PROMPT | llm).ainvoke(
+                {"input": user_query, "context": query_context, "memory": memory.buffer}, config={"callbacks": callbacks})
+        except Exception as e:
+            logger.info(f"error generating response: {str(e)}")
+            raise Exception(f"error generating response: {str(e)}")
+        record_direct_answer(start, result.content)
+        memory.save_context({"input": user_query}, {"output": result.content})
+        return result.content
+
+    # Summary requests embed and cluster the whole report, keep that off the event loop
+    agent_executor, inputs, turn = await asyncio.to_thread(
+        build_agent_executor, user_query, vector_store, query_context, memory, embedding_model, file_name, llm=llm)
+
+    # Every request runs in its own task, so the turn does not leak into other requests
+    _turn.set(turn)
     try:
-        output = agent_executor.invoke({"input": query})
-        # logger.info(f"response generated: {output}")
-        with open("E:\\Nikhil\\BE_PR_Development\\TESTING_ENV\\testing-model\\ans&context2.txt", "a") as f:
-            f.write(f"+++Answer+++: '{output['output']}'")
-            f.write("\n\n==============================================================\n\n")
+        start = time.perf_counter()
+        output = await agent_executor.ainvoke(inputs, config={"callbacks": callbacks})
+        record_agent_output(user_query, start, output)
+        memory.save_context({"input": inputs["input"]}, {"output": output["output"]})
         return output["output"]
     except Exception as e:
         logger.info(f"error generating response: {str(e)}")
         raise Exception(f"error generating response: {str(e)}")
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+async def astream_llm_response(user_query, vector_store, query_context, memory, embedding_model, file_name, llm=llm, confidence=None, callbacks=None,
+                               routing=ANSWER_ROUTING):
+    """Answer a question and yield (event, data) pairs: tool calls, final answer tokens and the full answer.
+
+    Direct answers stream every token. The ReAct agent streams its thoughts
+    and actions too, so only text after the "Final Answer:" marker of an
+    LLM call is forwarded as tokens.
+    """
+    if route_question(user_query, confidence, routing=routing) == "direct":
+        start = time.perf_counter()
+        answer = ""
+        async for chunk in (DIRECT_ANSWER_PROMPT | llm).astream(
+                {"input": user_query, "context": query_context, "memory": memory.buffer}, config={"callbacks": callbacks}):
+            if isinstance(chunk.content, str) and chunk.content:
+                answer += chunk.content
+                yield "token", {"text": chunk.content}
+        record_direct_answer(start, answer)
+        memory.save_context({"input": user_query}, {"output": answer})
+        yield "answer", {"text": answer}
+        return
+
+    agent_executor, inputs, turn = await asyncio.to_thread(
+        build_agent_executor, user_query, vector_store, query_context, memory, embedding_model, file_name, llm=llm)
+
+    _turn.set(turn)
+    start = time.perf_counter()
+    generations = {}
+    output = None
+    async for event in agent_executor.astream_events(inputs, config={"callbacks": callbacks}, version="v2"):
+        kind = event["event"]
+        if kind == "on_tool_start":
+            yield "tool", {"name": event["name"], "input": str(event["data"].get("input", ""))[:200]}
+        elif kind == "on_chat_model_stream":
+            content = event["data"]["chunk"].content
+            if not isinstance(content, str) or not content:
+                continue
+            # Per LLM call: text so far, position forwarded up to (None before the marker), any token sent yet
+            text, sent, emitted = generations.get(event["run_id"], ("", None, False))
+            text += content
+            if sent is None and FINAL_ANSWER_MARKER in text:
+                sent = text.index(FINAL_ANSWER_MARKER) + len(FINAL_ANSWER_MARKER)
+            if sent is not None:
+                token = text[sent:] if emitted else text[sent:].lstrip()
+                if token:
+                    yield "token", {"text": token}
+                    emitted, sent = True, len(text)
+            generations[event["run_id"]] = (text, sent, emitted)
+        elif kind == "on_chain_end" and event["name"] == "AgentExecutor":
+            output = event["data"]["output"]
+
+    if output is None:
+        raise Exception("error generating response: agent finished without an answer")
+    record_agent_output(user_query, start, output)
+    memory.save_context({"input": inputs["input"]}, {"output": output["output"]})
+    yield "answer", {"text": output["output"]}
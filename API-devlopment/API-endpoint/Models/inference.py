@@ -0,0 +1,194 @@
+import logging
+import time
+import os
+import re
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+# "torch" runs the stock sentence-transformers models, "onnx" exported ONNX graphs
+# and "onnx-int8" the same graphs with dynamically quantized int8 weights
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "torch")
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", str(os.cpu_count() or 1)))
+INFERENCE_BATCH_SIZE = int(os.getenv("INFERENCE_BATCH_SIZE", "32"))
+ONNX_MODEL_DIR = os.getenv("ONNX_MODEL_DIR", os.path.join(os.path.dirname(__file__), "../onnx-models"))
+# Same truncation as the torch models: all-MiniLM-L6-v2's max_seq_length and the cross-encoder's tokenizer limit
+EMBEDDING_MAX_SEQUENCE_LENGTH = 256
+CROSS_ENCODER_MAX_SEQUENCE_LENGTH = 512
+
+SAMPLE_TEXTS = [
+    "Net interest income rose 12% year over year on higher loan balances.",
+    "The bank's common equity tier 1 ratio stood at 13.4% at the end of the quarter.",
+    "Operating expenses increased due to investments in technology and higher compensation.",
+    "Provision for credit losses was 1.2 billion, reflecting a weaker macroeconomic outlook.",
+    "Diluted earnings per share were 4.10 compared with 3.85 in the prior year.",
+    "Total deposits declined 3% as clients moved cash into higher-yielding alternatives.",
+    "The board declared a quarterly dividend of 1.05 per share.",
+    "Return on tangible common equity was 17% for the full year.",
+]
+SAMPLE_QUERIES = ["net interest income growth", "capital ratio", "dividend per share", "credit loss provisions"]
+
+def configure_torch_threads(threads=INFERENCE_THREADS):
+    import torch
+    torch.set_num_threads(threads)
+
+def export_path(model_name, kind, quantized):
+    name = re.sub(r'[^A-Za-z0-9._-]', '_', model_name)
+    return os.path.join(ONNX_MODEL_DIR, f"{name}-{kind}{'-int8' if quantized else ''}.onnx")
+
+def export_onnx(model_name, kind, quantized):
+    """Export a Hugging Face encoder to ONNX once, optionally with dynamic int8 weights, and return its path."""
+    path = export_path(model_name, kind, quantized)
+    if os.path.exists(path):
+        return path
+    os.makedirs(ONNX_MODEL_DIR, exist_ok=True)
+    if quantized:
+        from onnxruntime.quantization import quantize_dynamic, QuantType
+        float_path = export_onnx(model_name, kind, quantized=False)
+        quantize_dynamic(float_path, path + ".tmp", weight_type=QuantType.QInt8)
+        os.replace(path + ".tmp", path)
+        logger.info(f"Quantized {model_name} {kind} graph to int8 at {path}")
+        return path
+
+    import torch
+    from transformers import AutoModel, AutoModelForSequenceClassification, AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model_class = AutoModelForSequenceClassification if kind == "cross-encoder" else AutoModel
+    model = model_class.from_pretrained(model_name).eval()
+    sample = tokenizer(["warm up"], ["warm up"] if kind == "cross-encoder" else None, return_tensors="pt")
+    input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["output"] = {0: "batch"} if kind == "cross-encoder" else {0: "batch", 1: "sequence"}
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[name] for name in input_names),
+            path + ".tmp",
+            input_names=input_names,
+            output_names=["output"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+    os.replace(path + ".tmp", path)
+    logger.info(f"Exported {model_name} {kind} graph to {path}")
+    return path
+
+def onnx_session(path, threads=INFERENCE_THREADS):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.intra_op_num_threads = threads
+    options.inter_op_num_threads = 1
+    options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, sess_options=options, providers=["CPUExecutionProvider"])
+
+class OnnxRunner:
+    """Tokenizer plus ONNX Runtime session for one exported encoder."""
+
+    def __init__(self, model_name, kind, quantized, max_length, threads=INFERENCE_THREADS, batch_size=INFERENCE_BATCH_SIZE):
+        from transformers import AutoTokenizer
+        self.tokenizer = AutoTokenizer.from_pretrained(model_name)
+        self.max_length = max_length
+        self.session = onnx_session(export_onnx(model_name, kind, quantized), threads=threads)
+        self.input_names = {model_input.name for model_input in self.session.get_inputs()}
+        self.batch_size = batch_size
+
+    def run(self, texts, text_pairs=None):
+        """Yield (encoded inputs, output) per batch."""
+        for start in range(0, len(texts), self.batch_size):
+            batch_pairs = text_pairs[start:start + self.batch_size] if text_pairs is not None else None
+            encoded = self.tokenizer(texts[start:start + self.batch_size], batch_pairs, padding=True, truncation=True,
+                                     max_length=self.max_length, return_tensors="np")
+            inputs = {name: encoded[name].astype(np.int64) for name in self.input_names}
+            yield encoded, self.session.run(None, inputs)[0]
+
+class OnnxEmbeddings(Embeddings):
+    """Sentence-transformers style embeddings (mean pooling, L2 normalized) from an ONNX graph."""
+
+    def __init__(self, model_name, quantized=False, threads=INFERENCE_THREADS):
+        self.model_name = model_name
+        self.runner = OnnxRunner(model_name, "embedding", quantized, EMBEDDING_MAX_SEQUENCE_LENGTH, threads=threads)
+
+    def _encode(self, texts):
+        vectors = []
+        for encoded, hidden in self.runner.run(list(texts)):
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            vectors.append(pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None))
+        return np.concatenate(vectors).tolist() if vectors else []
+
+    def embed_documents(self, texts):
+        return self._encode([text.replace("\n", " ") for text in texts])
+
+    def embed_query(self, text):
+        return self._encode([text.replace("\n", " ")])[0]
+
+ACTIVATIONS = {
+    "Identity": lambda logits: logits,
+    "Sigmoid": lambda logits: 1 / (1 + np.exp(-logits)),
+    "Tanh": np.tanh,
+}
+
+def cross_encoder_activation(model_name):
+    """The activation `CrossEncoder` applies to this model's scores.
+
+    Like sentence-transformers, use `sbert_ce_default_activation_function`
+    from the model config when set, otherwise sigmoid for single-label models.
+    """
+    from transformers import AutoConfig
+    config = AutoConfig.from_pretrained(model_name)
+    name = getattr(config, "sbert_ce_default_activation_function", None)
+    if name:
+        activation = ACTIVATIONS.get(name.rsplit(".", 1)[-1])
+        if activation is None:
+            raise ValueError(f"Unsupported cross-encoder activation {name} for {model_name}")
+        return activation
+    return ACTIVATIONS["Sigmoid"] if config.num_labels == 1 else ACTIVATIONS["Identity"]
+
+class OnnxCrossEncoder:
+    """Drop-in for `CrossEncoder.predict` on a single-logit relevance model."""
+
+    def __init__(self, model_name, quantized=False, threads=INFERENCE_THREADS):
+        self.model_name = model_name
+        self.runner = OnnxRunner(model_name, "cross-encoder", quantized, CROSS_ENCODER_MAX_SEQUENCE_LENGTH, threads=threads)
+        self.activation = cross_encoder_activation(model_name)
+
+    def predict(self, sentences, **kwargs):
+        if not sentences:
+            return np.zeros(0, dtype=np.float32)
+        queries = [pair[0] for pair in sentences]
+        passages = [pair[1] for pair in sentences]
+        logits = np.concatenate([output[:, 0] for _, output in self.runner.run(queries, passages)])
+        return self.activation(logits)
+
+def load_embedding_model(model_name, backend=None):
+    backend = backend or INFERENCE_BACKEND
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxEmbeddings(model_name, quantized=backend == "onnx-int8")
+    from langchain_huggingface import HuggingFaceEmbeddings
+    configure_torch_threads()
+    return HuggingFaceEmbeddings(model_name=model_name)
+
+def load_cross_encoder(model_name, backend=None):
+    backend = backend or INFERENCE_BACKEND
+    if backend in ("onnx", "onnx-int8"):
+        return OnnxCrossEncoder(model_name, quantized=backend == "onnx-int8")
+    from sentence_transformers import CrossEncoder
+    configure_torch_threads()
+    return CrossEncoder(model_name)
+
+def cache_model_name(model_name, backend=None):
+    """Embedding cache namespace, vectors from different runtimes are not mixed."""
+    backend = backend or INFERENCE_BACKEND
+    return model_name if backend == "torch" else f"{model_name}@{backend}"
+
+def warmup(embedding_model, cross_encoder):
+    """Run one batch through both models so graph optimization and allocation happen before the first request."""
+    start = time.perf_counter()
+    embedding_model.embed_documents(SAMPLE_TEXTS[:2])
+    embedding_model.embed_query(SAMPLE_QUERIES[0])
+    cross_encoder.predict([(SAMPLE_QUERIES[0], text) for text in SAMPLE_TEXTS[:2]])
+    seconds = time.perf_counter() - start
+    logger.info(f"Inference warmup finished in {seconds:.2f}s")
+    return seconds
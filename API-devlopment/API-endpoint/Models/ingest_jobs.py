@@ -0,0 +1,106 @@
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+import threading
+import logging
+import uuid
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+MAX_FINISHED_JOBS = int(os.getenv("INGEST_MAX_FINISHED_JOBS", "100"))
+
+class IngestionJob:
+    """State of one background document ingestion, updated by the worker thread."""
+
+    def __init__(self, file_path, file_name):
+        self.job_id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.file_name = file_name
+        self.status = "queued"
+        self.stage = "queued"
+        self.percent = 0
+        self.chunk_count = None
+        self.stats = {}
+        self.result = None
+        self.error = None
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+
+    def to_dict(self):
+        return {
+            "job_id": self.job_id,
+            "file_name": self.file_name,
+            "status": self.status,
+            "stage": self.stage,
+            "percent": self.percent,
+            "chunk_count": self.chunk_count,
+            "stats": self.stats,
+            "error": self.error,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class IngestionJobQueue:
+    """Runs ingestion jobs on a bounded worker pool and keeps their progress for polling."""
+
+    def __init__(self, max_workers=INGEST_WORKERS, max_finished_jobs=MAX_FINISHED_JOBS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_finished_jobs = max_finished_jobs
+
+    def submit(self, file_path, file_name, run, on_complete=None):
+        """Queue `run(progress)` for a file and return the job right away.
+
+        `run` receives a `progress(stage, percent)` callback and returns a dict
+        with at least `chunk_count` and optionally `stats`; `on_complete(job)`
+        is called from the worker thread after a successful run.
+        """
+        job = IngestionJob(file_path=file_path, file_name=file_name)
+        with self._lock:
+            self._jobs[job.job_id] = job
+            self._prune()
+
+        self._executor.submit(self._run_job, job, run, on_complete)
+        logger.info(f"Queued ingestion job {job.job_id} for {file_name}")
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _update(self, job, **fields):
+        with self._lock:
+            for key, value in fields.items():
+                setattr(job, key, value)
+
+    def _run_job(self, job, run, on_complete):
+        self._update(job, status="running", stage="partition", started_at=time.time())
+
+        def progress(stage, percent):
+            self._update(job, stage=stage, percent=int(percent))
+
+        try:
+            result = run(progress)
+            self._update(job, result=result, chunk_count=result.get("chunk_count"), stats=result.get("stats", {}))
+            if on_complete:
+                on_complete(job)
+            self._update(job, status="completed", stage="completed", percent=100, finished_at=time.time())
+            logger.info(f"Ingestion job {job.job_id} completed with {job.chunk_count} chunks")
+        except Exception as e:
+            logger.error(f"Ingestion job {job.job_id} failed: {str(e)}")
+            self._update(job, status="failed", error=str(e), finished_at=time.time())
+
+    def _prune(self):
+        # Keep every active job, drop the oldest finished ones past the limit
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in ("completed", "failed")]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
@@ -0,0 +1,134 @@
+from collections import Counter, OrderedDict, defaultdict
+import threading
+import logging
+import math
+import json
+import os
+import re
+
+from Models.doc_index import CHROMA_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+LEXICAL_INDEX_DIR = os.path.join(CHROMA_DB_PATH, "lexical")
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+TERM_PATTERN = re.compile(r'[a-z0-9]')
+# Loaded indexes are kept for as many collections as the document registry keeps open
+LEXICAL_INDEX_CACHE_SIZE = int(os.getenv("LEXICAL_INDEX_CACHE_SIZE", os.getenv("DOCUMENT_HANDLE_CACHE_SIZE", "16")))
+
+_loaded = OrderedDict()
+_loaded_lock = threading.Lock()
+
+def index_terms(tokens):
+    """Keep the tokens worth indexing, punctuation-only tokens carry no signal."""
+    return [token for token in tokens if TERM_PATTERN.search(token)]
+
+class LexicalIndex:
+    """BM25 inverted index over the stopword-filtered chunk tokens of one collection."""
+
+    def __init__(self):
+        self._chunks = {}
+        self._postings = defaultdict(dict)
+        self._total_length = 0
+
+    def __len__(self):
+        return len(self._chunks)
+
+    def add(self, chunk_id, tokens):
+        if chunk_id in self._chunks:
+            self.remove([chunk_id])
+        term_counts = Counter(index_terms(tokens))
+        length = sum(term_counts.values())
+        self._chunks[chunk_id] = (length, dict(term_counts))
+        self._total_length += length
+        for term, count in term_counts.items():
+            self._postings[term][chunk_id] = count
+
+    def remove(self, chunk_ids):
+        for chunk_id in chunk_ids:
+            entry = self._chunks.pop(chunk_id, None)
+            if entry is None:
+                continue
+            length, term_counts = entry
+            self._total_length -= length
+            for term in term_counts:
+                postings = self._postings[term]
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def search(self, query_tokens, k):
+        """Return up to k (chunk_id, bm25_score) pairs, best first."""
+        if not self._chunks:
+            return []
+        chunk_count = len(self._chunks)
+        average_length = self._total_length / chunk_count or 1
+        scores = defaultdict(float)
+        for term in set(index_terms(query_tokens)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (chunk_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, count in postings.items():
+                length = self._chunks[chunk_id][0]
+                scores[chunk_id] += idf * count * (BM25_K1 + 1) / (count + BM25_K1 * (1 - BM25_B + BM25_B * length / average_length))
+        return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:k]
+
+    def copy(self):
+        return LexicalIndex.from_dict(self.to_dict())
+
+    def to_dict(self):
+        return {"chunks": self._chunks}
+
+    @classmethod
+    def from_dict(cls, data):
+        index = cls()
+        for chunk_id, (length, term_counts) in data["chunks"].items():
+            index._chunks[chunk_id] = (length, term_counts)
+            index._total_length += length
+            for term, count in term_counts.items():
+                index._postings[term][chunk_id] = count
+        return index
+
+def index_path(collection_name):
+    return os.path.join(LEXICAL_INDEX_DIR, f"{collection_name}.json")
+
+def save_index(collection_name, index):
+    os.makedirs(LEXICAL_INDEX_DIR, exist_ok=True)
+    tmp_path = index_path(collection_name) + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index.to_dict(), f)
+    os.replace(tmp_path, index_path(collection_name))
+    _remember(collection_name, index)
+
+def _remember(collection_name, index):
+    with _loaded_lock:
+        _loaded[collection_name] = index
+        _loaded.move_to_end(collection_name)
+        while len(_loaded) > LEXICAL_INDEX_CACHE_SIZE:
+            _loaded.popitem(last=False)
+
+def load_index(collection_name):
+    """Return the collection's lexical index, or None for collections ingested without one."""
+    with _loaded_lock:
+        if collection_name in _loaded:
+            _loaded.move_to_end(collection_name)
+            return _loaded[collection_name]
+    if not os.path.exists(index_path(collection_name)):
+        return None
+    try:
+        with open(index_path(collection_name), "r", encoding="utf-8") as f:
+            index = LexicalIndex.from_dict(json.load(f))
+    except Exception as e:
+        logger.error(f"Error loading lexical index for {collection_name}: {str(e)}")
+        return None
+    _remember(collection_name, index)
+    return index
+
+def delete_index(collection_name):
+    with _loaded_lock:
+        _loaded.pop(collection_name, None)
+    if os.path.exists(index_path(collection_name)):
+        os.remove(index_path(collection_name))
@@ -0,0 +1,240 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import threading
+import hashlib
+import os
+import re
+import time
+import logging
+
+import fitz
+from langchain_core.documents import Document
+
+from unstructured_client.models import shared, operations
+from unstructured_client.models.errors import SDKError
+from unstructured.staging.base import dict_to_elements
+from unstructured_client import UnstructuredClient
+import markdownify
+
+from dotenv import load_dotenv
+load_dotenv()
+
+client = UnstructuredClient(
+    api_key_auth=os.getenv("UNSTRUCTURED_API_KEY"),
+    server_url=os.getenv("UNSTRUCTURED_API_URL")
+)
+
+logger = logging.getLogger(__name__)
+
+# "routed" extracts born-digital pages locally and sends only scanned or
+# table/image heavy pages to hi_res, "hi_res" sends every page to Unstructured
+PARTITION_MODE = os.getenv("PARTITION_MODE", "routed")
+MIN_TEXT_CHARS = int(os.getenv("ROUTE_MIN_TEXT_CHARS", "200"))
+MAX_IMAGE_RATIO = float(os.getenv("ROUTE_MAX_IMAGE_RATIO", "0.3"))
+MAX_NUMERIC_LINE_RATIO = float(os.getenv("ROUTE_MAX_NUMERIC_LINE_RATIO", "0.35"))
+
+# hi_res pages are sent as page-range shards partitioned concurrently
+SHARD_PAGES = int(os.getenv("PARTITION_SHARD_PAGES", "10"))
+PARTITION_CONCURRENCY = int(os.getenv("PARTITION_CONCURRENCY", "4"))
+PARTITION_RETRIES = int(os.getenv("PARTITION_RETRIES", "2"))
+RETRY_BACKOFF_SECONDS = float(os.getenv("PARTITION_RETRY_BACKOFF", "2"))
+
+NUMBER_PATTERN = re.compile(r'\(?-?[\d,]+(?:\.\d+)?\)?%?')
+
+def sanitize_metadata(metadata):
+    """Convert any list values in metadata to strings."""
+    sanitized = {}
+    for key, value in metadata.items():
+        if isinstance(value, list):
+            sanitized[key] = ", ".join(str(v) for v in value)
+        else:
+            sanitized[key] = value
+    return sanitized
+
+def elements_to_documents(elements):
+    documents = []
+    for element in elements:
+        if element.category == "Table":
+            table_html = element.metadata.text_as_html
+            markdown_table = markdownify.markdownify(table_html, heading_style="ATX")
+            metadata = sanitize_metadata(element.to_dict()['metadata'])
+            documents.append(Document(page_content=markdown_table, metadata=metadata))
+        else:
+            metadata = sanitize_metadata(element.to_dict()['metadata'])
+            documents.append(Document(page_content=element.text, metadata=metadata))
+    return documents
+
+def partition_hi_res(content, file_name, client=client):
+    """Send file bytes or an open binary file to the Unstructured hi_res model, one Document per element."""
+    files = shared.Files(
+        content=content,
+        file_name=file_name
+    )
+
+    req = operations.PartitionRequest(
+        partition_parameters=shared.PartitionParameters(
+        files=files,
+        strategy="hi_res",
+        hi_res_model_name="yolox",
+        skip_infer_table_types=[],
+        pdf_infer_table_structure=True))
+
+    try:
+        resp = client.general.partition(request=req)
+        elements = dict_to_elements(resp.elements)
+        logger.info(f"loaded document: {len(elements)}")
+    except SDKError as e:
+        logger.error(f"Error processing document with unstructured: {str(e)}")
+        raise Exception(f"Error processing document with unstructured: {str(e)}")
+
+    return elements_to_documents(elements)
+
+def classify_page(page):
+    """Return "local" when the page text layer can be used as is, else "hi_res"."""
+    text = page.get_text("text")
+    if len(text.strip()) < MIN_TEXT_CHARS:
+        # No usable text layer, most likely a scanned page
+        return "hi_res"
+
+    page_area = page.rect.width * page.rect.height
+    image_area = sum(abs(fitz.Rect(image["bbox"])) for image in page.get_image_info())
+    if page_area and image_area / page_area > MAX_IMAGE_RATIO:
+        return "hi_res"
+
+    lines = [line for line in text.splitlines() if line.strip()]
+    numeric_lines = [line for line in lines if len(NUMBER_PATTERN.findall(line)) >= 2]
+    if lines and len(numeric_lines) / len(lines) > MAX_NUMERIC_LINE_RATIO:
+        # Number dense pages are usually financial tables, keep their structure
+        return "hi_res"
+
+    return "local"
+
+def extract_local_page(page, file_name):
+    """Extract a born-digital page from its text layer, one Document per text block."""
+    metadata = {
+        "page_number": page.number + 1,
+        "filename": os.path.basename(file_name),
+        "filetype": "application/pdf",
+    }
+    documents = []
+    for block in page.get_text("blocks", sort=True):
+        # block = (x0, y0, x1, y1, text, block_no, block_type), type 0 is text
+        if block[6] == 0 and block[4].strip():
+            documents.append(Document(page_content=block[4].strip(), metadata=dict(metadata)))
+    return documents
+
+def page_fingerprints(file_path):
+    """Fingerprint every PDF page from its text layer and embedded images, before any partitioning."""
+    fingerprints = []
+    with fitz.open(file_path) as pdf:
+        for page in pdf:
+            digest = hashlib.sha256(page.get_text("text").encode("utf-8"))
+            for image in page.get_image_info(hashes=True):
+                digest.update(image["digest"])
+                digest.update(str([round(value) for value in image["bbox"]]).encode("utf-8"))
+            fingerprints.append(digest.hexdigest())
+    return fingerprints
+
+def build_shard(pdf, page_indices):
+    """Copy the given pages into a standalone PDF and return its bytes."""
+    shard = fitz.open()
+    for page_index in page_indices:
+        shard.insert_pdf(pdf, from_page=page_index, to_page=page_index)
+    content = shard.tobytes()
+    shard.close()
+    return content
+
+def partition_shard(pdf, pdf_lock, page_indices, file_name, client=client):
+    """Partition one shard with retries and map its page numbers back to the source PDF.
+
+    Shard bytes are built inside the worker so only the shards in flight are held in memory.
+    """
+    # fitz documents are not thread safe
+    with pdf_lock:
+        content = build_shard(pdf, page_indices)
+
+    for attempt in range(PARTITION_RETRIES + 1):
+        try:
+            documents = partition_hi_res(content, file_name, client=client)
+            break
+        except Exception as e:
+            if attempt == PARTITION_RETRIES:
+                raise Exception(f"Shard for pages {page_indices[0] + 1}-{page_indices[-1] + 1} failed after {attempt + 1} attempts: {str(e)}")
+            logger.warning(f"Retrying shard for pages {page_indices[0] + 1}-{page_indices[-1] + 1}: {str(e)}")
+            time.sleep(RETRY_BACKOFF_SECONDS * (2 ** attempt))
+
+    for doc in documents:
+        shard_page = int(doc.metadata.get("page_number", 1))
+        doc.metadata["page_number"] = page_indices[shard_page - 1] + 1
+    return documents
+
+def partition_pages_hi_res(pdf, page_indices, file_name, progress=None, client=client, shard_pages=SHARD_PAGES, concurrency=PARTITION_CONCURRENCY):
+    """Partition the given pages with hi_res as `shard_pages` page-range shards, `concurrency` at a time.
+
+    Shard results are merged back in page order with their original page numbers.
+    `progress(done_shards, total_shards)` is called as shards finish.
+    """
+    shards = [page_indices[i:i + shard_pages] for i in range(0, len(page_indices), shard_pages)]
+    pdf_lock = threading.Lock()
+    results = [None] * len(shards)
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="partition") as executor:
+        futures = {
+            executor.submit(partition_shard, pdf, pdf_lock, shard, file_name, client=client): position
+            for position, shard in enumerate(shards)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            results[futures[future]] = future.result()
+            if progress:
+                progress(done, len(shards))
+
+    return [doc for shard_documents in results for doc in shard_documents], len(shards)
+
+def partition_document(file_path, file_name, mode=None, progress=None, page_indices=None, client=client,
+                       shard_pages=SHARD_PAGES, concurrency=PARTITION_CONCURRENCY):
+    """Partition a file into element Documents ready for `combine_documents_by_page`.
+
+    `page_indices` restricts a PDF to the given zero-based pages. `client`,
+    `shard_pages` and `concurrency` default to the configured endpoint and
+    sharding. Returns the documents and routing stats (pages per path,
+    shards and wall time).
+    """
+    mode = mode or PARTITION_MODE
+    start = time.perf_counter()
+
+    if not file_path.lower().endswith(".pdf"):
+        # The SDK streams the file handle into the multipart request
+        with open(file_path, "rb") as f:
+            documents = partition_hi_res(f, file_path, client=client)
+        return documents, {"partition_mode": "hi_res", "partition_seconds": round(time.perf_counter() - start, 3)}
+
+    with fitz.open(file_path) as pdf:
+        if page_indices is None:
+            page_indices = range(pdf.page_count)
+        if mode == "routed":
+            routes = {index: classify_page(pdf[index]) for index in page_indices}
+        else:
+            routes = {index: "hi_res" for index in page_indices}
+        local_pages = [index for index, route in routes.items() if route == "local"]
+        hi_res_pages = [index for index, route in routes.items() if route == "hi_res"]
+        logger.info(f"Page routing for {file_name}: {len(local_pages)} local, {len(hi_res_pages)} hi_res")
+
+        documents = []
+        for page_index in local_pages:
+            documents.extend(extract_local_page(pdf[page_index], file_name))
+        shard_count = 0
+        if hi_res_pages:
+            hi_res_documents, shard_count = partition_pages_hi_res(pdf, hi_res_pages, file_path, progress=progress, client=client,
+                                                                   shard_pages=shard_pages, concurrency=concurrency)
+            documents.extend(hi_res_documents)
+
+    # Restore reading order across the two paths, element order is kept within a page
+    documents.sort(key=lambda doc: int(doc.metadata.get("page_number", 1)))
+
+    stats = {
+        "partition_mode": "routed" if mode == "routed" else "hi_res",
+        "pages_local": len(local_pages),
+        "pages_hi_res": len(hi_res_pages),
+        "partition_shards": shard_count,
+        "partition_seconds": round(time.perf_counter() - start, 3),
+    }
+    return documents, stats
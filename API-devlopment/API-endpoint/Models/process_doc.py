@@ -1,48 +1,55 @@
 import os
 from collections import defaultdict
 from typing import List
+from contextlib import contextmanager
+import threading
 import logging
+import queue
+import time
+
+import psutil
 
-from langchain_community.document_loaders import PyMuPDFLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_chroma import Chroma
 from langchain_core.documents import Document
 
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
-import re
-
-from unstructured_client.models import shared, operations
-from unstructured_client.models.errors import SDKError
-from unstructured.staging.base import dict_to_elements
-from unstructured_client import UnstructuredClient
-import markdownify
+from Models.text_normalize import clean_text, normalize_batch, format_context_chunk
+from Models.lexical_index import LexicalIndex, load_index, save_index
+from Models.summary_context import build_summary, delete_summary
+from Models.vector_backend import open_vector_store, create_vector_store, staging_collection_name, promote_vector_store, vector_count, persist_vector_store, backend_of, quantization_stats
+from Models.partition_doc import partition_document, page_fingerprints
+from Models.doc_index import CHROMA_DB_PATH, report_collection_name, file_sha256, lookup_document, lookup_collection, record_document, forget_document, record_dedup_result
 
 from dotenv import load_dotenv
 load_dotenv()
 
-client = UnstructuredClient(
-    api_key_auth=os.getenv("UNSTRUCTURED_API_KEY"),
-    server_url=os.getenv("UNSTRUCTURED_API_URL")
-)
-
-global stop_words
-stop_words = set(stopwords.words('english'))
-
 logger = logging.getLogger(__name__)
 
-def preprocess_text(page, metadata):
-    filter_page = page.lower().replace("\n", " ")
-    return Document(page_content=filter_page, metadata=metadata)
-    # documents.append(Document(page_content=filter_page, metadata=metadata))
+# Chunks are embedded and written to the collection in batches while later pages are still being chunked
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+PIPELINE_QUEUE_DEPTH = int(os.getenv("PIPELINE_QUEUE_DEPTH", "4"))
+UPLOAD_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "upload_files")
 
-def preprocess_and_contextadd(metadata, chunk_content):
-    tokens = word_tokenize(chunk_content)
-    filter_tokens = [token for token in tokens if token not in stop_words]
-    doc_context = " ".join([word for word in filter_tokens[:30] if re.match(r'^[a-zA-Z]+$|^(?=.*[a-zA-Z])(?=.*\d)[a-zA-Z0-9]+$', word)])
+# Ingestions of the same file name share a collection, its index entry and lexical index, so they run one at a time
+_collection_locks = {}
+_collection_locks_guard = threading.Lock()
 
-    # context_documents.append(Document(page_content=f'DOCUMENT-CONTEXT:[{doc_context}]. DOCUMENT-CONTENT: {" ".join(filter_tokens)}', metadata=metadata))
-    return Document(page_content=f'DOCUMENT-CONTEXT:[{doc_context}]. DOCUMENT-CONTENT: {" ".join(filter_tokens)}', metadata=metadata)
+@contextmanager
+def collection_lock(collection_name):
+    """Hold the ingestion lock of a collection, locks no one waits on are dropped again."""
+    with _collection_locks_guard:
+        entry = _collection_locks.setdefault(collection_name, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            yield
+    finally:
+        with _collection_locks_guard:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del _collection_locks[collection_name]
+
+def preprocess_text(page, metadata):
+    return Document(page_content=clean_text(page), metadata=metadata)
 
 def combine_documents_by_page(documents: List[Document]) -> List[Document]:
     # Group documents by page_number
@@ -78,86 +85,291 @@ def combine_documents_by_page(documents: List[Document]) -> List[Document]:
     
     return merged_docs
 
-def sanitize_metadata(metadata):
-    """Convert any list values in metadata to strings."""
-    sanitized = {}
-    for key, value in metadata.items():
-        if isinstance(value, list):
-            sanitized[key] = ", ".join(str(v) for v in value)
+def report_progress(progress, stage, percent):
+    """Forward ingestion progress to the job queue when a callback is supplied."""
+    if progress:
+        progress(stage, percent)
+
+def iter_context_chunks(pages, text_splitter):
+    """Lazily clean, split and context-tag merged pages one page at a time.
+
+    Yields (page_index, chunk_id, chunk, tokens) where chunk ids are stable
+    per page (`p{page_number}-c{chunk_index}`) and tokens are the stopword
+    filtered tokens of the chunk.
+    """
+    for page_index, page in enumerate(pages):
+        cleaned_page = preprocess_text(page=page.page_content, metadata=page.metadata)
+        page_number = page.metadata.get("page_number", 1)
+        chunks = text_splitter.split_documents(documents=[cleaned_page])
+        normalized = normalize_batch([chunk.page_content for chunk in chunks])
+        for chunk_index, (chunk, (doc_context, tokens)) in enumerate(zip(chunks, normalized)):
+            context_chunk = Document(page_content=format_context_chunk(doc_context, tokens), metadata=chunk.metadata)
+            yield page_index, f"p{page_number}-c{chunk_index}", context_chunk, tokens
+
+def produce_batches(chunks, batch_size, batch_queue, stop_event):
+    """Producer thread: group chunks into batches on a bounded queue, ending with None."""
+    def put(item):
+        while not stop_event.is_set():
+            try:
+                batch_queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    try:
+        batch = []
+        for item in chunks:
+            batch.append(item)
+            if len(batch) == batch_size:
+                if not put(batch):
+                    return
+                batch = []
+        if batch and not put(batch):
+            return
+        put(None)
+    except Exception as e:
+        put(e)
+
+def stream_into_collection(pages, vector_store, text_splitter, on_batch=None, lexical_index=None):
+    """Chunk pages on a producer thread while embedding and writing batches to the collection.
+
+    Memory stays bounded by the queue depth times the batch size instead of
+    growing with the document. Chunk tokens are also added to `lexical_index`
+    when given. Returns the chunk ids written and pipeline stats.
+    """
+    batch_queue = queue.Queue(maxsize=PIPELINE_QUEUE_DEPTH)
+    stop_event = threading.Event()
+    producer = threading.Thread(
+        target=produce_batches,
+        args=(iter_context_chunks(pages, text_splitter), EMBED_BATCH_SIZE, batch_queue, stop_event),
+        daemon=True
+    )
+
+    process = psutil.Process()
+    peak_rss = process.memory_info().rss
+    chunk_ids = []
+    start = time.perf_counter()
+    producer.start()
+    try:
+        while True:
+            batch = batch_queue.get()
+            if batch is None:
+                break
+            if isinstance(batch, Exception):
+                raise batch
+
+            vector_store.add_documents(documents=[chunk for _, _, chunk, _ in batch], ids=[chunk_id for _, chunk_id, _, _ in batch])
+            chunk_ids.extend(chunk_id for _, chunk_id, _, _ in batch)
+            if lexical_index is not None:
+                for _, chunk_id, _, tokens in batch:
+                    lexical_index.add(chunk_id, tokens)
+            peak_rss = max(peak_rss, process.memory_info().rss)
+            if on_batch:
+                on_batch(batch[-1][0] + 1, len(pages))
+    finally:
+        stop_event.set()
+        producer.join()
+
+    elapsed = time.perf_counter() - start
+    stats = {
+        "pipeline_seconds": round(elapsed, 3),
+        "chunks_per_second": round(len(chunk_ids) / elapsed, 2) if elapsed else None,
+        "peak_rss_mb": round(peak_rss / (1024 * 1024), 1),
+    }
+    return chunk_ids, stats
+
+def find_ingested_document(file_hash, embedding_model):
+    """Return (vector_store, record) for previously ingested file contents, or None."""
+    record = lookup_document(file_hash)
+    if record is None:
+        return None
+
+    vector_store = open_vector_store(record["collection_name"], embedding_model, backend=record.get("backend", "chroma"))
+    if vector_count(vector_store) == 0:
+        # Index entry outlived its collection, treat it as a miss
+        logger.warning(f"Stale ingest index entry for {record['collection_name']}, re-processing")
+        forget_document(file_hash)
+        return None
+
+    return vector_store, record
+
+def group_chunk_ids_by_page(chunk_ids):
+    pages = defaultdict(list)
+    for chunk_id in chunk_ids:
+        pages[chunk_id[1:chunk_id.rindex("-c")]].append(chunk_id)
+    return pages
+
+def plan_page_update(old_pages, fingerprints):
+    """Compare page fingerprints with the stored manifest.
+
+    Returns zero-based indices of pages to reuse and to recompute, plus the
+    page numbers that no longer exist in the revised file.
+    """
+    reused, recompute = [], []
+    for index, fingerprint in enumerate(fingerprints):
+        old_page = old_pages.get(str(index + 1))
+        if old_page and old_page["fingerprint"] == fingerprint:
+            reused.append(index)
         else:
-            sanitized[key] = value
-    return sanitized
+            recompute.append(index)
+    removed = [page for page in old_pages if int(page) > len(fingerprints)]
+    return reused, recompute, removed
+
+def process_document(filepath: str, filename: str, embedding_model, cross_encoder_model, progress=None, update=False, file_hash=None, quantize=None):
+    """Ingest a report and return its vector store along with ingestion stats.
 
-def process_document(filepath: str, filename: str, embedding_model, cross_encoder_model):
-    base_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "upload_files")
-    documents_with_context=[]
-    documents = []
-    unstructured_docs = []
+    Files whose contents were ingested before reuse the persisted collection
+    instead of being partitioned and embedded again. With `update=True` a
+    revised PDF replaces the collection of the same file name page by page:
+    only chunks of changed or removed pages are deleted and only new or
+    changed pages are partitioned and embedded. `file_hash` skips re-reading
+    the file when the upload was already hashed while streaming to disk.
+    `quantize` stores a new flat collection as int8 vectors (defaults to
+    VECTOR_QUANTIZE), an incremental update keeps the collection's mode.
+
+    `filepath` is the upload's staging file. It replaces
+    `upload_files/<filename>` only once the collection lock is held, so a job
+    still queued for the same name never ingests another upload's bytes
+    under its own `file_hash`.
+    """
+    with collection_lock(report_collection_name(filename)):
+        file_path = os.path.join(UPLOAD_PATH, filename)
+        if os.path.abspath(filepath) != os.path.abspath(file_path):
+            if os.path.exists(filepath):
+                os.replace(filepath, file_path)
+            else:
+                # Nothing staged to move in, the hash may not describe what is in place
+                file_hash = None
+        return _process_document(filepath, filename, embedding_model, cross_encoder_model, progress=progress, update=update, file_hash=file_hash, quantize=quantize)
+
+def _process_document(filepath: str, filename: str, embedding_model, cross_encoder_model, progress=None, update=False, file_hash=None, quantize=None):
+    base_path = UPLOAD_PATH
 
     try:
         if os.path.exists(os.path.join(base_path, filename)):
-            with open(os.path.join(base_path, filename), "rb") as f:
-                files = shared.Files(
-                    content=f.read(),
-                    file_name=os.path.join(base_path, filename)
+            file_path = os.path.join(base_path, filename)
+            file_hash = file_hash or file_sha256(file_path)
+            existing = find_ingested_document(file_hash, embedding_model)
+            if existing:
+                vector_store, record = existing
+                dedup_counts = record_dedup_result(hit=True)
+                logger.info(f"Reusing collection {record['collection_name']} for {filename} (content hash {file_hash[:12]})")
+                return {
+                    "vector_store": vector_store,
+                    "chunk_count": record["chunk_count"],
+                    "stats": {"file_hash": file_hash, "dedup_hit": True, "dedup_hits": dedup_counts["hits"], "dedup_misses": dedup_counts["misses"]}
+                }
+
+            # Ensure the chroma-db directory exists
+            os.makedirs(CHROMA_DB_PATH, exist_ok=True)
+
+            collection_name = report_collection_name(filename)
+            fingerprints = page_fingerprints(file_path) if file_path.lower().endswith(".pdf") else None
+            previous = lookup_collection(collection_name) if update and fingerprints is not None else None
+            old_pages = previous[1].get("pages") if previous else None
+
+            if old_pages:
+                vector_store = open_vector_store(collection_name, embedding_model, backend=previous[1].get("backend", "chroma"))
+                reused, page_indices, removed = plan_page_update(old_pages, fingerprints)
+                reused = set(reused)
+                stale_ids = [chunk_id for index in page_indices for chunk_id in old_pages.get(str(index + 1), {}).get("chunk_ids", [])]
+                stale_ids += [chunk_id for page in removed for chunk_id in old_pages[page]["chunk_ids"]]
+                # Collections ingested before lexical indexing keep relying on vectors only
+                existing_index = load_index(collection_name)
+                lexical_index = existing_index.copy() if existing_index is not None else None
+                if lexical_index is not None:
+                    lexical_index.remove(stale_ids)
+                logger.info(f"Updating {collection_name}: {len(reused)} pages reused, {len(page_indices)} recomputed, {len(removed)} removed")
+            else:
+                # A full ingest builds a staging collection, the current one keeps serving chats until it is swapped in
+                vector_store = create_vector_store(staging_collection_name(collection_name), embedding_model, quantized=quantize)
+                reused, page_indices, removed, stale_ids = set(), None, [], []
+                lexical_index = LexicalIndex()
+
+            report_progress(progress, "partition", 5)
+            if page_indices == []:
+                unstructured_docs, partition_stats = [], {}
+            else:
+                unstructured_docs, partition_stats = partition_document(
+                    file_path,
+                    filename,
+                    page_indices=page_indices,
+                    progress=lambda done, total: report_progress(progress, "partition", 5 + 35 * done / total)
                 )
-            
-            req = operations.PartitionRequest(
-                partition_parameters=shared.PartitionParameters(
-                files=files,
-                strategy="hi_res",
-                hi_res_model_name="yolox",
-                skip_infer_table_types=[],
-                pdf_infer_table_structure=True))
-            
-            try:
-                resp = client.general.partition(request=req)
-                elements = dict_to_elements(resp.elements)
-                logger.info(f"loaded document: {len(elements)}")
-            except SDKError as e:
-                logger.error(f"Error processing document with unstructured: {str(e)}")
-                raise Exception(f"Error processing document with unstructured: {str(e)}")
-            
-            for element in elements:
-                if element.category == "Table":
-                    table_html = element.metadata.text_as_html
-                    markdown_table = markdownify.markdownify(table_html, heading_style="ATX")
-                    metadata = sanitize_metadata(element.to_dict()['metadata'])
-                    unstructured_docs.append(Document(page_content=markdown_table, metadata=metadata))
-                else:      
-                    metadata = sanitize_metadata(element.to_dict()['metadata'])
-                    unstructured_docs.append(Document(page_content=element.text, metadata=metadata))
+            logger.info(f"Partitioned {filename}: {partition_stats}")
 
+            report_progress(progress, "chunk", 40)
             merged_documents = combine_documents_by_page(unstructured_docs)
+            del unstructured_docs
 
-            for page in merged_documents:
-                cleaned_page = preprocess_text(page=page.page_content, metadata=page.metadata)
-                documents.append(cleaned_page)
-
+            report_progress(progress, "embed", 45)
             text_splitter = RecursiveCharacterTextSplitter(chunk_size = 800, chunk_overlap=200)
-            chunks = text_splitter.split_documents(documents=documents)
+            chunk_ids, pipeline_stats = stream_into_collection(
+                merged_documents,
+                vector_store,
+                text_splitter,
+                on_batch=lambda pages_done, total_pages: report_progress(progress, "embed", 45 + 50 * pages_done / total_pages),
+                lexical_index=lexical_index
+            )
+            logger.info(f"Embedded {len(chunk_ids)} chunks for {filename}: {pipeline_stats}")
 
-            for chunk in chunks:
-                context_chunk = preprocess_and_contextadd(metadata=chunk.metadata, chunk_content=chunk.page_content)
-                documents_with_context.append(context_chunk)
+            # Stale chunks go only once the new pages are stored, ids written again were already overwritten
+            written = set(chunk_ids)
+            leftover_ids = [chunk_id for chunk_id in stale_ids if chunk_id not in written]
+            if leftover_ids:
+                vector_store.delete(ids=leftover_ids)
 
-            # Ensure the chroma-db directory exists
-            chroma_db_path = os.path.join(os.path.dirname(__file__), "../chroma-db")
-            os.makedirs(chroma_db_path, exist_ok=True)
-
-            # Initialize vector store with persist directory
-            vector_store = Chroma.from_documents(
-                documents=documents_with_context,
-                embedding=embedding_model,
-                persist_directory=chroma_db_path,
-                collection_name=f"report_{filename}" 
-            )
+            report_progress(progress, "persist", 95)
+            persist_vector_store(vector_store)
+            if not old_pages:
+                vector_store = promote_vector_store(vector_store, collection_name, embedding_model)
+            if lexical_index is not None:
+                save_index(collection_name, lexical_index)
+
+            # Summary requests read the cluster-representative pages stored here instead of re-embedding the report
+            report_progress(progress, "summary", 97)
+            delete_summary(collection_name)
+            summary_stats = {}
+            if file_path.lower().endswith(".pdf"):
+                try:
+                    summary_stats = build_summary(collection_name, file_path, embedding_model)
+                except Exception as e:
+                    logger.warning(f"Summary context not precomputed for {filename}, it will be built on first request: {str(e)}")
+            pages = None
+            if fingerprints is not None:
+                new_chunk_ids = group_chunk_ids_by_page(chunk_ids)
+                pages = {}
+                for index, fingerprint in enumerate(fingerprints):
+                    page = str(index + 1)
+                    chunk_ids_for_page = old_pages[page]["chunk_ids"] if index in reused else new_chunk_ids.get(page, [])
+                    pages[page] = {"fingerprint": fingerprint, "chunk_ids": chunk_ids_for_page}
+            reused_chunks = sum(len(old_pages[str(index + 1)]["chunk_ids"]) for index in reused)
+            chunk_count = reused_chunks + len(chunk_ids)
+
+            record_document(file_hash, collection_name=collection_name, file_name=filename, chunk_count=chunk_count, pages=pages, backend=backend_of(vector_store))
+            dedup_counts = record_dedup_result(hit=False)
+
+            update_stats = {
+                "vector_backend": backend_of(vector_store),
+                "vector_quantization": quantization_stats(vector_store),
+                "update_mode": "incremental" if old_pages else "full",
+                "pages_reused": len(reused),
+                "pages_recomputed": len(fingerprints) - len(reused) if fingerprints is not None else None,
+                "pages_removed": len(removed),
+                "chunks_reused": reused_chunks,
+                "chunks_recomputed": len(chunk_ids),
+                "chunks_deleted": len(stale_ids),
+            }
 
-            return vector_store
+            return {
+                "vector_store": vector_store,
+                "chunk_count": chunk_count,
+                "stats": {"file_hash": file_hash, "dedup_hit": False, "dedup_hits": dedup_counts["hits"], "dedup_misses": dedup_counts["misses"], **update_stats, **partition_stats, **pipeline_stats, **summary_stats}
+            }
 
         else:
             raise Exception(f"File not found at {filepath}")
 
     except Exception as e:
         raise Exception(f"Error processing document: {str(e)}")
-   
@@ -1,8 +1,12 @@
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from dotenv import load_dotenv
+import logging
+import re
 import os
 
+logger = logging.getLogger(__name__)
+
 load_dotenv()
 KEY = os.getenv("API_KEY_1")
 
@@ -15,6 +19,11 @@ llm = ChatGoogleGenerativeAI(
     api_key=KEY
 )
 
+# Prompts at least this long, or naming a period or figure, are sent to retrieval as written
+REFINE_QUERY = os.getenv("REFINE_QUERY", "true").lower() == "true"
+REFINE_MIN_WORDS = int(os.getenv("REFINE_MIN_WORDS", "12"))
+SPECIFIC_TERM_PATTERN = re.compile(r'\b(?:(?:19|20)\d{2}|q[1-4]|fy\d{2,4}|h[12])\b|\d+(?:\.\d+)?\s*%', re.IGNORECASE)
+
 def PromptTempplate():
     template = ChatPromptTemplate.from_messages(
         [("assistant",
@@ -47,14 +56,21 @@ def PromptTempplate():
 
 #     return result.content
 
-def RefineQuery(query):
-    template = PromptTempplate()
-    chain = template | llm
-    
+def needs_refinement(query):
+    """Short, vague prompts benefit from refinement, specific ones skip the LLM round-trip."""
+    if not REFINE_QUERY:
+        return False
+    return len(query.split()) < REFINE_MIN_WORDS and not SPECIFIC_TERM_PATTERN.search(query)
+
+async def ARefineQuery(query, llm=llm, callbacks=None):
+    """Rewrite a vague prompt for retrieval, falls back to the original query when the LLM call fails."""
+    chain = PromptTempplate() | llm
+
     try:
-        result = chain.invoke({
+        result = await chain.ainvoke({
             "input": query
-        })
+        }, config={"callbacks": callbacks})
         return result.content
     except Exception as e:
-        return f"An error occurred: {str(e)}"
\ No newline at end of file
+        logger.error(f"Error refining query, using it as written: {str(e)}")
+        return query
\ No newline at end of file
@@ -0,0 +1,211 @@
+from collections import OrderedDict, deque
+from langchain.prompts import PromptTemplate
+import threading
+import asyncio
+import hashlib
+import logging
+import time
+import uuid
+import os
+
+from Models.context_packer import estimate_tokens, CHARS_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+SESSION_MAX = int(os.getenv("SESSION_MAX", "1000"))
+SESSION_IDLE_SECONDS = int(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+# Recent turns are kept verbatim, older ones are rolled into the running summary
+SESSION_RECENT_TURNS = int(os.getenv("SESSION_RECENT_TURNS", "4"))
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "600"))
+SESSION_SUMMARY_TOKENS = int(os.getenv("SESSION_SUMMARY_TOKENS", "250"))
+# Summarize evicted turns with the LLM after the answer is sent, otherwise clip them
+SESSION_SUMMARY_LLM = os.getenv("SESSION_SUMMARY_LLM", "true").lower() == "true"
+# Turns folded into the summary are shortened to this many characters per side
+TURN_LINE_CHARS = 200
+# Traces are readable without authentication, so they only carry a per-process salted hash of the session id
+SESSION_TRACE_SALT = os.urandom(16)
+
+SUMMARY_PROMPT = PromptTemplate(
+    template="""Update the running summary of a conversation about a financial document with the new exchanges below.
+    Keep the figures, entities and open questions the user may refer back to, drop pleasantries.
+    Answer with the updated summary only, in at most {max_words} words.
+
+    Current summary: {summary}
+    New exchanges:
+    {turns}
+    Updated summary:""",
+    input_variables=["summary", "turns", "max_words"])
+
+def clip_head(text, max_tokens):
+    """Keep the end of `text` within `max_tokens`, the most recent part of a summary matters most."""
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    return text if len(text) <= max_chars else "..." + text[-(max_chars - 3):]
+
+def clip_tail(text, max_chars):
+    return text if len(text) <= max_chars else text[:max_chars - 3] + "..."
+
+def session_trace_id(session_id):
+    return hashlib.sha256(SESSION_TRACE_SALT + session_id.encode("utf-8")).hexdigest()[:16]
+
+def turn_text(turn):
+    return f"User: {turn[0]} | Assistant: {turn[1]}"
+
+def turn_line(turn):
+    """Shortened form of a turn on its way into the running summary."""
+    return f"User: {clip_tail(turn[0], TURN_LINE_CHARS)} | Assistant: {clip_tail(turn[1], TURN_LINE_CHARS)}"
+
+class SessionMemory:
+    """Conversation history of one session: a running summary plus the last few turns.
+
+    `buffer` and `save_context` follow the LangChain memory interface used by
+    the chat handlers. Recent turns are kept in full, turns beyond
+    `recent_turns` or the `history_tokens` budget move to `pending` until
+    they are folded into the summary, and `buffer` never exceeds the summary
+    and history budgets together (a single turn over budget is clipped).
+    """
+
+    def __init__(self, session_id, recent_turns=SESSION_RECENT_TURNS, history_tokens=SESSION_HISTORY_TOKENS,
+                 summary_tokens=SESSION_SUMMARY_TOKENS):
+        self.session_id = session_id
+        self.recent_turns = recent_turns
+        self.history_tokens = history_tokens
+        self.summary_tokens = summary_tokens
+        self.summary = ""
+        self.turns = deque()
+        self.pending = []
+        self.turn_count = 0
+        self.last_used = time.monotonic()
+        self.compacting = False
+        self._lock = threading.Lock()
+
+    def _turn_tokens(self):
+        return sum(estimate_tokens(turn_text(turn)) for turn in self.turns)
+
+    @property
+    def buffer(self):
+        with self._lock:
+            earlier = " ".join(part for part in [self.summary] + [turn_line(turn) for turn in self.pending] if part)
+            lines = [f"Summary of earlier conversation: {clip_head(earlier, self.summary_tokens)}"] if earlier else []
+            recent = "\n".join(turn_text(turn) for turn in self.turns)
+            return "\n".join(lines + [clip_tail(recent, self.history_tokens * CHARS_PER_TOKEN)] if recent else lines)
+
+    def save_context(self, inputs, outputs):
+        with self._lock:
+            self.turns.append((inputs["input"], outputs["output"]))
+            self.turn_count += 1
+            while len(self.turns) > 1 and (len(self.turns) > self.recent_turns or self._turn_tokens() > self.history_tokens):
+                self.pending.append(self.turns.popleft())
+
+    def take_pending(self):
+        """Mark the session as compacting and return (summary, pending turns), or None when there is nothing to fold."""
+        with self._lock:
+            if not self.pending or self.compacting:
+                return None
+            self.compacting = True
+            return self.summary, list(self.pending)
+
+    def fold(self, summary, folded_turns):
+        with self._lock:
+            self.summary = clip_head(summary, self.summary_tokens)
+            del self.pending[:folded_turns]
+            self.compacting = False
+
+class SessionStore:
+    """Bounded LRU of live sessions, idle ones expire after `idle_seconds`."""
+
+    def __init__(self, max_sessions=SESSION_MAX, idle_seconds=SESSION_IDLE_SECONDS, summarize_with_llm=SESSION_SUMMARY_LLM):
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.summarize_with_llm = summarize_with_llm
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self._tasks = set()
+        self.created = 0
+        self.evicted = 0
+        self.expired = 0
+        self.summaries = 0
+        self.summary_failures = 0
+
+    def _expire(self, now):
+        for session_id in [session_id for session_id, memory in self._sessions.items() if now - memory.last_used > self.idle_seconds]:
+            del self._sessions[session_id]
+            self.expired += 1
+
+    def get(self, session_id=None):
+        """Return the memory of a session, starting a new one when no id is given.
+
+        Ids are only ever issued here: an unknown, expired or evicted id
+        returns None instead of being adopted as a new session.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            if session_id:
+                memory = self._sessions.get(session_id)
+                if memory is None:
+                    return None
+            else:
+                memory = SessionMemory(uuid.uuid4().hex)
+                self._sessions[memory.session_id] = memory
+                self.created += 1
+                while len(self._sessions) > self.max_sessions:
+                    evicted, _ = self._sessions.popitem(last=False)
+                    self.evicted += 1
+                    logger.info(f"Evicted chat session {evicted}")
+            self._sessions.move_to_end(memory.session_id)
+            memory.last_used = now
+            return memory
+
+    def drop(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    async def acompact(self, memory, llm=None):
+        """Fold a session's evicted turns into its running summary, with the LLM when enabled.
+
+        Turns evicted while a summary is being generated are folded in the
+        next round, until none are left.
+        """
+        while (taken := memory.take_pending()) is not None:
+            await self._fold(memory, *taken, llm=llm)
+
+    async def _fold(self, memory, summary, turns, llm=None):
+        lines = "\n".join(turn_line(turn) for turn in turns)
+        # Without the LLM the clipped turns are appended and `fold` keeps the most recent part
+        clipped = " ".join(part for part in (summary, lines.replace("\n", " ")) if part)
+        if not (self.summarize_with_llm and llm is not None):
+            memory.fold(clipped, len(turns))
+            return
+        try:
+            result = await (SUMMARY_PROMPT | llm).ainvoke(
+                {"summary": summary or "(none)", "turns": lines, "max_words": int(memory.summary_tokens * 0.75)})
+            summary = result.content.strip()
+            with self._lock:
+                self.summaries += 1
+        except Exception as e:
+            logger.warning(f"Session summary fell back to clipped turns: {str(e)}")
+            with self._lock:
+                self.summary_failures += 1
+            summary = clipped
+        memory.fold(summary, len(turns))
+
+    def schedule_compaction(self, memory, llm=None):
+        """Compact a session in the background once its answer is out, no-op without evicted turns."""
+        if memory.pending and not memory.compacting:
+            task = asyncio.create_task(self.acompact(memory, llm=llm))
+            # The event loop only keeps weak references to tasks
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "live_sessions": len(self._sessions),
+                "max_sessions": self.max_sessions,
+                "idle_seconds": self.idle_seconds,
+                "created": self.created,
+                "evicted": self.evicted,
+                "expired": self.expired,
+                "summaries": self.summaries,
+                "summary_failures": self.summary_failures,
+            }
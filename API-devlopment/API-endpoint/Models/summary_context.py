@@ -0,0 +1,88 @@
+import threading
+import logging
+import json
+import time
+import os
+
+import numpy as np
+from sklearn.cluster import KMeans
+from langchain_community.document_loaders import PyMuPDFLoader
+
+from Models.doc_index import CHROMA_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_DIR = os.path.join(CHROMA_DB_PATH, "summaries")
+SUMMARY_MAX_CLUSTERS = 11
+SUMMARY_MIN_PAGE_CHARS = 250
+
+_lock = threading.Lock()
+
+def summary_path(collection_name):
+    return os.path.join(SUMMARY_DIR, f"{collection_name}.json")
+
+def compute_summary_context(embedding_model, file_path):
+    """Pick the page closest to each KMeans cluster of page embeddings, return (context, page numbers)."""
+    loader = PyMuPDFLoader(file_path)
+    pages = loader.load_and_split()
+    logger.info(f"loaded document: {len(pages)}")
+
+    vectors = np.asarray(embedding_model.embed_documents([page.page_content for page in pages]))
+
+    if len(pages) > 20:
+        num_clusters = SUMMARY_MAX_CLUSTERS
+    else:
+        num_clusters = max(int(len(vectors)/2), 1)
+
+    kmeans = KMeans(n_clusters=num_clusters, random_state=100).fit(vectors)
+
+    closest_indices = []
+    for i in range(num_clusters):
+        distances = np.linalg.norm(vectors - kmeans.cluster_centers_[i], axis=1)
+        closest_indices.append(int(np.argmin(distances)))
+
+    selected_docs = [pages[index] for index in sorted(closest_indices)]
+    final_selected_docs = [doc for doc in selected_docs if len(doc.page_content) > SUMMARY_MIN_PAGE_CHARS]
+    logger.info(f"final selected docs: {len(final_selected_docs)}")
+
+    summary_context = "\n\n".join(doc.page_content for doc in final_selected_docs)
+    page_numbers = [doc.metadata.get("page", 0) + 1 for doc in final_selected_docs]
+    return summary_context, page_numbers
+
+def save_summary(collection_name, summary_context, pages, summary=None):
+    os.makedirs(SUMMARY_DIR, exist_ok=True)
+    tmp_path = summary_path(collection_name) + ".tmp"
+    with _lock:
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"context": summary_context, "pages": pages, "summary": summary, "created_at": time.time()}, f)
+        os.replace(tmp_path, summary_path(collection_name))
+
+def load_summary(collection_name):
+    """Return the stored {"context", "pages", "summary"} of a collection, or None."""
+    if not os.path.exists(summary_path(collection_name)):
+        return None
+    try:
+        with _lock:
+            with open(summary_path(collection_name), "r", encoding="utf-8") as f:
+                return json.load(f)
+    except Exception as e:
+        logger.error(f"Error loading summary context for {collection_name}: {str(e)}")
+        return None
+
+def save_generated_summary(collection_name, summary):
+    """Keep the LLM summary next to the context it was generated from."""
+    stored = load_summary(collection_name)
+    if stored is not None:
+        save_summary(collection_name, stored["context"], stored["pages"], summary=summary)
+
+def build_summary(collection_name, file_path, embedding_model):
+    """Compute and store the summary context at ingestion, returning stats for the ingestion job."""
+    start = time.perf_counter()
+    summary_context, pages = compute_summary_context(embedding_model, file_path)
+    save_summary(collection_name, summary_context, pages)
+    return {"summary_pages": len(pages), "summary_seconds": round(time.perf_counter() - start, 3)}
+
+def delete_summary(collection_name):
+    with _lock:
+        if os.path.exists(summary_path(collection_name)):
+            os.remove(summary_path(collection_name))
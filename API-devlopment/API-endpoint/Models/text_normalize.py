@@ -0,0 +1,56 @@
+from typing import List
+import re
+
+from nltk.corpus import stopwords
+from nltk.tokenize import sent_tokenize, NLTKWordTokenizer
+
+STOP_WORDS = frozenset(stopwords.words('english'))
+CONTEXT_WORD_PATTERN = re.compile(r'^[a-zA-Z]+$|^(?=.*[a-zA-Z])(?=.*\d)[a-zA-Z0-9]+$')
+CONTEXT_TOKEN_LIMIT = 30
+
+# Sentences with quotes, apostrophes, back-to-back commas/colons or MacIntyre contractions
+# go through NLTK's Treebank rules, everything else is split by one compiled pattern
+TREEBANK_ONLY_PATTERN = re.compile(r'["\'`«“‘„»”’]|[:,][:,]|(?i:cannot|gimme|gonna|gotta|lemme|wanna)')
+# The Treebank final-period rule: a period after a non-period, followed only by closing brackets
+FINAL_PERIOD_PATTERN = re.compile(r'(?<=[^.])\.(?=[\])}> ]*\s*$)')
+SPLIT_CHARS = r';@#$%&?!*\[\](){}<>\u2012-\u2015'
+TOKEN_PATTERN = re.compile(
+    r'\.{2,}|--|[' + SPLIT_CHARS + r']|[:,](?!\d)'
+    r'|(?:[^\s' + SPLIT_CHARS + r':,.\-]|[:,](?=\d)|\.(?!\.)|-(?!-))+'
+)
+_treebank = NLTKWordTokenizer()
+
+def clean_text(text: str) -> str:
+    return text.lower().replace("\n", " ")
+
+def tokenize_sentence(sentence: str) -> List[str]:
+    """Treebank word tokens of one sentence, as `NLTKWordTokenizer.tokenize` returns them."""
+    if TREEBANK_ONLY_PATTERN.search(sentence):
+        return _treebank.tokenize(sentence)
+    final_period = FINAL_PERIOD_PATTERN.search(sentence)
+    if final_period is None:
+        return TOKEN_PATTERN.findall(sentence)
+    return TOKEN_PATTERN.findall(sentence, 0, final_period.start()) + ["."] + TOKEN_PATTERN.findall(sentence, final_period.end())
+
+def tokenize(text: str) -> List[str]:
+    """Same tokens as NLTK's `word_tokenize`: Punkt sentences, then Treebank words per sentence."""
+    return [token for sentence in sent_tokenize(text) for token in tokenize_sentence(sentence)]
+
+def filter_tokens(text: str) -> List[str]:
+    """Tokenize text and drop English stopwords."""
+    return [token for token in tokenize(text) if token not in STOP_WORDS]
+
+def context_header(tokens: List[str]) -> str:
+    """Words from the first tokens of a chunk that make up its DOCUMENT-CONTEXT header."""
+    return " ".join([word for word in tokens[:CONTEXT_TOKEN_LIMIT] if CONTEXT_WORD_PATTERN.match(word)])
+
+def normalize_batch(texts: List[str]) -> List[tuple]:
+    """Return (context_header, filtered_tokens) for every text."""
+    normalized = []
+    for text in texts:
+        tokens = filter_tokens(text)
+        normalized.append((context_header(tokens), tokens))
+    return normalized
+
+def format_context_chunk(doc_context: str, tokens: List[str]) -> str:
+    return f'DOCUMENT-CONTEXT:[{doc_context}]. DOCUMENT-CONTENT: {" ".join(tokens)}'
@@ -0,0 +1,169 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from collections import deque
+import threading
+import logging
+import random
+import queue
+import json
+import time
+import uuid
+import os
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+logger = logging.getLogger(__name__)
+
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "200"))
+# Share of traces also appended to TRACE_FILE, every trace stays in the in-memory buffer
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_FIELD_CHARS = int(os.getenv("TRACE_FIELD_CHARS", "300"))
+TRACE_LIST_ITEMS = 20
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join("logs", "traces.jsonl"))
+TRACE_WRITE_QUEUE_SIZE = 1000
+
+_current_trace = ContextVar("current_trace", default=None)
+
+def truncate(value):
+    """Cap strings and lists so a trace never carries whole documents."""
+    if isinstance(value, str):
+        return value if len(value) <= TRACE_FIELD_CHARS else value[:TRACE_FIELD_CHARS] + f"...(+{len(value) - TRACE_FIELD_CHARS} chars)"
+    if isinstance(value, (list, tuple)):
+        return [truncate(item) for item in value[:TRACE_LIST_ITEMS]]
+    if isinstance(value, dict):
+        return {key: truncate(item) for key, item in value.items()}
+    if hasattr(value, "item"):
+        # NumPy scalars such as cross-encoder scores
+        value = value.item()
+    if isinstance(value, float):
+        return round(value, 4)
+    return value
+
+class Tracer:
+    """Keeps recent per-request trace records in a ring buffer.
+
+    Records are truncated when they are finished, and a sampled share is
+    handed to a writer thread that appends them to a JSON lines file. A full
+    write queue drops the record instead of blocking the request.
+    """
+
+    def __init__(self, buffer_size=TRACE_BUFFER_SIZE, sample_rate=TRACE_SAMPLE_RATE, trace_file=TRACE_FILE):
+        self.sample_rate = sample_rate
+        self.trace_file = trace_file
+        self._buffer = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=TRACE_WRITE_QUEUE_SIZE)
+        self._writer = None
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+
+    @contextmanager
+    def trace(self, name, **fields):
+        """Open a trace for the current request, later `annotate` calls add to it."""
+        record = {"trace_id": uuid.uuid4().hex[:12], "name": name, "started_at": time.time(), **fields}
+        token = _current_trace.set(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        except Exception as e:
+            record["error"] = str(e)
+            raise
+        finally:
+            record["total_ms"] = (time.perf_counter() - start) * 1000
+            try:
+                _current_trace.reset(token)
+            except ValueError:
+                # A streamed response can be closed from another context after the client leaves
+                pass
+            self.record(record)
+
+    def record(self, record):
+        record = truncate(record)
+        with self._lock:
+            self._buffer.append(record)
+            self.recorded += 1
+        if self.sample_rate > 0 and random.random() < self.sample_rate:
+            self._ensure_writer()
+            try:
+                self._queue.put_nowait(record)
+            except queue.Full:
+                with self._lock:
+                    self.dropped += 1
+
+    def _ensure_writer(self):
+        with self._lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name="trace-writer", daemon=True)
+                self._writer.start()
+
+    def _write_loop(self):
+        os.makedirs(os.path.dirname(self.trace_file) or ".", exist_ok=True)
+        while True:
+            record = self._queue.get()
+            if record is None:
+                return
+            try:
+                with open(self.trace_file, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, default=str) + "\n")
+                with self._lock:
+                    self.written += 1
+            except Exception as e:
+                logger.error(f"Error writing trace: {str(e)}")
+
+    def recent(self, limit=50):
+        with self._lock:
+            return list(self._buffer)[-limit:][::-1]
+
+    def stats(self):
+        with self._lock:
+            return {
+                "buffered": len(self._buffer),
+                "buffer_size": self._buffer.maxlen,
+                "recorded": self.recorded,
+                "written": self.written,
+                "dropped": self.dropped,
+                "sample_rate": self.sample_rate,
+            }
+
+    def shutdown(self):
+        if self._writer is not None:
+            self._queue.put(None)
+            self._writer.join(timeout=5)
+            self._writer = None
+
+tracer = Tracer()
+
+class LLMCallCounter(BaseCallbackHandler):
+    """Counts the LLM calls made while handling one request."""
+
+    run_inline = True
+
+    def __init__(self):
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def _count(self):
+        with self._lock:
+            self.calls += 1
+
+    def on_llm_start(self, serialized, prompts, **kwargs):
+        self._count()
+
+    def on_chat_model_start(self, serialized, messages, **kwargs):
+        self._count()
+
+def annotate(**fields):
+    """Add fields to the trace of the current request, a no-op outside a trace."""
+    record = _current_trace.get()
+    if record is not None:
+        record.update(fields)
+
+@contextmanager
+def timed(field):
+    """Store the elapsed milliseconds of a block under `field` on the current trace."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        annotate(**{field: (time.perf_counter() - start) * 1000})
@@ -0,0 +1,342 @@
+import threading
+import logging
+import shutil
+import uuid
+import json
+import os
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.vectorstores import VectorStore
+from langchain_chroma import Chroma
+
+from Models.doc_index import CHROMA_DB_PATH
+
+logger = logging.getLogger(__name__)
+
+# "chroma" keeps collections in chroma-db, "flat" stores them as memory-mapped NumPy matrices in flat-db
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+FLAT_DB_PATH = os.path.join(os.path.dirname(__file__), "../flat-db")
+# Flat collections can keep int8 vectors resident and re-score a shortlist with the float32 file
+VECTOR_QUANTIZE = os.getenv("VECTOR_QUANTIZE", "false").lower() == "true"
+RESCORE_SHORTLIST = int(os.getenv("RESCORE_SHORTLIST", "40"))
+QUANTIZED_BLOCK_ROWS = 4096
+
+def quantize_int8(vectors):
+    """Symmetric per-vector int8 quantization, returns (int8 matrix, float32 scales)."""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    scales = np.abs(vectors).max(axis=1) / 127 if len(vectors) else np.zeros(0, dtype=np.float32)
+    scales = np.where(scales == 0, 1, scales).astype(np.float32)
+    return np.round(vectors / scales[:, None]).astype(np.int8), scales
+
+class FlatVectorStore(VectorStore):
+    """Exact nearest-neighbour store for a single report.
+
+    Normalized float32 embeddings live in `vectors.npy`, memory-mapped for
+    search, and ids, texts and metadata in a `meta.json` sidecar. A query is
+    one matrix-vector product followed by a partial sort. Writes are
+    buffered and flushed on `persist()` or before the next read.
+
+    A quantized store also keeps int8 vectors with per-vector scales in
+    memory. Queries score them first, then re-score a shortlist of
+    `RESCORE_SHORTLIST` candidates exactly from the memory-mapped float32
+    file, which stays on disk apart from the rows it touches.
+    """
+
+    def __init__(self, collection_name, embedding_function, persist_directory=FLAT_DB_PATH, quantized=False):
+        self.collection_name = collection_name
+        self.embedding_function = embedding_function
+        self.quantized = quantized
+        self.path = os.path.join(persist_directory, collection_name)
+        self.vectors_path = os.path.join(self.path, "vectors.npy")
+        self.int8_path = os.path.join(self.path, "vectors_int8.npy")
+        self.scales_path = os.path.join(self.path, "scales.npy")
+        self.meta_path = os.path.join(self.path, "meta.json")
+
+        self._lock = threading.RLock()
+        self._vectors = None
+        self._int8 = None
+        self._scales = None
+        self._ids = []
+        self._documents = []
+        self._metadatas = []
+        self._pending = []
+        self._load()
+
+    @property
+    def embeddings(self):
+        return self.embedding_function
+
+    def _load(self):
+        if not os.path.exists(self.meta_path):
+            return
+        with open(self.meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self._ids = meta["ids"]
+        self._documents = meta["documents"]
+        self._metadatas = meta["metadatas"]
+        self.quantized = meta.get("quantized", False)
+        if self._ids:
+            self._map_vectors()
+
+    def _map_vectors(self):
+        self._vectors = np.load(self.vectors_path, mmap_mode="r")
+        if self.quantized:
+            self._int8 = np.load(self.int8_path)
+            self._scales = np.load(self.scales_path)
+
+    def persist(self):
+        """Write buffered vectors and metadata to disk and remap the vector file."""
+        with self._lock:
+            if not self._pending:
+                return
+            parts = ([np.asarray(self._vectors)] if self._vectors is not None else []) + self._pending
+            self._write(np.concatenate(parts).astype(np.float32))
+            self._pending = []
+
+    def _write(self, vectors):
+        os.makedirs(self.path, exist_ok=True)
+        # Drop the old mapping before the file underneath it is replaced
+        self._vectors, self._int8, self._scales = None, None, None
+        tmp_vectors_path = self.vectors_path + ".tmp.npy"
+        np.save(tmp_vectors_path, vectors)
+        os.replace(tmp_vectors_path, self.vectors_path)
+        if self.quantized:
+            int8_vectors, scales = quantize_int8(vectors)
+            np.save(self.int8_path, int8_vectors)
+            np.save(self.scales_path, scales)
+        tmp_meta_path = self.meta_path + ".tmp"
+        with open(tmp_meta_path, "w", encoding="utf-8") as f:
+            json.dump({"ids": self._ids, "documents": self._documents, "metadatas": self._metadatas, "quantized": self.quantized}, f)
+        os.replace(tmp_meta_path, self.meta_path)
+        if len(vectors):
+            self._map_vectors()
+
+    @staticmethod
+    def _normalize(vectors):
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [uuid.uuid4().hex for _ in texts]
+        vectors = self._normalize(self.embedding_function.embed_documents(texts))
+
+        with self._lock:
+            existing = set(ids) & set(self._ids)
+            if existing:
+                self.delete(ids=list(existing))
+            self._ids.extend(ids)
+            self._documents.extend(texts)
+            self._metadatas.extend(metadatas)
+            self._pending.append(vectors)
+        return ids
+
+    def delete(self, ids=None, **kwargs):
+        with self._lock:
+            self.persist()
+            remove = set(ids or [])
+            keep = [position for position, chunk_id in enumerate(self._ids) if chunk_id not in remove]
+            if len(keep) == len(self._ids):
+                return
+            vectors = np.asarray(self._vectors)[keep] if self._vectors is not None else np.zeros((0, 0), dtype=np.float32)
+            self._ids = [self._ids[position] for position in keep]
+            self._documents = [self._documents[position] for position in keep]
+            self._metadatas = [self._metadatas[position] for position in keep]
+            self._write(vectors)
+
+    def delete_collection(self):
+        with self._lock:
+            self._vectors, self._int8, self._scales = None, None, None
+            self._ids, self._documents, self._metadatas, self._pending = [], [], [], []
+            shutil.rmtree(self.path, ignore_errors=True)
+
+    def count(self):
+        with self._lock:
+            return len(self._ids)
+
+    def get(self, ids=None, **kwargs):
+        """Chroma-compatible `get` returning ids, documents and metadatas."""
+        with self._lock:
+            if ids is None:
+                positions = range(len(self._ids))
+            else:
+                lookup = {chunk_id: position for position, chunk_id in enumerate(self._ids)}
+                positions = [lookup[chunk_id] for chunk_id in ids if chunk_id in lookup]
+            return {
+                "ids": [self._ids[position] for position in positions],
+                "documents": [self._documents[position] for position in positions],
+                "metadatas": [self._metadatas[position] for position in positions],
+            }
+
+    @staticmethod
+    def _top_k(scores, k):
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def _approximate_scores(self, query_vector):
+        # Score int8 rows block by block so the float copy stays small
+        scores = np.empty(len(self._int8), dtype=np.float32)
+        for start in range(0, len(self._int8), QUANTIZED_BLOCK_ROWS):
+            block = self._int8[start:start + QUANTIZED_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + len(block)] = (block @ query_vector) * self._scales[start:start + len(block)]
+        return scores
+
+    def _search(self, query_vector, k, exact=False):
+        with self._lock:
+            self.persist()
+            if self._vectors is None:
+                return [], []
+            query_vector = self._normalize(query_vector)
+            if self.quantized and not exact:
+                # Sorted positions keep the memory-mapped reads sequential
+                shortlist = np.sort(self._top_k(self._approximate_scores(query_vector), max(k, RESCORE_SHORTLIST)))
+                shortlist_scores = np.asarray(self._vectors[shortlist]) @ query_vector
+                top = self._top_k(shortlist_scores, k)
+                return shortlist[top], shortlist_scores[top]
+            scores = self._vectors @ query_vector
+            top = self._top_k(scores, k)
+            return top, scores[top]
+
+    def _to_document(self, position):
+        return Document(id=self._ids[position], page_content=self._documents[position], metadata=self._metadatas[position] or {})
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4, **kwargs):
+        """Return (document, distance) pairs closest first, distance is squared L2 like Chroma's default."""
+        positions, scores = self._search(embedding, k)
+        return [(self._to_document(position), float(2 - 2 * score)) for position, score in zip(positions, scores)]
+
+    def similarity_search_by_vector(self, embedding, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_by_vector_with_relevance_scores(embedding, k=k)]
+
+    def similarity_search_with_score(self, query, k=4, **kwargs):
+        return self.similarity_search_by_vector_with_relevance_scores(self.embedding_function.embed_query(query), k=k)
+
+    def similarity_search(self, query, k=4, **kwargs):
+        return [doc for doc, _ in self.similarity_search_with_score(query, k=k)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    def footprint(self):
+        """Bytes of vectors on disk and of vectors kept resident for the first search pass."""
+        with self._lock:
+            vector_bytes = os.path.getsize(self.vectors_path) if os.path.exists(self.vectors_path) else 0
+            meta_bytes = os.path.getsize(self.meta_path) if os.path.exists(self.meta_path) else 0
+            float_resident = self._vectors.nbytes if self._vectors is not None else 0
+            resident = self._int8.nbytes + self._scales.nbytes if self.quantized and self._int8 is not None else float_resident
+            return {
+                "vector_bytes": vector_bytes,
+                "metadata_bytes": meta_bytes,
+                "resident_vector_bytes": int(resident),
+                "resident_bytes_saved": int(float_resident - resident),
+            }
+
+    def quantization_report(self, sample_size=100, k=10):
+        """Recall@k of the quantized search against exact float search, using stored vectors as queries."""
+        with self._lock:
+            self.persist()
+            if not self.quantized or self._vectors is None:
+                return None
+            rng = np.random.default_rng(0)
+            sample = rng.choice(len(self._ids), size=min(sample_size, len(self._ids)), replace=False)
+            recalls = []
+            for position in sample:
+                query_vector = np.asarray(self._vectors[position])
+                exact, _ = self._search(query_vector, k, exact=True)
+                approximate, _ = self._search(query_vector, k)
+                recalls.append(len(set(exact) & set(approximate)) / len(exact))
+            return {f"recall_at_{k}": round(float(np.mean(recalls)), 4), **self.footprint()}
+
+    @classmethod
+    def from_texts(cls, texts, embedding, metadatas=None, ids=None, collection_name="flat", **kwargs):
+        store = cls(collection_name=collection_name, embedding_function=embedding)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        store.persist()
+        return store
+
+
+def open_vector_store(collection_name, embedding_model, backend=None, quantized=False):
+    """Open a persisted collection on the given backend without re-embedding anything.
+
+    `quantized` only applies to new flat collections, existing ones keep their stored mode.
+    """
+    backend = backend or VECTOR_BACKEND
+    if backend == "flat":
+        return FlatVectorStore(collection_name=collection_name, embedding_function=embedding_model, quantized=quantized)
+    return Chroma(
+        collection_name=collection_name,
+        embedding_function=embedding_model,
+        persist_directory=CHROMA_DB_PATH
+    )
+
+def vector_count(vector_store):
+    if isinstance(vector_store, FlatVectorStore):
+        return vector_store.count()
+    return vector_store._collection.count()
+
+def create_vector_store(collection_name, embedding_model, backend=None, quantized=None):
+    """Open an empty collection, dropping any previous contents stored under the same name."""
+    quantized = VECTOR_QUANTIZE if quantized is None else quantized
+    vector_store = open_vector_store(collection_name, embedding_model, backend=backend, quantized=quantized)
+    if vector_count(vector_store) > 0:
+        logger.info(f"Replacing existing collection {collection_name}")
+        vector_store.delete_collection()
+        vector_store = open_vector_store(collection_name, embedding_model, backend=backend, quantized=quantized)
+    if isinstance(vector_store, FlatVectorStore):
+        vector_store.quantized = quantized
+    elif quantized:
+        logger.warning("Quantized vectors are only supported by the flat backend, storing float vectors")
+    return vector_store
+
+def staging_collection_name(collection_name):
+    """Collection a full re-ingest is built in before it replaces `collection_name`."""
+    return f"{collection_name}-staging"
+
+def promote_vector_store(vector_store, collection_name, embedding_model):
+    """Replace `collection_name` with a fully built staging collection and return the promoted store.
+
+    The previous contents keep serving reads until the new collection is
+    complete, a failed ingestion leaves them untouched.
+    """
+    if isinstance(vector_store, FlatVectorStore):
+        with vector_store._lock:
+            vector_store.persist()
+            os.makedirs(vector_store.path, exist_ok=True)
+            # Drop the mappings before the directory underneath them moves
+            vector_store._vectors, vector_store._int8, vector_store._scales = None, None, None
+            persist_directory = os.path.dirname(vector_store.path)
+            live_path = os.path.join(persist_directory, collection_name)
+            retired_path = f"{live_path}-retired"
+            shutil.rmtree(retired_path, ignore_errors=True)
+            if os.path.exists(live_path):
+                os.replace(live_path, retired_path)
+            os.replace(vector_store.path, live_path)
+            shutil.rmtree(retired_path, ignore_errors=True)
+        return FlatVectorStore(collection_name=collection_name, embedding_function=embedding_model, persist_directory=persist_directory)
+
+    live_store = open_vector_store(collection_name, embedding_model, backend="chroma")
+    live_store.delete_collection()
+    vector_store._collection.modify(name=collection_name)
+    return open_vector_store(collection_name, embedding_model, backend="chroma")
+
+def persist_vector_store(vector_store):
+    if isinstance(vector_store, FlatVectorStore):
+        vector_store.persist()
+
+def quantization_stats(vector_store):
+    """Memory saved and recall@10 of a quantized collection, None for float collections."""
+    if isinstance(vector_store, FlatVectorStore):
+        return vector_store.quantization_report()
+    return None
+
+def backend_of(vector_store):
+    return "flat" if isinstance(vector_store, FlatVectorStore) else "chroma"
+
+def collection_name_of(vector_store):
+    if isinstance(vector_store, FlatVectorStore):
+        return vector_store.collection_name
+    return vector_store._collection.name
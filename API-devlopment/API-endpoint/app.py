@@ -1,38 +1,62 @@
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import Response
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 from contextlib import asynccontextmanager
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from pathlib import Path
-import shutil
+import logging.handlers
+import hashlib
+import asyncio
+import json
+import time
 import logging
+import queue
 import sys
 import os
 import base64
+import uuid
+
+try:
+    from python_multipart.multipart import MultipartParser, parse_options_header
+except ImportError:
+    # python-multipart before 0.0.13
+    from multipart.multipart import MultipartParser, parse_options_header
 
-from langchain_huggingface import HuggingFaceEmbeddings
-from sentence_transformers import CrossEncoder
-from langchain.memory import ConversationBufferWindowMemory
 
-from Models.refine_query import RefineQuery
+from Models.refine_query import ARefineQuery, needs_refinement, llm as refine_llm
 from Models.process_doc import process_document
-from Models.find_context import get_context
-from Models.handle_doc_chat import get_llm_response
+from Models.find_context import get_context, query_cache, reranker, retrieval_stats
+from Models.context_packer import context_packer
+from Models.vector_backend import collection_name_of, vector_count
+from Models.document_registry import DocumentRegistry
+from Models.handle_doc_chat import aget_llm_response, astream_llm_response, agent_pool, llm as chat_llm
 from Models.data_visualize import visualize_data
+from Models.ingest_jobs import IngestionJobQueue
+from Models.embedding_cache import CachedEmbeddings
+from Models.answer_cache import answer_cache
+from Models.session_memory import SessionStore, session_trace_id
+from Models.tracing import tracer, annotate, timed, LLMCallCounter
+from Models.inference import load_embedding_model, load_cross_encoder, cache_model_name, warmup, INFERENCE_BACKEND, INFERENCE_THREADS
 
 # Create logs directory if it doesn't exist
 if not os.path.exists('logs'):
     os.makedirs('logs')
 
 # Set up logging to file
+# Request threads only enqueue records, a listener thread does the file and console writes
+log_listener = None
 try:
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler('logs/fatapi_main.log', mode='a', encoding='utf-8'),
-            logging.StreamHandler(sys.stdout)  # This will also print to console
-        ]
-    )
+    log_formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    log_handlers = [
+        logging.FileHandler('logs/fatapi_main.log', mode='a', encoding='utf-8'),
+        logging.StreamHandler(sys.stdout)  # This will also print to console
+    ]
+    for handler in log_handlers:
+        handler.setFormatter(log_formatter)
+    log_queue = queue.SimpleQueue()
+    log_listener = logging.handlers.QueueListener(log_queue, *log_handlers, respect_handler_level=True)
+    log_listener.start()
+    logging.basicConfig(level=logging.INFO, handlers=[logging.handlers.QueueHandler(log_queue)])
     logger = logging.getLogger(__name__)
     logger.info("Logging configured successfully")
 except Exception as e:
@@ -48,25 +72,42 @@ except Exception as e:
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     try:
-        embedding_model = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        cross_encoder_model = CrossEncoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
-        memory = ConversationBufferWindowMemory(k=10, memory_key="chat_history", return_messages=True, output_key="output")
+        embedding_model_name = "sentence-transformers/all-MiniLM-L6-v2"
+        # INFERENCE_BACKEND selects torch, onnx or onnx-int8 for both models
+        embedding_model = CachedEmbeddings(load_embedding_model(embedding_model_name), model_name=cache_model_name(embedding_model_name))
+        cross_encoder_model = load_cross_encoder("cross-encoder/ms-marco-MiniLM-L-6-v2")
+        warmup(embedding_model.embedding_model, cross_encoder_model)
+        logger.info(f"Loaded models on the {INFERENCE_BACKEND} backend with {INFERENCE_THREADS} threads")
 
         app.state.embedding_model = embedding_model
         app.state.cross_encoder_model = cross_encoder_model
-        app.state.memory = memory
-        app.state.chat_file_name = None
+        # Chat history is kept per session_id, bounded in sessions and in prompt tokens
+        app.state.sessions = SessionStore()
+        # LLMs are read from app.state per request, so a fake chat model can be swapped in for load tests
+        app.state.chat_llm = chat_llm
+        app.state.refine_llm = refine_llm
         app.state.visualize_file_name = None
-        app.state.vector_store = None
+        # Agents pin the vector store their tools search, so they go when the registry closes it
+        app.state.documents = DocumentRegistry(embedding_model, on_evict=agent_pool.discard)
+        app.state.ingest_jobs = IngestionJobQueue()
 
         yield
     finally:
+        if getattr(app.state, "ingest_jobs", None):
+            app.state.ingest_jobs.shutdown()
+        app.state.ingest_jobs = None
+        if isinstance(getattr(app.state, "embedding_model", None), CachedEmbeddings):
+            app.state.embedding_model.flush()
         app.state.embedding_model = None
         app.state.cross_encoder_model = None
-        app.state.memory = None
-        app.state.chat_file_name = None
+        app.state.sessions = None
+        app.state.chat_llm = None
+        app.state.refine_llm = None
         app.state.visualize_file_name = None
-        app.state.vector_store = None
+        app.state.documents = None
+        tracer.shutdown()
+        if log_listener:
+            log_listener.stop()
 
 # Initialize FastAPI app
 app = FastAPI(lifespan=lifespan)
@@ -81,71 +122,195 @@ async def startup_event():
     import signal
     signal.signal(signal.SIGINT, receive_signal)
     
-    # Initialize vector store from persist directory if it exists
+    # Previously ingested documents are reopened on demand by the document registry
     try:
-        chroma_db_path = os.path.join(os.path.dirname(__file__), "Models", "../chroma-db")
-        if os.path.exists(chroma_db_path):
-            logger.info("Found existing chroma-db directory")
-            # We'll initialize the vector store when needed in the endpoints
-            app.state.vector_store = None
-        else:
-            logger.info("No existing chroma-db directory found")
-            app.state.vector_store = None
+        logger.info(f"Found {len(app.state.documents.list())} previously ingested documents")
     except Exception as e:
         logger.error(f"Error during startup: {str(e)}")
-        app.state.vector_store = None
     
 
 #### recieve document and process it
 class DocumentResponse(BaseModel):
     response: str;
     status: str
+    job_id: str | None = None
+
+class IngestionStatusResponse(BaseModel):
+    job_id: str
+    file_name: str
+    status: str
+    stage: str
+    percent: int
+    chunk_count: int | None = None
+    error: str | None = None
+    stats: dict = {}
 
 # Create temp directory if it doesn't exist
 UPLOAD_DIR = Path("./upload_files")
 UPLOAD_DIR.mkdir(exist_ok=True)
 
-async def save_uploaded_file(file: UploadFile) -> tuple[str, str]:
+MAX_UPLOAD_MB = int(os.getenv("MAX_UPLOAD_MB", "100"))
+
+UPLOAD_FORM_FIELD = "file"
+# Room for the multipart boundaries and part headers around the file itself
+MULTIPART_OVERHEAD_BYTES = 64 * 1024
+
+def upload_too_large():
+    return HTTPException(
+        status_code=413,
+        detail={"error": "File Too Large", "message": f"Uploaded file exceeds the {MAX_UPLOAD_MB} MB limit."})
+
+def invalid_upload(message):
+    return HTTPException(status_code=400, detail={"error": "Invalid Upload", "message": message})
+
+def multipart_events(boundary):
+    """A multipart parser whose callbacks append ("begin", headers), ("data", bytes) and ("end", None) to a list."""
+    events = []
+    header = {"field": b"", "value": b""}
+    headers = {}
+
+    def on_header_field(data, start, end):
+        header["field"] += data[start:end]
+
+    def on_header_value(data, start, end):
+        header["value"] += data[start:end]
+
+    def on_header_end():
+        headers[header["field"].lower()] = header["value"]
+        header["field"] = header["value"] = b""
+
+    def on_headers_finished():
+        events.append(("begin", dict(headers)))
+        headers.clear()
+
+    parser = MultipartParser(boundary, callbacks={
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": lambda data, start, end: events.append(("data", data[start:end])),
+        "on_part_end": lambda: events.append(("end", None)),
+    })
+    return parser, events
+
+async def save_uploaded_file(request: Request) -> tuple[str, str, str]:
+    """Stream the "file" part of a multipart upload to disk, enforcing MAX_UPLOAD_MB and hashing it on the fly.
+
+    The request body is parsed as it arrives instead of being spooled first,
+    so an oversized upload is rejected by its Content-Length or as soon as
+    the cap is crossed, and the file is written to disk once. Returns the
+    upload's own staging path, its file name and its sha256: the caller moves
+    it to `upload_files/<file name>` when it is safe to replace that file.
+    """
+    max_bytes = MAX_UPLOAD_MB * 1024 * 1024
+    content_length = request.headers.get("content-length", "")
+    if content_length.isdigit() and int(content_length) > max_bytes + MULTIPART_OVERHEAD_BYTES:
+        raise upload_too_large()
+
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    if content_type != b"multipart/form-data" or not params.get(b"boundary"):
+        raise invalid_upload(f"Send the document as multipart/form-data in a '{UPLOAD_FORM_FIELD}' field.")
+    parser, events = multipart_events(params[b"boundary"])
+
+    file_name = partial_path = buffer = None
+    in_file = completed = saved = False
+    digest = hashlib.sha256()
+    size = received = 0
+
     try:
-        # Create full file path
-        file_path = UPLOAD_DIR / file.filename
-        
-        # Save uploaded file
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-            
-        return str(file_path), file.filename
-        
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_bytes + MULTIPART_OVERHEAD_BYTES:
+                raise upload_too_large()
+            parser.write(chunk)
+            for kind, payload in events:
+                if kind == "begin":
+                    _, disposition = parse_options_header(payload.get(b"content-disposition", b""))
+                    in_file = (file_name is None and disposition.get(b"name") == UPLOAD_FORM_FIELD.encode()
+                               and bool(disposition.get(b"filename")))
+                    if in_file:
+                        file_name = Path(disposition[b"filename"].decode("utf-8", "replace")).name
+                        # Concurrent uploads of the same file name each get their own partial file
+                        partial_path = UPLOAD_DIR / f"{file_name}.{uuid.uuid4().hex}.part"
+                        buffer = await run_in_threadpool(partial_path.open, "wb")
+                elif kind == "data" and in_file:
+                    size += len(payload)
+                    if size > max_bytes:
+                        raise upload_too_large()
+                    digest.update(payload)
+                    await run_in_threadpool(buffer.write, payload)
+                elif kind == "end" and in_file:
+                    in_file, completed = False, True
+            events.clear()
+        parser.finalize()
+
+        if not completed:
+            raise invalid_upload(f"No file found in the '{UPLOAD_FORM_FIELD}' field of the upload.")
+        await run_in_threadpool(buffer.close)
+        saved = True
+        return str(partial_path), file_name, digest.hexdigest()
+
+    except HTTPException:
+        raise
+
     except Exception as e:
         logger.error(f"Error saving file: {str(e)}")
         raise Exception(f"Could not save file: {str(e)}")
 
-@app.post("/process-document", response_model=DocumentResponse)
-async def upload_and_process_document(file: UploadFile = File(...)):
+    finally:
+        if buffer is not None and not buffer.closed:
+            await run_in_threadpool(buffer.close)
+        if partial_path is not None and not saved:
+            partial_path.unlink(missing_ok=True)
+
+def run_ingestion(file_path, chat_file_name, progress, update=False, file_hash=None, quantize=None):
+    """Job body executed on the ingestion worker pool."""
+    logger.info("Starting document processing...")
+    result = process_document(file_path, chat_file_name, app.state.embedding_model, app.state.cross_encoder_model, progress=progress, update=update, file_hash=file_hash, quantize=quantize)
+    logger.info(f"Document processing completed: {result['stats']}")
+
+    if not result["stats"]["dedup_hit"]:
+        # Verify vector store has documents
+        count = vector_count(result["vector_store"])
+        logger.info(f"Documents in vector store: {count}")
+        result["chunk_count"] = count
+
+    return result
+
+def on_ingestion_complete(job):
+    # Cached retrievals for this collection may describe its previous contents
+    collection_name = collection_name_of(job.result["vector_store"])
+    query_cache.invalidate(collection_name)
+    reranker.invalidate(collection_name)
+    answer_cache.invalidate(collection_name)
+    agent_pool.invalidate(collection_name)
+    # The new document becomes the default for /doc-chat requests without a document_id
+    job.result["stats"]["document_id"] = app.state.documents.register(collection_name, job.result["vector_store"])
+
+UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {"multipart/form-data": {"schema": {
+        "type": "object",
+        "required": [UPLOAD_FORM_FIELD],
+        "properties": {UPLOAD_FORM_FIELD: {"type": "string", "format": "binary"}},
+    }}},
+}
+
+@app.post("/process-document", response_model=DocumentResponse, openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def upload_and_process_document(request: Request, update: bool = False, quantize: bool | None = None):
     try:
-        # Save the file
-        file_path, chat_file_name = await save_uploaded_file(file)
-        app.state.chat_file_name = chat_file_name
+        # Save the file while its body streams in, the job moves it into place under the collection lock
+        file_path, chat_file_name, file_hash = await save_uploaded_file(request)
         logger.info(f"File received: {chat_file_name} at {file_path}")
         
         if os.path.exists(file_path):
-            try:
-                logger.info("Starting document processing...")
-                vector_store = process_document(file_path, chat_file_name, app.state.embedding_model, app.state.cross_encoder_model)
-                logger.info("Document processing completed")
-                
-                # Verify vector store has documents
-                count = len(vector_store.get()['ids'])
-                logger.info(f"Documents in vector store: {count}")
-                
-                app.state.vector_store = vector_store
-                return DocumentResponse(status="success" ,response=f"Successfully processed file {chat_file_name}. Added {count} documents to vector store.")
-            except Exception as proc_error:
-                logger.error(f"Document Processing error: {str(proc_error)}")
-                raise HTTPException(
-                    status_code=404, 
-                    detail="Error in document processing.")
-                # return DocumentResponse(status="error", response=str(proc_error))
+            job = app.state.ingest_jobs.submit(
+                file_path=file_path,
+                file_name=chat_file_name,
+                run=lambda progress: run_ingestion(file_path, chat_file_name, progress, update=update, file_hash=file_hash, quantize=quantize),
+                on_complete=on_ingestion_complete
+            )
+            return DocumentResponse(status="queued", job_id=job.job_id, response=f"File {chat_file_name} queued for processing. Poll /process-document/{job.job_id} for progress.")
         else:
             logger.error("file was not saved successfully in server for processing.")
             raise HTTPException(
@@ -163,77 +328,241 @@ async def upload_and_process_document(file: UploadFile = File(...)):
             status_code=500,
             detail={"error": "Internal Server Error", "message": "An unexpected error occurred. Please try again later."}
         )
+
+@app.get("/process-document/{job_id}", response_model=IngestionStatusResponse)
+async def get_ingestion_status(job_id: str):
+    job = app.state.ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(
+            status_code=404,
+            detail={"error": "Job Not Found", "message": f"No ingestion job with id {job_id}."})
+
+    return IngestionStatusResponse(**job.to_dict())
     
 
 ### process query and send LLM response
 class ChatRequest(BaseModel):
     prompt: str
+    document_id: str | None = None
+    session_id: str | None = None
+    candidate_k: int | None = Field(default=None, gt=0)
+    rerank_depth: int | None = Field(default=None, gt=0)
+    top_k: int | None = Field(default=None, gt=0)
 
 class ChatResponse(BaseModel):
     response: str
+    document_id: str | None = None
+    session_id: str | None = None
+    llm_calls: int | None = None
 
-@app.post("/doc-chat", response_model=ChatResponse)
-async def Chat(request: ChatRequest):
+chat_stats = {"requests": 0, "llm_calls": 0, "direct_answers": 0, "agent_answers": 0, "cached_answers": 0}
+
+def open_chat_session(session_id):
+    """Return the memory of the requested session, or of a new one when no id is sent."""
+    memory = app.state.sessions.get(session_id)
+    if memory is None:
+        raise HTTPException(
+            status_code=404,
+            detail={"error": "Session Not Found", "message": f"No live chat session with id {session_id}. Send the question without a session_id to start a new one."})
+    return memory
+
+async def open_chat_document(request: ChatRequest):
+    """Resolve the requested (or default) document and return it with its open vector store."""
+    # The first lookup reads the ingest index from disk, keep it off the event loop
+    document = await run_in_threadpool(app.state.documents.resolve, request.document_id)
+    if document is None and request.document_id:
+        raise HTTPException(
+            status_code=404,
+            detail={"error": "Document Not Found", "message": f"No processed document with id {request.document_id}."})
+    vector_store = await run_in_threadpool(app.state.documents.open, document) if document else None
+    annotate(document_id=document["document_id"] if document else None)
+
+    if not (vector_store and app.state.embedding_model and app.state.cross_encoder_model):
+        logger.error("Required components not initialized")
+        raise HTTPException(
+            status_code=500, 
+            detail={"error": "Initialization Error", "message": "System is not properly initialized. Please ensure a document is processed first."})
+    return document, vector_store
+
+def answer_cacheable(memory):
+    """Cached answers are only shared between first questions, a follow-up depends on its session's history."""
+    return memory.turn_count == 0
+
+async def retrieve_and_refine(request: ChatRequest, document, vector_store, memory, llm_calls: LLMCallCounter):
+    """Return (context, refined query, query vector, context confidence, cached answer entry or None).
+
+    The prompt is refined while retrieval runs on the raw prompt, a cached
+    answer to a near-identical question cancels the refinement.
+    """
+    cacheable = answer_cacheable(memory)
+    logger.info("Processing user query...")
+    refine_task = asyncio.create_task(ARefineQuery(request.prompt, llm=app.state.refine_llm, callbacks=[llm_calls])) if needs_refinement(request.prompt) else None
+    annotate(refine_skipped=refine_task is None)
     try:
-        vector_store = app.state.vector_store
-        embedding_model = app.state.embedding_model
-        cross_encoder_model = app.state.cross_encoder_model
-        memory = app.state.memory
-        chat_file_name = app.state.chat_file_name
-
-        if vector_store and embedding_model and cross_encoder_model:
-            logger.info("Processing user query...")
-            context = get_context(
+        with timed("retrieval_ms"):
+            context, query_vector, confidence = await asyncio.to_thread(
+                get_context,
                 vector_store=vector_store, 
                 query=request.prompt, 
-                cross_encoder=cross_encoder_model, 
-                embedding_model=embedding_model
+                cross_encoder=app.state.cross_encoder_model, 
+                embedding_model=app.state.embedding_model,
+                candidate_k=request.candidate_k,
+                rerank_depth=request.rerank_depth,
+                top_k=request.top_k,
+                with_details=True
             )
+    except Exception:
+        if refine_task:
+            refine_task.cancel()
+        raise
+
+    if not context:
+        if refine_task:
+            refine_task.cancel()
+        logger.error("No context found")
+        raise HTTPException(
+            status_code=404, 
+            detail={"error": "Context Not Found", "message": "Sorry, I couldn't find relevant information to answer your question."})
+
+    cached = answer_cache.get(document["collection_name"], query_vector, request.prompt) if cacheable else None
+    annotate(answer_cache_hit=cached is not None, answer_cache_skipped=not cacheable)
+    if cached:
+        if refine_task:
+            refine_task.cancel()
+        logger.info(f"Answer cache hit (similarity {cached['similarity']:.3f}) for: {cached['question'][:100]}")
+        # Follow-up questions still see this exchange in the chat history
+        memory.save_context({"input": request.prompt}, {"output": cached["answer"]})
+        return context, None, query_vector, confidence, cached
+
+    with timed("refine_wait_ms"):
+        refined_query = await refine_task if refine_task else request.prompt
+    annotate(refined_query=refined_query)
+    return context, refined_query, query_vector, confidence, None
+
+def record_chat(trace, llm_calls: LLMCallCounter, cached=False):
+    annotate(llm_calls=llm_calls.calls)
+    chat_stats["requests"] += 1
+    chat_stats["llm_calls"] += llm_calls.calls
+    route = "cached" if cached else trace.get("route", "agent")
+    chat_stats[f"{route}_answers"] += 1
+
+def remember_answer(document, query_vector, request: ChatRequest, answer, llm_calls: LLMCallCounter, cacheable):
+    if cacheable:
+        answer_cache.put(document["collection_name"], query_vector, request.prompt, answer, llm_calls=llm_calls.calls)
+
+def compact_session(memory):
+    app.state.sessions.schedule_compaction(memory, llm=app.state.refine_llm)
 
-            if context:
-                refined_query = RefineQuery(request.prompt)
-                logger.info("getting LLM response...")
-                llm_response = get_llm_response(user_query=refined_query,
-                                                vector_store=vector_store, 
-                                                query_context=context, 
-                                                memory=memory,
-                                                embedding_model=embedding_model,
-                                                file_name=chat_file_name)
-
-                return ChatResponse(response=llm_response)
-            else:
-                logger.error("No context found")
-                raise HTTPException(
-                status_code=404, 
-                detail={"error": "Context Not Found", "message": "Sorry, I couldn't find relevant information to answer your question."})
+@app.post("/doc-chat", response_model=ChatResponse)
+async def Chat(request: ChatRequest):
+    with tracer.trace("doc-chat", prompt=request.prompt) as trace:
+        try:
+            llm_calls = LLMCallCounter()
+            document, vector_store = await open_chat_document(request)
+            memory = open_chat_session(request.session_id)
+            cacheable = answer_cacheable(memory)
+            annotate(session=session_trace_id(memory.session_id), session_turns=memory.turn_count)
+            context, refined_query, query_vector, confidence, cached = await retrieve_and_refine(request, document, vector_store, memory, llm_calls)
+            if cached:
+                record_chat(trace, llm_calls, cached=True)
+                compact_session(memory)
+                return ChatResponse(response=cached["answer"], document_id=document["document_id"], session_id=memory.session_id, llm_calls=llm_calls.calls)
+
+            logger.info("getting LLM response...")
+            llm_response = await aget_llm_response(user_query=refined_query,
+                                                   vector_store=vector_store, 
+                                                   query_context=context, 
+                                                   memory=memory,
+                                                   embedding_model=app.state.embedding_model,
+                                                   file_name=document["file_name"],
+                                                   llm=app.state.chat_llm,
+                                                   confidence=confidence,
+                                                   callbacks=[llm_calls])
+
+            record_chat(trace, llm_calls)
+            remember_answer(document, query_vector, request, llm_response, llm_calls, cacheable)
+            compact_session(memory)
+            return ChatResponse(response=llm_response, document_id=document["document_id"], session_id=memory.session_id, llm_calls=llm_calls.calls)
             
-        else:
-            logger.error("Required components not initialized")
-            raise HTTPException(
-                status_code=500, 
-                detail={"error": "Initialization Error", "message": "System is not properly initialized. Please ensure a document is processed first."})
+        except HTTPException as e:
+            logger.error(f"Error processing user query: {str(e)}")
+            raise e
         
-    except HTTPException as e:
-        logger.error(f"Error processing user query: {str(e)}")
-        raise e
-    
-    except Exception as e:
-        logger.error(f"Unexpected error: {str(e)}")
-        raise HTTPException(
-            status_code=500,
-            detail={"error": "Internal Server Error", "message": "An unexpected error occurred. Please try again later."}
-        )
+        except Exception as e:
+            logger.error(f"Unexpected error: {str(e)}")
+            raise HTTPException(
+                status_code=500,
+                detail={"error": "Internal Server Error", "message": "An unexpected error occurred. Please try again later."}
+            )
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/doc-chat/stream")
+async def chat_stream(request: ChatRequest):
+    """Server-sent events variant of /doc-chat: status, retrieval, tool, token, answer or error events."""
+    document, vector_store = await open_chat_document(request)
+    memory = open_chat_session(request.session_id)
+    cacheable = answer_cacheable(memory)
+
+    async def events():
+        with tracer.trace("doc-chat-stream", prompt=request.prompt, document_id=document["document_id"],
+                          session=session_trace_id(memory.session_id), session_turns=memory.turn_count) as trace:
+            start = time.perf_counter()
+            yield sse_event("status", {"stage": "retrieval", "document_id": document["document_id"], "session_id": memory.session_id})
+            try:
+                llm_calls = LLMCallCounter()
+                context, refined_query, query_vector, confidence, cached = await retrieve_and_refine(request, document, vector_store, memory, llm_calls)
+                yield sse_event("retrieval", {"context_chars": len(context), "refined_query": refined_query, "confidence": confidence})
+                if cached:
+                    record_chat(trace, llm_calls, cached=True)
+                    compact_session(memory)
+                    yield sse_event("answer", {"text": cached["answer"], "cached": True, "llm_calls": llm_calls.calls})
+                    return
+
+                first_token = True
+                async for event, data in astream_llm_response(user_query=refined_query,
+                                                              vector_store=vector_store,
+                                                              query_context=context,
+                                                              memory=memory,
+                                                              embedding_model=app.state.embedding_model,
+                                                              file_name=document["file_name"],
+                                                              llm=app.state.chat_llm,
+                                                              confidence=confidence,
+                                                              callbacks=[llm_calls]):
+                    if event == "token" and first_token:
+                        annotate(first_token_ms=(time.perf_counter() - start) * 1000)
+                        first_token = False
+                    if event == "answer":
+                        record_chat(trace, llm_calls)
+                        remember_answer(document, query_vector, request, data["text"], llm_calls, cacheable)
+                        compact_session(memory)
+                        data = {**data, "llm_calls": llm_calls.calls}
+                    yield sse_event(event, data)
+
+            except HTTPException as e:
+                logger.error(f"Error processing user query: {str(e)}")
+                yield sse_event("error", e.detail)
+
+            except Exception as e:
+                logger.error(f"Unexpected error: {str(e)}")
+                annotate(error=str(e))
+                yield sse_event("error", {"error": "Internal Server Error", "message": "An unexpected error occurred. Please try again later."})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
     
 
 ### endpoint to process structured data to get visuals
 class VisualizeDocumentResponse(BaseModel):
     response: str;
 
-@app.post("/save-visualize-data", response_model=VisualizeDocumentResponse)
-async def upload_and_save_document(file: UploadFile = File(...)):
+@app.post("/save-visualize-data", response_model=VisualizeDocumentResponse, openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def upload_and_save_document(request: Request):
     try:
         # Save the file
-        file_path, visualize_file_name = await save_uploaded_file(file)
+        staged_path, visualize_file_name, _ = await save_uploaded_file(request)
+        file_path = UPLOAD_DIR / visualize_file_name
+        os.replace(staged_path, file_path)
         app.state.visualize_file_name = visualize_file_name
         logger.info(f"Visualize data File received: {visualize_file_name} at {file_path}")
     
@@ -246,7 +575,7 @@ async def upload_and_save_document(file: UploadFile = File(...)):
 
     except HTTPException as e:
         logger.error(f"{str(e)}")
-        return e
+        raise e
     
     except Exception as e:
         logger.info(f"Unexpected error while saving visualization data file: {str(e)}")
@@ -345,32 +674,85 @@ async def delete_all_files():
 
 ### endpoint to check if vectore store is created
 @app.get("/check-documents")
-async def check_documents():
+async def check_documents(document_id: str | None = None):
     try:
         logger.info("Checking vector store state...")
-        if not hasattr(app.state, 'vector_store'):
-            logger.warning("Vector store not found in app state")
+        if getattr(app.state, 'documents', None) is None:
+            logger.warning("Document registry not found in app state")
             return {"status": "error", "message": "Vector store not initialized"}
             
-        vector_store = app.state.vector_store
-        if vector_store is None:
-            logger.warning("Vector store is None")
+        document = await run_in_threadpool(app.state.documents.resolve, document_id)
+        if document is None:
+            logger.warning("No processed document found")
             return {"status": "error", "message": "Vector store is None"}
             
-        # Try to load from persist directory if vector store exists
         try:
-            chroma_db_path = os.path.join(os.path.dirname(__file__), "Models", "../chroma-db")
-            if os.path.exists(chroma_db_path):
-                collections = os.listdir(chroma_db_path)
-                logger.info(f"Found collections in chroma-db: {collections}")
-                
-            count = len(vector_store.get()['ids'])
+            vector_store = await run_in_threadpool(app.state.documents.open, document)
+            count = vector_count(vector_store)
             logger.info(f"Successfully retrieved {count} documents from vector store")
-            return {"status": "success", "document_count": count}
+            return {"status": "success", "document_id": document["document_id"], "document_count": count}
         except Exception as e:
             logger.error(f"Error accessing vector store: {str(e)}")
             return {"status": "error", "message": f"Error accessing vector store: {str(e)}"}
             
     except Exception as e:
         logger.error(f"Unexpected error in check-documents: {str(e)}")
-        return {"status": "error", "message": str(e)}
\ No newline at end of file
+        return {"status": "error", "message": str(e)}
+
+
+### list and remove processed documents
+@app.get("/documents")
+async def list_documents():
+    documents = app.state.documents
+    default_document = await run_in_threadpool(documents.resolve)
+    return {"default_document_id": (default_document or {}).get("document_id"), "documents": await run_in_threadpool(documents.list)}
+
+@app.delete("/documents/{document_id}")
+async def delete_document(document_id: str):
+    try:
+        document = await run_in_threadpool(app.state.documents.remove, document_id)
+    except Exception as e:
+        logger.error(f"Error deleting document {document_id}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail={"error": "document deletion error", "message": f"Error while deleting document: {str(e)}"}
+        )
+    if document is None:
+        raise HTTPException(
+            status_code=404,
+            detail={"error": "Document Not Found", "message": f"No processed document with id {document_id}."})
+
+    query_cache.invalidate(document["collection_name"])
+    reranker.invalidate(document["collection_name"])
+    answer_cache.invalidate(document["collection_name"])
+    agent_pool.invalidate(document["collection_name"])
+    return {"message": f"Deleted document {document['file_name']}", "document_id": document_id}
+
+
+### endpoint to inspect recent retrieval traces
+# Traces hold prompts and retrieved document text, the endpoint is off unless DEBUG_TRACES=true
+DEBUG_TRACES = os.getenv("DEBUG_TRACES", "false").lower() == "true"
+
+@app.get("/debug/traces", include_in_schema=DEBUG_TRACES)
+async def debug_traces(limit: int = 50):
+    if not DEBUG_TRACES:
+        raise HTTPException(status_code=404, detail={"error": "Not Found", "message": "Trace inspection is disabled."})
+    return {"stats": tracer.stats(), "traces": tracer.recent(limit)}
+
+
+### endpoint to check cache effectiveness
+@app.get("/cache-stats")
+async def cache_stats():
+    embedding_model = app.state.embedding_model
+    return {
+        "embedding_cache": embedding_model.stats() if isinstance(embedding_model, CachedEmbeddings) else None,
+        "query_cache": query_cache.stats(),
+        "answer_cache": answer_cache.stats(),
+        "reranker": reranker.stats(),
+        "retrieval": dict(retrieval_stats),
+        "context_packing": context_packer.stats(),
+        "sessions": app.state.sessions.stats(),
+        "document_handles": app.state.documents.stats(),
+        "agents": agent_pool.stats(),
+        "chat": dict(chat_stats)
+    }
@@ -0,0 +1,72 @@
+"""Compare agent construction time and chat throughput when rebuilding the agent per request and when taking it from the pool.
+
+Run from API-endpoint: python -m benchmarks.agent_pool --requests 64 --concurrency 8 --llm-ms 300
+"""
+import contextlib
+import tempfile
+import argparse
+import asyncio
+import json
+import time
+import io
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from Models.handle_doc_chat import AgentPool, create_agent_executor
+from Models.session_memory import SessionMemory
+from Models.vector_backend import FlatVectorStore
+from benchmarks.fakes import slow_fake_llm
+
+async def benchmark_agent_load(vector_store, llm, requests=64, concurrency=8):
+    """Answer `requests` agent questions `concurrency` at a time, rebuilding the agent per request and from a pool.
+
+    Returns throughput, latency percentiles and the agent construction time per request of both modes.
+    """
+    results = {}
+    for mode in ("rebuild", "pooled"):
+        pool = AgentPool()
+        build_ms, latencies = [], []
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def answer(number):
+            async with semaphore:
+                start = time.perf_counter()
+                if mode == "rebuild":
+                    agent_executor = await asyncio.to_thread(create_agent_executor, vector_store, llm)
+                else:
+                    agent_executor = await asyncio.to_thread(pool.get, vector_store, llm)
+                build_ms.append((time.perf_counter() - start) * 1000)
+                memory = SessionMemory(f"benchmark-{number}")
+                await agent_executor.ainvoke({"input": f"What was the net interest income in quarter {number % 4 + 1}?",
+                                              "context": "Net interest income rose 12% year over year.", "memory": memory.buffer})
+                latencies.append((time.perf_counter() - start) * 1000)
+
+        start = time.perf_counter()
+        # The executors print their steps, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            await asyncio.gather(*(answer(number) for number in range(requests)))
+        elapsed = time.perf_counter() - start
+        results[mode] = {
+            "requests_per_second": round(requests / elapsed, 2),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+            "agent_build_ms_mean": round(float(np.mean(build_ms)), 2),
+        }
+    results["build_ms_saved_per_request"] = round(results["rebuild"]["agent_build_ms_mean"] - results["pooled"]["agent_build_ms_mean"], 2)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure agent construction overhead and chat throughput with and without the agent pool")
+    parser.add_argument("--requests", type=int, default=64)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-ms", type=float, default=300, help="latency of the stand-in chat model per call")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        vector_store = FlatVectorStore("benchmark", DeterministicFakeEmbedding(size=384), persist_directory=directory)
+        vector_store.add_texts(["Net interest income rose 12% year over year.", "The board declared a quarterly dividend."])
+        vector_store.persist()
+        report = asyncio.run(benchmark_agent_load(vector_store, slow_fake_llm(args.llm_ms), requests=args.requests, concurrency=args.concurrency))
+
+    print(json.dumps({"requests": args.requests, "concurrency": args.concurrency, "llm_ms": args.llm_ms, **report}, indent=2))
@@ -0,0 +1,80 @@
+"""Count LLM calls and time answers with direct-answer routing off and on, against a stand-in LLM.
+
+Run from API-endpoint: python -m benchmarks.answer_routing --llm-ms 300
+"""
+import contextlib
+import tempfile
+import argparse
+import asyncio
+import json
+import time
+import io
+
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+
+from Models.handle_doc_chat import aget_llm_response, route_question, DIRECT_ANSWER_CONFIDENCE
+from Models.session_memory import SessionMemory
+from Models.tracing import LLMCallCounter
+from Models.vector_backend import FlatVectorStore
+from benchmarks.fakes import ReActFakeChatModel
+
+BENCHMARK_CONTEXT = "Net interest income rose 12% year over year. The board declared a quarterly dividend of $0.45 per share."
+
+# (question, context confidence): confident lookups, weakly supported ones and multi-hop questions that always need the agent
+BENCHMARK_QUESTIONS = [
+    ("What was the net interest income growth?", 0.92),
+    ("What dividend per share did the board declare?", 0.88),
+    ("How much did operating expenses increase?", 0.81),
+    ("What is the common equity tier 1 ratio?", 0.76),
+    ("What were the credit loss provisions this quarter?", 0.74),
+    ("How did deposits change in the retail segment?", 0.41),
+    ("What guidance was given for the net margin?", 0.35),
+    ("Compare the net interest income across the four quarters.", 0.9),
+    ("What is the difference between the reported and adjusted earnings?", 0.85),
+    ("How did the liquidity coverage trend over the year?", 0.62),
+]
+
+async def answer_questions(vector_store, embedding_model, llm, routing, questions=BENCHMARK_QUESTIONS):
+    """Answer each question in a new session and return LLM calls, routes and latency."""
+    calls, latencies, routes = [], [], []
+    for question, confidence in questions:
+        llm_calls = LLMCallCounter()
+        routes.append(route_question(question, confidence, routing=routing))
+        start = time.perf_counter()
+        # The agent executor prints its steps, keep the report readable
+        with contextlib.redirect_stdout(io.StringIO()):
+            await aget_llm_response(user_query=question, vector_store=vector_store, query_context=BENCHMARK_CONTEXT,
+                                    memory=SessionMemory("benchmark"), embedding_model=embedding_model, file_name="synthetic.pdf",
+                                    llm=llm, confidence=confidence, callbacks=[llm_calls], routing=routing)
+        latencies.append((time.perf_counter() - start) * 1000)
+        calls.append(llm_calls.calls)
+    return {
+        "llm_calls": int(np.sum(calls)),
+        "llm_calls_per_question": round(float(np.mean(calls)), 2),
+        "direct_share": round(routes.count("direct") / len(routes), 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "mean_ms": round(float(np.mean(latencies)), 1),
+    }
+
+async def benchmark_routing(vector_store, embedding_model, llm, questions=BENCHMARK_QUESTIONS):
+    results = {}
+    for routing in (False, True):
+        results["routing_on" if routing else "routing_off"] = await answer_questions(vector_store, embedding_model, llm, routing, questions)
+    results["llm_calls_saved"] = results["routing_off"]["llm_calls"] - results["routing_on"]["llm_calls"]
+    results["mean_latency_speedup"] = round(results["routing_off"]["mean_ms"] / results["routing_on"]["mean_ms"], 2)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Count LLM calls per question with direct-answer routing off and on")
+    parser.add_argument("--llm-ms", type=float, default=300, help="latency of the stand-in LLM per call")
+    args = parser.parse_args()
+
+    embedding_model = DeterministicFakeEmbedding(size=384)
+    with tempfile.TemporaryDirectory() as directory:
+        vector_store = FlatVectorStore("benchmark", embedding_model, persist_directory=directory)
+        vector_store.add_texts(BENCHMARK_CONTEXT.split(". "))
+        vector_store.persist()
+        report = asyncio.run(benchmark_routing(vector_store, embedding_model, ReActFakeChatModel(latency=args.llm_ms / 1000)))
+
+    print(json.dumps({"questions": len(BENCHMARK_QUESTIONS), "llm_ms": args.llm_ms, "direct_answer_confidence": DIRECT_ANSWER_CONFIDENCE, **report}, indent=2))
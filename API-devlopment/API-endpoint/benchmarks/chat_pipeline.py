@@ -0,0 +1,123 @@
+"""Compare /doc-chat latency and throughput of the serial blocking flow and the async concurrent one.
+
+Run from API-endpoint: python -m benchmarks.chat_pipeline --requests 32 --concurrency 8 --llm-ms 300
+"""
+import contextlib
+import tempfile
+import argparse
+import asyncio
+import json
+import time
+import io
+
+import httpx
+import numpy as np
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+import app as chat_app
+from Models.find_context import get_context
+from Models.handle_doc_chat import agent_pool
+from Models.process_doc import stream_into_collection
+from Models.refine_query import PromptTempplate
+from Models.session_memory import SessionMemory, SessionStore
+from Models.vector_backend import FlatVectorStore
+from benchmarks.fakes import slow_fake_llm, StubCrossEncoder
+from benchmarks.ingest_pipeline import build_synthetic_pages
+
+PROMPT_TOPICS = ["deposits", "provisions", "liquidity", "dividend", "margin", "guidance", "capital", "expenses"]
+
+class BenchmarkDocuments:
+    """Stands in for the document registry with one in-memory collection, nothing is read from the ingest index."""
+
+    def __init__(self, vector_store):
+        self.vector_store = vector_store
+        self.document = {"document_id": "benchmark", "collection_name": "benchmark", "file_name": "synthetic.pdf", "backend": "flat"}
+
+    def resolve(self, document_id=None):
+        return self.document
+
+    def open(self, document):
+        return self.vector_store
+
+def benchmark_prompt(number):
+    # Short and vague, so both flows refine it
+    return f"how did {PROMPT_TOPICS[number % len(PROMPT_TOPICS)]} develop in segment {number}"
+
+async def serial_chat(prompt, vector_store, embedding_model, cross_encoder, llm):
+    """The chat flow before async LLM calls: retrieval, then refinement, then the agent, each blocking the event loop."""
+    context = get_context(vector_store=vector_store, query=prompt, cross_encoder=cross_encoder, embedding_model=embedding_model)
+    refined_query = (PromptTempplate() | llm).invoke({"input": prompt}).content
+    memory = SessionMemory("benchmark")
+    agent_executor = agent_pool.get(vector_store, llm=llm)
+    return agent_executor.invoke({"input": refined_query, "context": context, "memory": memory.buffer})["output"]
+
+async def run_load(ask, requests, concurrency):
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed_request(number):
+        async with semaphore:
+            start = time.perf_counter()
+            await ask(number)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    # The agent executors print their steps, keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(timed_request(number) for number in range(requests)))
+    elapsed = time.perf_counter() - start
+    return {
+        "requests_per_second": round(requests / elapsed, 2),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 1),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 1),
+    }
+
+async def benchmark_chat(vector_store, embedding_model, cross_encoder, llm, requests=32, concurrency=8):
+    """Single-request latency and concurrent throughput of both flows, the async one through the /doc-chat handler."""
+    # app.state is what the lifespan would set up, with the stand-in models and LLM
+    chat_app.app.state.embedding_model = embedding_model
+    chat_app.app.state.cross_encoder_model = cross_encoder
+    chat_app.app.state.chat_llm = llm
+    chat_app.app.state.refine_llm = llm
+    chat_app.app.state.sessions = SessionStore()
+    chat_app.app.state.documents = BenchmarkDocuments(vector_store)
+
+    async def ask_serial(number, prefix):
+        # Let the other in-flight requests arrive before this one blocks the event loop, as they would on a server
+        await asyncio.sleep(0)
+        await serial_chat(f"{prefix} {benchmark_prompt(number)}", vector_store, embedding_model, cross_encoder, llm)
+
+    results = {"serial": {}, "concurrent": {}}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=chat_app.app), base_url="http://benchmark", timeout=None) as client:
+        async def ask_concurrent(number, prefix):
+            response = await client.post("/doc-chat", json={"prompt": f"{prefix} {benchmark_prompt(number)}"})
+            response.raise_for_status()
+
+        # Every prompt is new, so the query and answer caches never short-cut a request
+        for mode, ask in (("serial", ask_serial), ("concurrent", ask_concurrent)):
+            results[mode]["single"] = await run_load(lambda number: ask(number, f"{mode} single"), min(requests, 8), 1)
+            results[mode]["loaded"] = await run_load(lambda number: ask(number, f"{mode} loaded"), requests, concurrency)
+
+    results["single_p50_speedup"] = round(results["serial"]["single"]["p50_ms"] / results["concurrent"]["single"]["p50_ms"], 2)
+    results["throughput_speedup"] = round(results["concurrent"]["loaded"]["requests_per_second"] / results["serial"]["loaded"]["requests_per_second"], 2)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare /doc-chat latency and throughput of serial blocking and async concurrent LLM calls")
+    parser.add_argument("--requests", type=int, default=32)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--llm-ms", type=float, default=300, help="latency of the stand-in LLM per call")
+    parser.add_argument("--pair-ms", type=float, default=3.0, help="cost per pair of the stub cross-encoder")
+    parser.add_argument("--pages", type=int, default=50, help="pages of the synthetic report searched")
+    args = parser.parse_args()
+
+    embedding_model = DeterministicFakeEmbedding(size=384)
+    with tempfile.TemporaryDirectory() as directory:
+        vector_store = FlatVectorStore("benchmark", embedding_model, persist_directory=directory)
+        stream_into_collection(build_synthetic_pages(args.pages), vector_store, RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=200))
+        vector_store.persist()
+        report = asyncio.run(benchmark_chat(vector_store, embedding_model, StubCrossEncoder(args.pair_ms / 1000), slow_fake_llm(args.llm_ms),
+                                            requests=args.requests, concurrency=args.concurrency))
+
+    print(json.dumps({"requests": args.requests, "concurrency": args.concurrency, "llm_ms": args.llm_ms, **report}, indent=2))
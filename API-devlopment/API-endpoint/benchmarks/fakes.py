@@ -0,0 +1,84 @@
+"""Stand-ins for the remote LLMs and the cross-encoder used by the benchmarks."""
+import asyncio
+import time
+
+import numpy as np
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from langchain_core.messages import AIMessageChunk
+from langchain_core.outputs import ChatGenerationChunk
+
+AGENT_ANSWER = "Thought: The context answers this.\nFinal Answer: Net interest income rose 12%."
+AGENT_LOOKUP = "Thought: I should check the figures in the report.\nAction: financial_analysis\nAction Input: net interest income growth"
+DIRECT_ANSWER = "Net interest income rose 12%."
+
+class SlowFakeChatModel(FakeListChatModel):
+    """Fake chat model answering with canned responses after a fixed latency.
+
+    Sync calls block for the latency like a blocking HTTP client would,
+    async calls await it.
+    """
+
+    latency: float = 0.3
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        yield from super()._stream(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return super()._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+    # The agent streams its LLM calls
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        async for chunk in super()._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+            yield chunk
+
+class StubCrossEncoder:
+    """Stand-in cross-encoder scoring term overlap, with a fixed cost per pair like a real model."""
+
+    def __init__(self, pair_seconds=0.003):
+        self.pair_seconds = pair_seconds
+
+    def predict(self, pairs):
+        time.sleep(self.pair_seconds * len(pairs))
+        scores = []
+        for query, text in pairs:
+            terms = set(query.split())
+            words = text.split()
+            scores.append(sum(word in terms for word in words) / (len(words) or 1))
+        return np.asarray(scores, dtype=np.float32)
+
+def slow_fake_llm(latency_ms, responses=(AGENT_ANSWER,)):
+    return SlowFakeChatModel(responses=list(responses), latency=latency_ms / 1000)
+
+class ReActFakeChatModel(SlowFakeChatModel):
+    """Fake chat model that makes the agent look the answer up once before answering, like a typical ReAct turn.
+
+    Agent prompts get a vector store action and, once an observation is in
+    the scratchpad, the final answer. Every other prompt (direct answers,
+    the lookup tool's own QA chain) gets a plain answer.
+    """
+
+    responses: list = [DIRECT_ANSWER]
+
+    def reply(self, messages):
+        prompt = messages[-1].content
+        if "Action:" not in prompt:
+            return DIRECT_ANSWER
+        return AGENT_ANSWER if "Observation:" in prompt else AGENT_LOOKUP
+
+    def _call(self, messages, stop=None, run_manager=None, **kwargs):
+        return self.reply(messages)
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        yield ChatGenerationChunk(message=AIMessageChunk(content=self.reply(messages)))
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        yield ChatGenerationChunk(message=AIMessageChunk(content=self.reply(messages)))
@@ -0,0 +1,72 @@
+"""Check parity and throughput of an inference backend against the torch models.
+
+Run from API-endpoint: python -m benchmarks.inference_backends --backend onnx-int8
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+
+from Models.inference import load_embedding_model, load_cross_encoder, warmup, INFERENCE_BACKEND, INFERENCE_THREADS, SAMPLE_TEXTS, SAMPLE_QUERIES
+
+def parity_check(reference_embeddings, candidate_embeddings, reference_cross_encoder, candidate_cross_encoder,
+                 texts=SAMPLE_TEXTS, queries=SAMPLE_QUERIES):
+    """Compare a candidate runtime with the reference one on the same inputs."""
+    reference = np.asarray(reference_embeddings.embed_documents(texts))
+    candidate = np.asarray(candidate_embeddings.embed_documents(texts))
+    cosine = (reference * candidate).sum(axis=1) / (np.linalg.norm(reference, axis=1) * np.linalg.norm(candidate, axis=1))
+
+    top1_agreement = []
+    max_score_diff = 0.0
+    for query in queries:
+        pairs = [(query, text) for text in texts]
+        reference_scores = np.asarray(reference_cross_encoder.predict(pairs))
+        candidate_scores = np.asarray(candidate_cross_encoder.predict(pairs))
+        top1_agreement.append(int(np.argmax(reference_scores) == np.argmax(candidate_scores)))
+        max_score_diff = max(max_score_diff, float(np.abs(reference_scores - candidate_scores).max()))
+
+    return {
+        "embedding_cosine_min": round(float(cosine.min()), 5),
+        "embedding_cosine_mean": round(float(cosine.mean()), 5),
+        "rerank_top1_agreement": round(float(np.mean(top1_agreement)), 4),
+        "rerank_max_score_diff": round(max_score_diff, 5),
+    }
+
+def benchmark(embedding_model, cross_encoder, texts=SAMPLE_TEXTS, queries=SAMPLE_QUERIES, rounds=5):
+    """Throughput of embedding (texts/sec) and reranking (pairs/sec)."""
+    start = time.perf_counter()
+    for _ in range(rounds):
+        embedding_model.embed_documents(texts)
+    embed_seconds = time.perf_counter() - start
+
+    pairs = [(query, text) for query in queries for text in texts]
+    start = time.perf_counter()
+    for _ in range(rounds):
+        cross_encoder.predict(pairs)
+    rerank_seconds = time.perf_counter() - start
+
+    return {
+        "texts_per_second": round(rounds * len(texts) / embed_seconds, 1),
+        "pairs_per_second": round(rounds * len(pairs) / rerank_seconds, 1),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check parity and throughput of an inference backend against torch")
+    parser.add_argument("--backend", default=INFERENCE_BACKEND)
+    parser.add_argument("--embedding-model", default="sentence-transformers/all-MiniLM-L6-v2")
+    parser.add_argument("--cross-encoder", default="cross-encoder/ms-marco-MiniLM-L-6-v2")
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    reference = (load_embedding_model(args.embedding_model, "torch"), load_cross_encoder(args.cross_encoder, "torch"))
+    candidate = (load_embedding_model(args.embedding_model, args.backend), load_cross_encoder(args.cross_encoder, args.backend))
+    for models in (reference, candidate):
+        warmup(*models)
+    print(json.dumps({
+        "backend": args.backend,
+        "threads": INFERENCE_THREADS,
+        "parity": parity_check(reference[0], candidate[0], reference[1], candidate[1]),
+        "torch": benchmark(*reference, rounds=args.rounds),
+        args.backend: benchmark(*candidate, rounds=args.rounds),
+    }, indent=2))
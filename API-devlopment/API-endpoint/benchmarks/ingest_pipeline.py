@@ -0,0 +1,144 @@
+"""Compare peak RSS and chunks/sec of in-memory and streaming ingestion on a synthetic report.
+
+Run from API-endpoint: python -m benchmarks.ingest_pipeline --pages 2000
+"""
+import os
+import subprocess
+import threading
+import tempfile
+import argparse
+import random
+import json
+import sys
+import time
+
+import psutil
+
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from Models.text_normalize import normalize_batch, format_context_chunk
+from Models.lexical_index import LexicalIndex
+from Models.vector_backend import persist_vector_store
+from Models.process_doc import preprocess_text, stream_into_collection, EMBED_BATCH_SIZE, PIPELINE_QUEUE_DEPTH
+
+SYNTHETIC_WORDS = ("revenue income capital ratio deposits loans provisions credit margin segment quarter growth decline "
+                   "expenses dividend equity liquidity risk assets guidance outlook regulatory operating net interest").split()
+
+def build_synthetic_pages(page_count, chars_per_page=3500, seed=0):
+    """Merged page Documents of a synthetic financial report, as they come out of `combine_documents_by_page`."""
+    rng = random.Random(seed)
+    pages = []
+    for page_number in range(1, page_count + 1):
+        sentences, length = [], 0
+        while length < chars_per_page:
+            words = rng.choices(SYNTHETIC_WORDS, k=rng.randint(8, 20))
+            words.insert(rng.randrange(len(words)), f"{rng.uniform(0.1, 999):.1f}%" if rng.random() < 0.5 else f"{rng.randint(1000, 99999):,}")
+            sentence = " ".join(words).capitalize() + "."
+            sentences.append(sentence)
+            length += len(sentence) + 1
+        pages.append(Document(page_content=" ".join(sentences), metadata={"page_number": page_number, "filename": "synthetic.pdf"}))
+    return pages
+
+def ingest_in_memory(pages, text_splitter, embedding_model, backend, directory):
+    """The pre-streaming path: every page, chunk and tagged chunk is held in lists, then embedded and written in one call."""
+    from langchain_chroma import Chroma
+    from Models.vector_backend import FlatVectorStore
+
+    documents = [preprocess_text(page=page.page_content, metadata=page.metadata) for page in pages]
+    chunks = text_splitter.split_documents(documents)
+    documents_with_context = []
+    for chunk in chunks:
+        doc_context, tokens = normalize_batch([chunk.page_content])[0]
+        documents_with_context.append(Document(page_content=format_context_chunk(doc_context, tokens), metadata=chunk.metadata))
+    if backend == "flat":
+        vector_store = FlatVectorStore("benchmark", embedding_model, persist_directory=directory)
+        vector_store.add_documents(documents_with_context)
+        vector_store.persist()
+    else:
+        Chroma.from_documents(documents=documents_with_context, embedding=embedding_model, collection_name="benchmark", persist_directory=directory)
+    return len(documents_with_context)
+
+def ingest_streaming(pages, text_splitter, embedding_model, backend, directory):
+    from langchain_chroma import Chroma
+    from Models.vector_backend import FlatVectorStore
+
+    if backend == "flat":
+        vector_store = FlatVectorStore("benchmark", embedding_model, persist_directory=directory)
+    else:
+        vector_store = Chroma(collection_name="benchmark", embedding_function=embedding_model, persist_directory=directory)
+    chunk_ids, _ = stream_into_collection(pages, vector_store, text_splitter, lexical_index=LexicalIndex())
+    persist_vector_store(vector_store)
+    return len(chunk_ids)
+
+class PeakRSS:
+    """Sample this process' resident memory on a thread until stopped, keeping the highest reading."""
+
+    def __init__(self, interval=0.01):
+        self.process = psutil.Process()
+        self.interval = interval
+        self.peak = self.process.memory_info().rss
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, self.process.memory_info().rss)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self.process.memory_info().rss)
+
+def run_pipeline_benchmark(pipeline, pages, backend, embedding_model_name):
+    """Ingest a synthetic report with one pipeline in this process, return chunks/sec and peak RSS."""
+    if embedding_model_name == "fake":
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embedding_model = DeterministicFakeEmbedding(size=384)
+    else:
+        from Models.inference import load_embedding_model
+        embedding_model = load_embedding_model(embedding_model_name)
+    report = build_synthetic_pages(pages)
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size = 800, chunk_overlap=200)
+    baseline_rss = psutil.Process().memory_info().rss
+
+    ingest = ingest_streaming if pipeline == "streaming" else ingest_in_memory
+    with tempfile.TemporaryDirectory() as directory, PeakRSS() as rss:
+        start = time.perf_counter()
+        chunk_count = ingest(report, text_splitter, embedding_model, backend, directory)
+        elapsed = time.perf_counter() - start
+
+    return {
+        "chunks": chunk_count,
+        "seconds": round(elapsed, 2),
+        "chunks_per_second": round(chunk_count / elapsed, 1),
+        "peak_rss_mb": round(rss.peak / (1024 * 1024), 1),
+        "peak_rss_growth_mb": round((rss.peak - baseline_rss) / (1024 * 1024), 1),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare peak RSS and chunks/sec of in-memory and streaming ingestion on a synthetic report")
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--backend", choices=["chroma", "flat"], default="chroma")
+    parser.add_argument("--embedding-model", default="sentence-transformers/all-MiniLM-L6-v2", help='model name, or "fake" for hash embeddings')
+    parser.add_argument("--pipeline", choices=["in_memory", "streaming"], help="run one pipeline in this process")
+    args = parser.parse_args()
+
+    if args.pipeline:
+        print(json.dumps(run_pipeline_benchmark(args.pipeline, args.pages, args.backend, args.embedding_model)))
+    else:
+        # Each pipeline runs in its own process so peak RSS is not shared between them
+        results = {}
+        for pipeline in ("in_memory", "streaming"):
+            output = subprocess.run(
+                [sys.executable, "-m", "benchmarks.ingest_pipeline", "--pipeline", pipeline, "--pages", str(args.pages),
+                 "--backend", args.backend, "--embedding-model", args.embedding_model],
+                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), capture_output=True, text=True, check=True
+            ).stdout
+            results[pipeline] = json.loads(output.strip().splitlines()[-1])
+        print(json.dumps({"pages": args.pages, "backend": args.backend, "embedding_model": args.embedding_model,
+                          "batch_size": EMBED_BATCH_SIZE, "queue_depth": PIPELINE_QUEUE_DEPTH, **results}, indent=2))
@@ -0,0 +1,141 @@
+"""Compare one whole-file hi_res request, sharded hi_res and routed partitioning against a local stand-in for Unstructured.
+
+Run from API-endpoint: python -m benchmarks.partitioning [report.pdf] --pages 100 --latency 2 --page-latency 0.5
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import threading
+import tempfile
+import argparse
+import hashlib
+import logging
+import json
+import os
+import time
+
+import fitz
+from unstructured_client import UnstructuredClient
+
+from Models.partition_doc import partition_document, SHARD_PAGES, PARTITION_CONCURRENCY
+
+class StandInPartitionHandler(BaseHTTPRequestHandler):
+    """Local stand-in for the Unstructured partition endpoint.
+
+    Answers every request with one NarrativeText element per page of the
+    posted PDF after `latency + page_latency * pages` seconds, so routing and
+    sharding can be compared offline.
+    """
+
+    latency = 2.0
+    page_latency = 0.5
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        content = body[body.find(b"%PDF-"):body.rfind(b"%%EOF") + len(b"%%EOF")]
+        with fitz.open(stream=content, filetype="pdf") as pdf:
+            elements = [
+                {
+                    "type": "NarrativeText",
+                    "element_id": hashlib.sha256(f"{self.server.requests}-{page.number}".encode("utf-8")).hexdigest()[:32],
+                    "text": page.get_text("text").strip() or f"scanned page {page.number + 1}",
+                    "metadata": {"page_number": page.number + 1, "filename": "stand-in.pdf", "filetype": "application/pdf"},
+                }
+                for page in pdf
+            ]
+        with self.server.lock:
+            self.server.requests += 1
+            self.server.pages += len(elements)
+        time.sleep(self.latency + self.page_latency * len(elements))
+
+        payload = json.dumps(elements).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        # The client's split-pdf hook checks that the docs route answers before splitting
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+def start_stand_in_server(latency, page_latency):
+    handler = type("Handler", (StandInPartitionHandler,), {"latency": latency, "page_latency": page_latency})
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.lock = threading.Lock()
+    server.requests = 0
+    server.pages = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def build_synthetic_report(file_path, pages):
+    """Write a report mixing prose, number dense tables, image heavy and scanned (text-less) pages."""
+    prose = ("Net interest income rose on higher loan balances while operating expenses reflected continued "
+             "investment in technology and compliance. Management expects deposit costs to stabilise next year. ") * 4
+    pixmap = fitz.Pixmap(fitz.csRGB, fitz.IRect(0, 0, 400, 400), False)
+    pixmap.clear_with(200)
+    with fitz.open() as pdf:
+        for index in range(pages):
+            page = pdf.new_page()
+            kind = index % 10
+            if kind == 7:
+                rows = [f"Segment {row}   {1200 + row * 37:,}   {980 + row * 29:,}   {(row % 9) + 1}.{row % 7}%" for row in range(30)]
+                page.insert_textbox(fitz.Rect(50, 50, 550, 800), "\n".join(rows), fontsize=9)
+            elif kind == 8:
+                page.insert_textbox(fitz.Rect(50, 50, 550, 120), prose[:300], fontsize=9)
+                page.insert_image(fitz.Rect(50, 130, 550, 630), pixmap=pixmap)
+            elif kind == 9:
+                page.insert_image(page.rect, pixmap=pixmap)
+            else:
+                page.insert_textbox(fitz.Rect(50, 50, 550, 800), f"Page {index + 1}. " + prose, fontsize=10)
+        pdf.save(file_path)
+
+def benchmark_partitioning(file_path, server, client, price_per_page=0.01):
+    """Partition `file_path` once per mode against the stand-in `server` and report time, requests and hi_res cost."""
+    with fitz.open(file_path) as pdf:
+        page_count = pdf.page_count
+
+    # The pre-sharding path sent the whole file in one request
+    runs = [("hi_res_single_request", "hi_res", page_count, 1),
+            ("hi_res_sharded", "hi_res", SHARD_PAGES, PARTITION_CONCURRENCY),
+            ("routed", "routed", SHARD_PAGES, PARTITION_CONCURRENCY)]
+    results = {"pages": page_count}
+    for name, mode, shard_pages, concurrency in runs:
+        requests_before, pages_before = server.requests, server.pages
+        documents, stats = partition_document(file_path, os.path.basename(file_path), mode=mode, client=client,
+                                              shard_pages=shard_pages, concurrency=concurrency)
+        hi_res_pages = server.pages - pages_before
+        results[name] = {
+            **stats,
+            "documents": len(documents),
+            "hi_res_requests": server.requests - requests_before,
+            "seconds_per_page": round(stats["partition_seconds"] / page_count, 4),
+            "hi_res_cost": round(hi_res_pages * price_per_page, 2),
+        }
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare routed and all-hi_res partitioning against a local stand-in server")
+    parser.add_argument("pdf", nargs="?", help="PDF to partition, a synthetic report is generated when omitted")
+    parser.add_argument("--pages", type=int, default=100, help="pages of the synthetic report")
+    parser.add_argument("--latency", type=float, default=2.0, help="stand-in seconds per request")
+    parser.add_argument("--page-latency", type=float, default=0.5, help="stand-in seconds per page")
+    parser.add_argument("--price-per-page", type=float, default=0.01, help="hi_res price per page used for the cost estimate")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, force=True)
+    server = start_stand_in_server(args.latency, args.page_latency)
+    client = UnstructuredClient(api_key_auth="stand-in", server_url=f"http://127.0.0.1:{server.server_address[1]}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        file_path = args.pdf
+        if file_path is None:
+            file_path = os.path.join(tmp_dir, "synthetic-report.pdf")
+            build_synthetic_report(file_path, args.pages)
+        report = benchmark_partitioning(file_path, server, client, price_per_page=args.price_per_page)
+    server.shutdown()
+
+    print(json.dumps({"latency": args.latency, "page_latency": args.page_latency, **report}, indent=2))
@@ -0,0 +1,97 @@
+"""Compare latency and top-k agreement of adaptive and always reranking over a synthetic report.
+
+Run from API-endpoint: python -m benchmarks.reranking --pages 300 [--cross-encoder stub --pair-ms 3] [--no-hybrid]
+"""
+import tempfile
+import argparse
+import json
+import time
+
+import numpy as np
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from Models.find_context import (AdaptiveReranker, get_query_context, lexical_candidates,
+                                 CANDIDATE_K, RERANK_DEPTH, FINAL_TOP_K, RERANK_MARGIN, HYBRID_LEXICAL_K)
+from Models.lexical_index import LexicalIndex
+from Models.process_doc import stream_into_collection
+from Models.vector_backend import FlatVectorStore
+from benchmarks.fakes import StubCrossEncoder
+from benchmarks.ingest_pipeline import build_synthetic_pages
+
+BENCHMARK_QUERIES = [
+    "net interest income growth", "capital ratio", "dividend per share", "credit loss provisions",
+    "operating expenses increase", "deposit decline", "loan growth by segment", "liquidity coverage",
+    "regulatory capital outlook", "net margin guidance", "revenue decline quarter", "equity risk assets",
+    "interest margin outlook", "segment operating income", "provisions for credit risk", "quarterly revenue growth",
+]
+
+def benchmark_rerank(vector_store, lexical_index, cross_encoder, embedding_model, queries=BENCHMARK_QUERIES,
+                     candidate_k=CANDIDATE_K, rerank_depth=RERANK_DEPTH, top_k=FINAL_TOP_K, rounds=3):
+    """Latency percentiles and pairs scored of adaptive vs always reranking, plus top-k overlap between the two.
+
+    Scores are not cached, so every round pays for the cross-encoder again.
+    """
+    results, top_ids = {}, {}
+    for mode in ("always", "adaptive"):
+        bench_reranker = AdaptiveReranker(score_cache_size=0)
+        latencies = []
+        for _ in range(rounds):
+            for query in queries:
+                start = time.perf_counter()
+                query_context = get_query_context(query)
+                vector = embedding_model.embed_query(query_context)
+                context = vector_store.similarity_search_by_vector_with_relevance_scores(vector, k=candidate_k)
+                lexical_only = []
+                if lexical_index is not None:
+                    vector_ids = {AdaptiveReranker.chunk_key(doc) for doc, _ in context}
+                    lexical_only = [doc for doc in lexical_candidates(vector_store, lexical_index, query_context, HYBRID_LEXICAL_K)
+                                    if AdaptiveReranker.chunk_key(doc) not in vector_ids]
+                ranked = bench_reranker.rerank(cross_encoder, query_context, context, top_k=top_k, rerank_depth=rerank_depth,
+                                               mode=mode, collection_name="benchmark", extra_docs=lexical_only)
+                latencies.append((time.perf_counter() - start) * 1000)
+                top_ids[mode, query] = {AdaptiveReranker.chunk_key(doc) for _, doc in ranked}
+        stats = bench_reranker.stats()
+        results[mode] = {
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+            "pairs_scored_per_query": round(stats["pairs_scored"] / stats["requests"], 2),
+            "rerank_skipped_ratio": round(stats["rerank_skipped"] / stats["requests"], 4),
+        }
+
+    overlaps = [len(top_ids["adaptive", query] & top_ids["always", query]) / max(len(top_ids["always", query]), 1) for query in queries]
+    results[f"top{top_k}_overlap_mean"] = round(float(np.mean(overlaps)), 4)
+    results[f"top{top_k}_overlap_min"] = round(float(np.min(overlaps)), 4)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare latency and top-k agreement of adaptive and always reranking")
+    parser.add_argument("--pages", type=int, default=300, help="pages of the synthetic report searched")
+    parser.add_argument("--embedding-model", default="sentence-transformers/all-MiniLM-L6-v2", help='model name, or "fake" for hash embeddings')
+    parser.add_argument("--cross-encoder", default="cross-encoder/ms-marco-MiniLM-L-6-v2", help='model name, or "stub"')
+    parser.add_argument("--pair-ms", type=float, default=3.0, help="cost per pair of the stub cross-encoder")
+    parser.add_argument("--no-hybrid", action="store_true", help="vector candidates only")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.embedding_model == "fake":
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embedding_model = DeterministicFakeEmbedding(size=384)
+    else:
+        from Models.inference import load_embedding_model
+        embedding_model = load_embedding_model(args.embedding_model)
+    if args.cross_encoder == "stub":
+        cross_encoder = StubCrossEncoder(args.pair_ms / 1000)
+    else:
+        from Models.inference import load_cross_encoder
+        cross_encoder = load_cross_encoder(args.cross_encoder)
+
+    with tempfile.TemporaryDirectory() as directory:
+        vector_store = FlatVectorStore("benchmark", embedding_model, persist_directory=directory)
+        lexical_index = LexicalIndex()
+        stream_into_collection(build_synthetic_pages(args.pages), vector_store, RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=200),
+                               lexical_index=lexical_index)
+        vector_store.persist()
+        report = benchmark_rerank(vector_store, None if args.no_hybrid else lexical_index, cross_encoder, embedding_model, rounds=args.rounds)
+
+    print(json.dumps({"pages": args.pages, "cross_encoder": args.cross_encoder, "hybrid": not args.no_hybrid,
+                      "margin": RERANK_MARGIN, "queries": len(BENCHMARK_QUERIES), **report}, indent=2))
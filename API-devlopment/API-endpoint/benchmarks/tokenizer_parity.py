@@ -0,0 +1,86 @@
+"""Check that the compiled tokenizer matches NLTK's word_tokenize and compare their chunks/sec.
+
+Run from API-endpoint: python -m benchmarks.tokenizer_parity [report.pdf ...] --pages 200
+Exits with status 1 when any chunk tokenizes differently.
+"""
+import argparse
+import json
+import sys
+import time
+
+import fitz
+from nltk.tokenize import word_tokenize
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+
+from Models.text_normalize import clean_text, tokenize
+from benchmarks.ingest_pipeline import build_synthetic_pages
+
+# Treebank corner cases: quotes, clitics, contractions, final periods, ellipses, dashes and separators next to digits
+EDGE_CASES = [
+    'he said "net income rose." then left.',
+    "the bank's ratio isn't what we'd expect, they'll say 'maybe'.",
+    "we cannot, gonna, gimme, lemme, wanna go, gotta see, more'n 't is.",
+    "results (see note 4.) were restated.",
+    "margin improved... slightly.. again.",
+    "q3--q4 growth -- and a --- dash - here.",
+    "1,000,000 units: 3:30 pm, ratio 1:2,:, values,, more",
+    "price $4.50; share 12% & rising @ #1 site?! yes!",
+    "u.s. inc. vs. e.g. no. 5 fig. 3 mr. smith dr. who.",
+    "ends with closers.)]} ",
+    "“quoted” «guillemets» ‘single’ „low“ ``backticks''",
+    "en–dash em—dash figure‒dash bar―here.",
+    "tab\tseparated nbsp text.",
+    "...leading ellipsis and trailing one...",
+    ".",
+    "",
+]
+
+def pdf_pages(path):
+    with fitz.open(path) as pdf:
+        return [Document(page_content=page.get_text(), metadata={"page_number": index + 1}) for index, page in enumerate(pdf)]
+
+def build_corpus(pdf_paths, synthetic_pages):
+    """Cleaned chunks as ingestion tokenizes them, plus the edge cases."""
+    pages = build_synthetic_pages(synthetic_pages)
+    for path in pdf_paths:
+        pages.extend(pdf_pages(path))
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=800, chunk_overlap=200)
+    chunks = [chunk.page_content for chunk in text_splitter.split_documents([Document(page_content=clean_text(page.page_content), metadata=page.metadata) for page in pages])]
+    return chunks + EDGE_CASES + [clean_text(case) for case in EDGE_CASES]
+
+def check_parity(chunks):
+    mismatches = []
+    for chunk in chunks:
+        expected, actual = word_tokenize(chunk), tokenize(chunk)
+        if expected != actual:
+            mismatches.append({"text": chunk[:200], "nltk": expected[:40], "compiled": actual[:40]})
+    return mismatches
+
+def chunks_per_second(tokenizer, chunks, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for chunk in chunks:
+            tokenizer(chunk)
+    return round(len(chunks) * rounds / (time.perf_counter() - start), 1)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the compiled tokenizer against NLTK word_tokenize and time both")
+    parser.add_argument("pdfs", nargs="*", help="reports whose text is added to the corpus")
+    parser.add_argument("--pages", type=int, default=200, help="pages of the synthetic report in the corpus")
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+
+    chunks = build_corpus(args.pdfs, args.pages)
+    mismatches = check_parity(chunks)
+    nltk_rate = chunks_per_second(word_tokenize, chunks, args.rounds)
+    compiled_rate = chunks_per_second(tokenize, chunks, args.rounds)
+    print(json.dumps({
+        "chunks": len(chunks),
+        "mismatched_chunks": len(mismatches),
+        "nltk_chunks_per_second": nltk_rate,
+        "compiled_chunks_per_second": compiled_rate,
+        "speedup": round(compiled_rate / nltk_rate, 2),
+        "mismatches": mismatches[:10],
+    }, indent=2))
+    sys.exit(1 if mismatches else 0)
@@ -0,0 +1,114 @@
+"""Compare ingest time, query latency, recall@10, disk size and resident memory of the vector backends.
+
+Run from API-endpoint: python -m benchmarks.vector_backends --chunks 20000 [--backends chroma,flat,flat-int8]
+Ingestion and queries of each backend run in separate processes.
+"""
+import subprocess
+import tempfile
+import argparse
+import json
+import time
+import sys
+import os
+
+import numpy as np
+import psutil
+from langchain_core.embeddings import Embeddings
+from langchain_chroma import Chroma
+
+from Models.vector_backend import FlatVectorStore, persist_vector_store
+
+class PrecomputedEmbeddings(Embeddings):
+    """Returns vectors computed up front, so a benchmark times the store and not the model."""
+
+    def __init__(self, vectors_by_text):
+        self.vectors_by_text = vectors_by_text
+
+    def embed_documents(self, texts):
+        return [self.vectors_by_text[text] for text in texts]
+
+    def embed_query(self, text):
+        return self.vectors_by_text[text]
+
+def directory_bytes(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+def benchmark_vectors(chunks, dim, queries, seed=0):
+    """Random unit vectors and noisy copies of some of them as queries, the same for every backend."""
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((chunks, dim)).astype(np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    query_vectors = vectors[rng.choice(chunks, size=queries, replace=False)] + 0.05 * rng.standard_normal((queries, dim)).astype(np.float32)
+    query_vectors /= np.linalg.norm(query_vectors, axis=1, keepdims=True)
+    return vectors, query_vectors
+
+def open_benchmark_store(backend, directory, embedding):
+    if backend == "chroma":
+        return Chroma(collection_name="benchmark", embedding_function=embedding, persist_directory=directory)
+    return FlatVectorStore("benchmark", embedding, persist_directory=directory, quantized=backend == "flat-int8")
+
+def benchmark_ingest(backend, directory, chunks, dim, queries, batch_size=64):
+    vectors, _ = benchmark_vectors(chunks, dim, queries)
+    texts = [f"chunk {position}" for position in range(chunks)]
+    vector_store = open_benchmark_store(backend, directory, PrecomputedEmbeddings({text: vector.tolist() for text, vector in zip(texts, vectors)}))
+    start = time.perf_counter()
+    for position in range(0, chunks, batch_size):
+        vector_store.add_texts(texts[position:position + batch_size], ids=texts[position:position + batch_size])
+    persist_vector_store(vector_store)
+    ingest_seconds = time.perf_counter() - start
+    return {
+        "ingest_seconds": round(ingest_seconds, 2),
+        "chunks_per_second": round(chunks / ingest_seconds, 1),
+        "disk_mb": round(directory_bytes(directory) / (1024 * 1024), 1),
+    }
+
+def benchmark_queries(backend, directory, chunks, dim, queries, k=10):
+    """Open a stored collection in a fresh process and time searches, recall@k is measured against exact search."""
+    vectors, query_vectors = benchmark_vectors(chunks, dim, queries)
+    exact = [set(np.argsort(-(vectors @ query))[:k].tolist()) for query in query_vectors]
+    del vectors
+
+    process = psutil.Process()
+    rss_before = process.memory_info().rss
+    vector_store = open_benchmark_store(backend, directory, PrecomputedEmbeddings({}))
+    latencies, recalls = [], []
+    for query, expected in zip(query_vectors.tolist(), exact):
+        start = time.perf_counter()
+        results = vector_store.similarity_search_by_vector_with_relevance_scores(query, k=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        recalls.append(len({int(doc.id.split()[1]) for doc, _ in results} & expected) / k)
+    return {
+        "query_p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "query_p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        f"recall_at_{k}": round(float(np.mean(recalls)), 4),
+        "rss_growth_mb": round((process.memory_info().rss - rss_before) / (1024 * 1024), 1),
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare ingest time, query latency, recall, disk and RAM of the vector backends")
+    parser.add_argument("--chunks", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--backends", default="chroma,flat,flat-int8")
+    parser.add_argument("--phase", choices=["ingest", "query"], help="run one phase of one backend in this process")
+    parser.add_argument("--backend")
+    parser.add_argument("--directory")
+    args = parser.parse_args()
+
+    if args.phase:
+        run = benchmark_ingest if args.phase == "ingest" else benchmark_queries
+        print(json.dumps(run(args.backend, args.directory, args.chunks, args.dim, args.queries)))
+    else:
+        # Ingestion and queries run in separate processes so resident memory is measured from a cold open
+        results = {}
+        for backend in args.backends.split(","):
+            results[backend] = {}
+            with tempfile.TemporaryDirectory() as directory:
+                for phase in ("ingest", "query"):
+                    output = subprocess.run(
+                        [sys.executable, "-m", "benchmarks.vector_backends", "--phase", phase, "--backend", backend, "--directory", directory,
+                         "--chunks", str(args.chunks), "--dim", str(args.dim), "--queries", str(args.queries)],
+                        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), capture_output=True, text=True, check=True
+                    ).stdout
+                    results[backend].update(json.loads(output.strip().splitlines()[-1]))
+        print(json.dumps({"chunks": args.chunks, "dim": args.dim, "queries": args.queries, **results}, indent=2))
@@ -23,8 +23,23 @@ type DocumentState = {
   name: string;
   size: number;
   isProcessed: boolean;
+  documentId?: string | null;
+  sessionId?: string | null;
 }
 
+// Status of a queued ingestion job, as returned by /process-document/{job_id}
+type IngestionJob = {
+  job_id: string;
+  status: "queued" | "running" | "completed" | "failed";
+  stage: string;
+  percent: number;
+  error?: string | null;
+  stats?: { document_id?: string };
+}
+
+// How often the ingestion job is polled while a document is processed
+const JOB_POLL_INTERVAL_MS = 2000
+
 export default function ChatPage() {
   // Load messages from localStorage on component mount
   const [messages, setMessages] = useState<Message[]>(() => {
@@ -52,6 +67,10 @@ export default function ChatPage() {
     documentState?.isProcessed || false
   )
   const [processingError, setProcessingError] = useState<string | null>(null)
+  const [processingProgress, setProcessingProgress] = useState<string | null>(null)
+  // Ids returned by the API, sent back so follow-ups use the same report and conversation history
+  const [documentId, setDocumentId] = useState<string | null>(documentState?.documentId || null)
+  const [sessionId, setSessionId] = useState<string | null>(documentState?.sessionId || null)
   const fileInputRef = useRef<HTMLInputElement>(null)
   const messagesEndRef = useRef<HTMLDivElement>(null)
 
@@ -68,11 +87,21 @@ export default function ChatPage() {
       const docState: DocumentState = {
         name: document.name,
         size: document.size,
-        isProcessed: isDocumentProcessed
+        isProcessed: isDocumentProcessed,
+        documentId,
+        sessionId
       };
       localStorage.setItem('chatDocumentState', JSON.stringify(docState));
     }
-  }, [document, isDocumentProcessed]);
+  }, [document, isDocumentProcessed, documentId, sessionId]);
+
+  // Keep the ids with a document restored from localStorage as well
+  useEffect(() => {
+    const savedDocState = localStorage.getItem('chatDocumentState');
+    if (savedDocState) {
+      localStorage.setItem('chatDocumentState', JSON.stringify({ ...JSON.parse(savedDocState), documentId, sessionId }));
+    }
+  }, [documentId, sessionId]);
 
   // Scroll to bottom when messages change
   useEffect(() => {
@@ -97,19 +126,34 @@ export default function ChatPage() {
 
     try {
       // Send message to doc-chat API
-      const response = await fetch("/api/doc-chat", {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-        },
-        body: JSON.stringify({ prompt: input }),
-      })
+      const ask = (currentSessionId: string | null) =>
+        fetch("/api/doc-chat", {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+          },
+          body: JSON.stringify({ prompt: input, session_id: currentSessionId, document_id: documentId }),
+        })
+
+      let response = await ask(sessionId)
+
+      // Expired sessions are not adopted by the API, start a new one
+      if (response.status === 404 && sessionId) {
+        const errorData = await response.json()
+        if (errorData.code === "Session Not Found") {
+          setSessionId(null)
+          response = await ask(null)
+        } else {
+          throw new Error(errorData.error)
+        }
+      }
 
       if (!response.ok) {
         throw new Error(`API responded with status: ${response.status}`)
       }
 
       const data = await response.json()
+      setSessionId(data.session_id || null)
 
       // Add assistant response to chat
       const assistantMessage: Message = {
@@ -147,6 +191,25 @@ export default function ChatPage() {
     }
   }
 
+  // Poll the ingestion job until it has completed or failed
+  const waitForIngestion = async (jobId: string): Promise<IngestionJob> => {
+    while (true) {
+      const response = await fetch(`/api/process-document/${encodeURIComponent(jobId)}`, { cache: "no-store" })
+
+      if (!response.ok) {
+        const errorData = await response.json()
+        throw new Error(errorData.error || "Failed to get processing status")
+      }
+
+      const job: IngestionJob = await response.json()
+      if (job.status === "completed" || job.status === "failed") {
+        return job
+      }
+      setProcessingProgress(job.status === "queued" ? "queued" : `${job.stage} ${job.percent}%`)
+      await new Promise((resolve) => setTimeout(resolve, JOB_POLL_INTERVAL_MS))
+    }
+  }
+
   const processDocument = async () => {
     if (!document) return
 
@@ -168,7 +231,16 @@ export default function ChatPage() {
       }
 
       const data = await response.json()
+
+      // The API only queues the document, chat is enabled once its ingestion job has completed
+      const job = await waitForIngestion(data.job_id)
+      if (job.status === "failed") {
+        throw new Error(job.error || "Failed to process document")
+      }
       setIsDocumentProcessed(true)
+      // A new document starts a new conversation
+      setDocumentId(job.stats?.document_id || null)
+      setSessionId(null)
 
       // Add system message about successful document processing
       setMessages([
@@ -183,7 +255,9 @@ export default function ChatPage() {
       const docState: DocumentState = {
         name: document.name,
         size: document.size,
-        isProcessed: true
+        isProcessed: true,
+        documentId: job.stats?.document_id || null,
+        sessionId: null
       };
       localStorage.setItem('chatDocumentState', JSON.stringify(docState));
       
@@ -192,6 +266,7 @@ export default function ChatPage() {
       setProcessingError(error instanceof Error ? error.message : "Failed to process document")
     } finally {
       setIsProcessingDocument(false)
+      setProcessingProgress(null)
     }
   }
 
@@ -208,6 +283,8 @@ export default function ChatPage() {
       // Reset the chat state
       setDocument(null);
       setIsDocumentProcessed(false);
+      setDocumentId(null);
+      setSessionId(null);
       setMessages([]);
       
       // Clear document state from localStorage
@@ -261,7 +338,7 @@ export default function ChatPage() {
                   {isProcessingDocument ? (
                     <>
                       <Loader2 className="h-4 w-4 mr-2 animate-spin" />
-                      Processing...
+                      {processingProgress ? `Processing (${processingProgress})` : "Processing..."}
                     </>
                   ) : (
                     <>
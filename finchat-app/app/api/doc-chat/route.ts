@@ -3,7 +3,7 @@ import { type NextRequest, NextResponse } from "next/server"
 export async function POST(request: NextRequest) {
   try {
     // Parse the JSON from the request
-    const { prompt } = await request.json()
+    const { prompt, session_id, document_id } = await request.json()
 
     if (!prompt) {
       return NextResponse.json({ error: "No message provided" }, { status: 400 })
@@ -18,12 +18,20 @@ export async function POST(request: NextRequest) {
       headers: {
         "Content-Type": "application/json",
       },
-      body: JSON.stringify({ prompt: prompt }),
+      // The session and document ids of earlier answers keep the conversation on the same history and report
+      body: JSON.stringify({ prompt: prompt, session_id: session_id || null, document_id: document_id || null }),
     })
 
     if (!response.ok) {
       const errorData = await response.json().catch(() => ({}))
-      throw new Error(errorData.detail || `API responded with status: ${response.status}`)
+      // Unknown sessions and documents come back as 404 so the page can start over
+      if (response.status === 404) {
+        return NextResponse.json(
+          { error: errorData.detail?.message || "Not found", code: errorData.detail?.error },
+          { status: 404 },
+        )
+      }
+      throw new Error(errorData.detail?.message || errorData.detail || `API responded with status: ${response.status}`)
     }
 
     const data = await response.json()
@@ -31,6 +39,8 @@ export async function POST(request: NextRequest) {
     // Return the response from the Python API
     return NextResponse.json({
       response: data.response || "I've processed your question about the document.",
+      session_id: data.session_id,
+      document_id: data.document_id,
     })
   } catch (error) {
     console.error("Error in doc-chat API route:", error)
@@ -0,0 +1,28 @@
+import { type NextRequest, NextResponse } from "next/server"
+
+export async function GET(request: NextRequest, { params }: { params: Promise<{ jobId: string }> }) {
+  try {
+    const { jobId } = await params
+
+    // Ask the Python API how far the ingestion job has got
+    const response = await fetch(`http://127.0.0.1:8000/process-document/${encodeURIComponent(jobId)}`, {
+      cache: "no-store",
+    })
+
+    if (!response.ok) {
+      const errorData = await response.json().catch(() => ({}))
+      throw new Error(errorData.detail?.message || errorData.detail || `API responded with status: ${response.status}`)
+    }
+
+    const data = await response.json()
+
+    // Return the job status from the Python API
+    return NextResponse.json(data)
+  } catch (error) {
+    console.error("Error in process-document status API route:", error)
+    return NextResponse.json(
+      { error: error instanceof Error ? error.message : "Failed to get processing status" },
+      { status: 500 },
+    )
+  }
+}